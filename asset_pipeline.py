@@ -0,0 +1,123 @@
+import sys
+import Queue
+import threading
+import profiler
+from maths import IDENTITY
+from mesh_types import INSTANCE_DTYPE
+
+NUM_THREADS = 4
+
+# Instance and new mesh data handed to the group per frame
+UPLOAD_BUDGET_BYTES = 4 * 1024 * 1024
+
+
+def placedObject(makeObject, transform, params):
+    '''
+    Calls makeObject() and returns {primitive: InstanceBlock} of the
+    object's instances, placed by transform and params.
+    '''
+    obj = makeObject()
+    return dict(
+        (primitive, block.transformed(transform, params))
+        for primitive, block in obj.flatten().iteritems()
+    )
+
+
+class AssetPipeline(object):
+    '''
+    Runs the CPU side of loading - reading, parsing and optimising meshes,
+    making objects and flattening them into instance arrays - on a pool
+    of worker threads, while the window carries on drawing. Finished
+    instances are queued, and update (called once a frame on the main
+    thread) adds them to a DisplayGroup up to budgetBytes a frame, so
+    that geometry appears as it is ready without the frame rate dropping.
+    Anything the GL needs is only ever done by the group, on the main
+    thread.
+
+    Different objects are made at the same time; a thread wanting one
+    that another is making waits for it (see registered_type).
+    '''
+
+    def __init__(self, group, numThreads=NUM_THREADS, budgetBytes=UPLOAD_BUDGET_BYTES):
+        self.group = group
+        self.budgetBytes = budgetBytes
+        self.tasks = Queue.Queue()
+        # (result, exc_info or None) of each finished task
+        self.finished = Queue.Queue()
+        # [(primitive, InstanceBlock)] finished but not yet in the group
+        self.pending = []
+        self.numLoading = 0
+
+        self.threads = [threading.Thread(target=self.work, name='AssetPipeline-%s' % i) for i in xrange(numThreads)]
+        for thread in self.threads:
+            # Don't hold up exiting part way through a load
+            thread.daemon = True
+            thread.start()
+
+    def load(self, build, *args, **kwargs):
+        '''
+        Queues build(*args, **kwargs) to run on a worker thread. It must
+        return {primitive: InstanceBlock}, placed where they are to be drawn.
+        '''
+        self.numLoading += 1
+        self.tasks.put((build, args, kwargs))
+
+    def loadObject(self, makeObject, transform=IDENTITY, **params):
+        '''
+        Queues the object made by calling makeObject (e.g. a partial of
+        getInstance), to be added as by its addToGroup.
+        '''
+        self.load(placedObject, makeObject, transform, params)
+
+    @property
+    def busy(self):
+        return bool(self.numLoading or self.pending)
+
+    def work(self):
+        while True:
+            build, args, kwargs = self.tasks.get()
+            try:
+                self.finished.put((build(*args, **kwargs), None))
+            except Exception:
+                self.finished.put(({}, sys.exc_info()))
+
+    def update(self):
+        '''
+        Adds finished instances to the group, up to the per-frame budget.
+        A primitive's first instances are charged for its meshes too.
+        Errors raised by a task are raised again here.
+        '''
+        budget = self.budgetBytes
+        first = True
+        while budget > 0:
+            if not self.pending:
+                try:
+                    result, error = self.finished.get_nowait()
+                except Queue.Empty:
+                    break
+                self.numLoading -= 1
+                if error is not None:
+                    raise error[0], error[1], error[2]
+                self.pending.extend(result.iteritems())
+                continue
+
+            primitive, block = self.pending[0]
+            cost = 0
+            if primitive not in self.group.primitiveNumbers:
+                cost = sum(mesh.vertexData.nbytes + mesh.indexData.nbytes for mesh in primitive.meshes)
+            count = min(len(block), (budget - cost) // INSTANCE_DTYPE.itemsize)
+            if count <= 0:
+                if not first:
+                    break
+                # Always make some progress, however big the meshes
+                count = 1
+            first = False
+            if count < len(block):
+                self.pending[0] = (primitive, block.slice(count, len(block)))
+                block = block.slice(0, count)
+            else:
+                self.pending.pop(0)
+
+            self.group.addInstanceBlock(primitive, block)
+            budget -= cost + count * INSTANCE_DTYPE.itemsize
+            profiler.count('instancesLoaded', count)
@@ -0,0 +1,246 @@
+'''
+Times scene construction and drawing, headless on the null GL backend.
+
+    python benchmark.py                      run every case and print them
+    python benchmark.py --save               ... and store them as the baseline
+    python benchmark.py --compare            ... and fail on regressions
+    python benchmark.py flag:1000 suburbia   run only some cases
+
+Each case runs in its own process, so that its peak memory (ru_maxrss)
+is its own. Scenes are scaled to about the given number of instances,
+and their frames are drawn from far enough away to see all of them.
+'''
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import resource
+import subprocess
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+# Allowed slowdown (or growth in memory) against the baseline
+REGRESSION_THRESHOLD = 0.25
+# Times shorter than this in the baseline are too noisy to compare
+MIN_COMPARED_SECONDS = 0.002
+# Measures that are counts, not costs, so aren't compared
+COUNTS = ('instances', 'drawn')
+
+SIZES = (1000, 10000, 100000, 1000000)
+SCENES = ('flag', 'bricks', 'suburbia')
+# Cases that aren't scaled scenes
+SINGLE_CASES = ('data', 'wavefront')
+
+NUM_FRAMES = 20
+WAVEFRONT_FILE = 'meshes/plisson.obj'
+
+
+def allCases():
+    return ['%s:%s' % (scene, size) for scene in SCENES for size in SIZES] + list(SINGLE_CASES)
+
+
+def makeScene(scene, numInstances):
+    '''
+    Returns an object with about numInstances instances.
+    '''
+    import numpy
+    import compound
+    import data # Registers the types used below
+    from registered_type import getInstance
+
+    if scene == 'flag':
+        # The flag is height by 2*height cubes
+        return getInstance('BritishFlag', height=max(1, int(round(math.sqrt(numInstances / 2.0)))), spacing=1.1)
+
+    if scene == 'bricks':
+        # Whole collections of 27000 bricks, or single walls of 900
+        if numInstances >= 27000:
+            unit, size, spacing = getInstance('BrickWallCollection'), 27000, 40.0
+        else:
+            unit, size, spacing = getInstance('BrickWall'), 900, 40.0
+    elif scene == 'suburbia':
+        unit, size, spacing = getInstance('Suburbia'), 100, 200.0
+    else:
+        raise ValueError(scene)
+
+    count = max(1, int(round(float(numInstances) / size)))
+    side = int(math.ceil(math.sqrt(count)))
+    x, z = [a.reshape((-1,))[:count] for a in numpy.mgrid[0:side, 0:side]]
+    obj = compound.Compound()
+    obj.addMany(unit, numpy.column_stack((spacing*x, numpy.zeros(count), spacing*z)))
+    return obj
+
+
+def timed(results, name, fn, *args, **kwargs):
+    start = time.time()
+    value = fn(*args, **kwargs)
+    results[name] = time.time() - start
+    return value
+
+
+def viewOfWholeScene(group):
+    '''
+    Returns (eye position, view matrix, projection matrix) for looking down
+    -z at the middle of a DisplayGroup's instances from far enough away to
+    see all of them, with the viewer's field of view.
+    '''
+    import numpy
+    import maths
+    import common
+
+    mins, maxs = group.bvh.itemMins[:group.numIds], group.bvh.itemMaxs[:group.numIds]
+    sceneMin, sceneMax = mins.min(axis=0), maxs.max(axis=0)
+    center = 0.5 * (sceneMin + sceneMax)
+    radius = max(0.5 * numpy.linalg.norm(sceneMax - sceneMin), common.NEAR_CLIP)
+
+    fovy = common.VERTICAL_FOV_DEGREES * math.pi / 180.0
+    # The bounding sphere just fits the height of the view, and the width
+    # is wider
+    distance = radius / math.sin(0.5 * fovy)
+    eye = (center + numpy.array([0.0, 0.0, distance])).astype(numpy.float32)
+    viewMatrix = maths.lookAt(eye, maths.Vec3(0.0, 0.0, -1.0), maths.Vec3(0.0, 1.0, 0.0))
+    projMatrix = maths.perspective(
+        fovy, float(common.WINDOW_WIDTH) / common.WINDOW_HEIGHT,
+        max(distance - radius, common.NEAR_CLIP), distance + radius
+    )
+    return eye, viewMatrix, projMatrix
+
+
+def runScene(scene, numInstances):
+    import maths
+    import display_group
+
+    results = {}
+    obj = timed(results, 'build', makeScene, scene, numInstances)
+
+    group = display_group.DisplayGroup()
+    timed(
+        results, 'flatten', obj.addToGroup, group, maths.IDENTITY,
+        ambient=maths.Vec3(0.0, 0.0, 0.0),
+        diffuse=maths.Vec3(1.5, 0.5, 0.5),
+        specular=maths.Vec4(0.0, 1.0, 1.0, 32.0),
+    )
+    timed(results, 'buffers', group.setModelMatrixBuffers)
+
+    group.updateUniforms(*viewOfWholeScene(group))
+    timed(results, 'firstFrame', group.draw)
+    start = time.time()
+    for _ in xrange(NUM_FRAMES):
+        group.draw()
+    results['frame'] = (time.time() - start) / NUM_FRAMES
+
+    results['instances'] = int(group.numAlive)
+    results['drawn'] = int(group.numDrawn)
+    return results
+
+
+def runCase(case):
+    '''
+    Runs one case in this process, returning {measure: value}.
+    '''
+    import gl_backend
+    gl_backend.use(gl_backend.NullBackend())
+    import mesh_cache
+    # Always measure the full load, not a cache hit
+    mesh_cache.ENABLED = False
+
+    if case == 'data':
+        import maths
+        import loader
+        from functools import partial
+        results = {}
+        # Made and flattened as the viewer loads it
+        blocks = timed(
+            results, 'load', loader.flattenInParallel,
+            [(partial(loader.loadObjectFromModule, 'data'), maths.IDENTITY, {})]
+        )
+        results['instances'] = sum(len(block) for block in blocks.itervalues())
+    elif case == 'wavefront':
+        from wavefront import parseWavefront
+        results = {}
+        timed(results, 'parse', parseWavefront, WAVEFRONT_FILE)
+    else:
+        scene, _, size = case.partition(':')
+        results = runScene(scene, int(size))
+
+    # Kilobytes on Linux
+    results['peakMemoryKB'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return results
+
+
+def runCaseInSubprocess(case):
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), '--child', case],
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    # Loaders may print; the results are on the last line
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def compare(results, baseline, threshold):
+    '''
+    Returns a line for each measure that is more than threshold worse than
+    in the baseline. Counts and very short times aren't compared.
+    '''
+    regressions = []
+    for case, measures in sorted(results.iteritems()):
+        for name, value in sorted(measures.iteritems()):
+            base = baseline.get(case, {}).get(name)
+            if name in COUNTS or not base:
+                continue
+            if name != 'peakMemoryKB' and base < MIN_COMPARED_SECONDS:
+                continue
+            if value > base * (1.0 + threshold):
+                regressions.append('%s %s: %.4g -> %.4g (+%.0f%%)' % (
+                    case, name, base, value, 100.0 * (value / base - 1.0)
+                ))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scene construction and frame benchmarks')
+    parser.add_argument('cases', nargs='*', help='cases to run (default all): %s' % ' '.join(allCases()))
+    parser.add_argument('--save', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--compare', action='store_true', help='exit non-zero on regressions against the baseline')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print json.dumps(runCase(args.child))
+        return 0
+
+    results = {}
+    for case in args.cases or allCases():
+        results[case] = measures = runCaseInSubprocess(case)
+        print '%-16s %s' % (case, '  '.join(
+            '%s=%.4g' % (name, value) for name, value in sorted(measures.iteritems())
+        ))
+
+    status = 0
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print 'REGRESSION %s' % line
+        status = 1 if regressions else 0
+
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
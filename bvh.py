@@ -0,0 +1,266 @@
+import numpy
+
+LEAF_SIZE = 64
+
+# Items appended since the last build are tested one by one, and moved
+# items loosen the tree, until there are enough of them that the tree
+# should be rebuilt
+MIN_REBUILD_ITEMS = 1024
+REBUILD_FRACTION = 0.125
+
+
+def expandRanges(starts, ends):
+    '''
+    Returns the concatenation of arange(start, end) for each pair.
+    '''
+    lengths = ends - starts
+    total = lengths.sum()
+    if not total:
+        return numpy.zeros((0,), dtype=numpy.intp)
+    # Offset a single arange so that each range starts where it should
+    shifts = numpy.repeat(starts - (numpy.cumsum(lengths) - lengths), lengths)
+    return numpy.arange(total, dtype=numpy.intp) + shifts
+
+
+def grown(array, count):
+    '''
+    Returns array if it has room for count items along its first axis,
+    otherwise a zero-padded copy at least twice as long.
+    '''
+    if count <= len(array):
+        return array
+    result = numpy.zeros((max(count, 2*len(array)),) + array.shape[1:], dtype=array.dtype)
+    result[:len(array)] = array
+    return result
+
+
+def classifyFrustum(planes):
+    '''
+    Returns a classify function (see InstanceBVH.query) for the boxes
+    that touch a frustum, given as from culling.frustumPlanes.
+    '''
+    def classify(mins, maxs):
+        centers, extents = 0.5 * (mins + maxs), 0.5 * (maxs - mins)
+        outside = numpy.zeros((len(mins),), dtype=bool)
+        inside = numpy.ones((len(mins),), dtype=bool)
+        for a, b, c, d in planes:
+            distance = centers[:, 0]*a + centers[:, 1]*b + centers[:, 2]*c + d
+            radius = extents[:, 0]*abs(a) + extents[:, 1]*abs(b) + extents[:, 2]*abs(c)
+            outside |= distance < -radius
+            inside &= distance >= radius
+        return outside, inside
+    return classify
+
+
+def classifyBox(boxMin, boxMax):
+    '''
+    Returns a classify function for the boxes that overlap another box.
+    '''
+    def classify(mins, maxs):
+        outside = ((maxs < boxMin) | (mins > boxMax)).any(axis=1)
+        inside = ((mins >= boxMin) & (maxs <= boxMax)).all(axis=1)
+        return outside, inside
+    return classify
+
+
+def classifySphere(center, radius):
+    '''
+    Returns a classify function for the boxes that overlap a sphere.
+    '''
+    def classify(mins, maxs):
+        nearest = numpy.clip(center, mins, maxs)
+        outside = ((nearest - center)**2).sum(axis=1) > radius*radius
+        # Inside if the farthest corner is in the sphere
+        farthest = numpy.maximum(numpy.abs(mins - center), numpy.abs(maxs - center))
+        inside = (farthest**2).sum(axis=1) <= radius*radius
+        return outside, inside
+    return classify
+
+
+def spreadBits(values):
+    '''
+    Spreads the low 10 bits of each value so there are two zero bits
+    between each of them.
+    '''
+    x = values.astype(numpy.uint32) & 0x3ff
+    x = (x | (x << 16)) & 0x030000ff
+    x = (x | (x << 8)) & 0x0300f00f
+    x = (x | (x << 4)) & 0x030c30c3
+    x = (x | (x << 2)) & 0x09249249
+    return x
+
+
+def mortonCodes(points):
+    '''
+    30-bit Morton (Z-order) codes of an (N,3) array of points, quantised
+    to a 1024^3 grid over their bounding box, so that sorting by code
+    puts nearby points near each other.
+    '''
+    low, high = points.min(axis=0), points.max(axis=0)
+    scale = 1023.0 / numpy.maximum(high - low, 1e-12)
+    cells = ((points - low) * scale).astype(numpy.uint32)
+    return (spreadBits(cells[:, 0]) << 2) | (spreadBits(cells[:, 1]) << 1) | spreadBits(cells[:, 2])
+
+
+class InstanceBVH(object):
+    '''
+    A bounding volume hierarchy over a set of axis-aligned boxes. The
+    boxes are sorted along a Morton curve and cut into leaves of leafSize,
+    and a complete binary tree is built over the leaves (node i's children
+    are 2i+1 and 2i+2), so the whole build is a sort plus a few vectorized
+    passes. Each node covers a contiguous range of self.order, so whole
+    subtrees can be accepted or rejected without visiting their items.
+    '''
+
+    def __init__(self, centers, extents, leafSize=LEAF_SIZE):
+        count = len(centers)
+        self.itemMins = (centers - extents).astype(numpy.float32)
+        self.itemMaxs = (centers + extents).astype(numpy.float32)
+        self.order = (
+            numpy.argsort(mortonCodes(centers), kind='mergesort') if count
+            else numpy.zeros((0,), dtype=numpy.intp)
+        )
+
+        self.leafSize = leafSize
+        # Items in itemMins and itemMaxs, which have room for more
+        self.numItems = count
+        self.numIndexed = count
+        # Items moved since the build, which may have loosened the tree
+        self.numLoosened = 0
+        # Where each item is in self.order, to find its leaf
+        self.positions = numpy.empty((count,), dtype=numpy.intp)
+        self.positions[self.order] = numpy.arange(count)
+
+        # Pad the leaves out to a power of two; the extra ones are empty
+        numLeaves = 1
+        while numLeaves * leafSize < count:
+            numLeaves *= 2
+        numNodes = 2*numLeaves - 1
+        self.firstLeaf = firstLeaf = numLeaves - 1
+
+        self.nodeStarts = numpy.empty((numNodes,), dtype=numpy.intp)
+        self.nodeEnds = numpy.empty((numNodes,), dtype=numpy.intp)
+        self.nodeMins = numpy.zeros((numNodes, 3), dtype=numpy.float32)
+        self.nodeMaxs = numpy.zeros((numNodes, 3), dtype=numpy.float32)
+        self.firstChild = numpy.full((numNodes,), -1, dtype=numpy.intp)
+        self.firstChild[:firstLeaf] = 2*numpy.arange(firstLeaf) + 1
+
+        leafStarts = numpy.minimum(leafSize * numpy.arange(numLeaves), count)
+        self.nodeStarts[firstLeaf:] = leafStarts
+        self.nodeEnds[firstLeaf:] = numpy.minimum(leafStarts + leafSize, count)
+
+        filled = leafStarts < count
+        if filled.any():
+            sortedMins, sortedMaxs = self.itemMins[self.order], self.itemMaxs[self.order]
+            filledNodes = firstLeaf + numpy.flatnonzero(filled)
+            self.nodeMins[filledNodes] = numpy.minimum.reduceat(sortedMins, leafStarts[filled])
+            self.nodeMaxs[filledNodes] = numpy.maximum.reduceat(sortedMaxs, leafStarts[filled])
+
+        # Fill in the parents a level at a time, from the leaves up
+        levelStart = firstLeaf
+        while levelStart:
+            parents = numpy.arange((levelStart - 1) // 2, levelStart)
+            left, right = 2*parents + 1, 2*parents + 2
+            self.nodeStarts[parents] = self.nodeStarts[left]
+            self.nodeEnds[parents] = self.nodeEnds[right]
+            # Empty right children must not stretch their parent's box
+            rightEmpty = self.nodeStarts[right] == self.nodeEnds[right]
+            self.nodeMins[parents] = numpy.where(rightEmpty[:, None], self.nodeMins[left], numpy.minimum(self.nodeMins[left], self.nodeMins[right]))
+            self.nodeMaxs[parents] = numpy.where(rightEmpty[:, None], self.nodeMaxs[left], numpy.maximum(self.nodeMaxs[left], self.nodeMaxs[right]))
+            levelStart = parents[0]
+
+    def __len__(self):
+        return self.numItems
+
+    @classmethod
+    def rebuilt(cls, tree):
+        '''
+        Returns a new tree over the current boxes of every item in tree.
+        '''
+        mins, maxs = tree.itemMins[:len(tree)], tree.itemMaxs[:len(tree)]
+        return cls(0.5 * (mins + maxs), 0.5 * (maxs - mins), tree.leafSize)
+
+    def needsRebuild(self):
+        changed = len(self) - self.numIndexed + self.numLoosened
+        return changed > max(MIN_REBUILD_ITEMS, REBUILD_FRACTION * self.numIndexed)
+
+    def append(self, mins, maxs):
+        '''
+        Adds items, numbered on from the existing ones, that are checked
+        by brute force until the tree is rebuilt. The item arrays double in
+        size as needed, so adding a few at a time is cheap.
+        '''
+        mins = numpy.asarray(mins, dtype=numpy.float32).reshape((-1, 3))
+        start, end = self.numItems, self.numItems + len(mins)
+        self.itemMins = grown(self.itemMins, end)
+        self.itemMaxs = grown(self.itemMaxs, end)
+        self.itemMins[start:end] = mins
+        self.itemMaxs[start:end] = numpy.asarray(maxs, dtype=numpy.float32).reshape((-1, 3))
+        self.numItems = end
+
+    def setBounds(self, item, boxMin, boxMax):
+        '''
+        Moves one item's box. The nodes above it are only ever grown to
+        fit, so they may end up looser than needed until the next rebuild.
+        '''
+        self.itemMins[item] = boxMin
+        self.itemMaxs[item] = boxMax
+        if item >= self.numIndexed:
+            return
+
+        # The leaf and all its ancestors, counting from 1 so that each
+        # node's parent is half its number
+        leaf = self.firstLeaf + self.positions[item] // self.leafSize + 1
+        nodes = (leaf >> numpy.arange(leaf.bit_length())) - 1
+        self.nodeMins[nodes] = numpy.minimum(self.nodeMins[nodes], boxMin)
+        self.nodeMaxs[nodes] = numpy.maximum(self.nodeMaxs[nodes], boxMax)
+        self.numLoosened += 1
+
+    def query(self, classify, ordered=True):
+        '''
+        Returns the indices of the items whose boxes pass a classify
+        function, sorted unless ordered is False. classify(mins, maxs) takes (N,3) arrays of box corners and
+        returns two (N,) bool arrays: which boxes are entirely outside the
+        region, and which are entirely inside it. The tree is walked a level
+        at a time, with each level tested in one vectorized call.
+        '''
+        acceptedStarts, acceptedEnds, partialItems = [], [], []
+
+        nodes = numpy.zeros((1,), dtype=numpy.intp)
+        while len(nodes):
+            nodes = nodes[self.nodeStarts[nodes] < self.nodeEnds[nodes]]
+            outside, inside = classify(self.nodeMins[nodes], self.nodeMaxs[nodes])
+            acceptedStarts.append(self.nodeStarts[nodes[inside]])
+            acceptedEnds.append(self.nodeEnds[nodes[inside]])
+
+            partial = nodes[~outside & ~inside]
+            isLeaf = self.firstChild[partial] < 0
+            leaves = partial[isLeaf]
+            if len(leaves):
+                items = self.order[expandRanges(self.nodeStarts[leaves], self.nodeEnds[leaves])]
+                itemOutside, _ = classify(self.itemMins[items], self.itemMaxs[items])
+                partialItems.append(items[~itemOutside])
+
+            children = self.firstChild[partial[~isLeaf]]
+            nodes = numpy.concatenate((children, children + 1))
+
+        if len(self) > self.numIndexed:
+            items = numpy.arange(self.numIndexed, len(self))
+            itemOutside, _ = classify(self.itemMins[items], self.itemMaxs[items])
+            partialItems.append(items[~itemOutside])
+
+        accepted = self.order[expandRanges(
+            numpy.concatenate(acceptedStarts) if acceptedStarts else numpy.zeros((0,), dtype=numpy.intp),
+            numpy.concatenate(acceptedEnds) if acceptedEnds else numpy.zeros((0,), dtype=numpy.intp)
+        )]
+        items = numpy.concatenate([accepted] + partialItems)
+        return numpy.sort(items) if ordered else items
+
+    def inFrustum(self, planes, ordered=True):
+        return self.query(classifyFrustum(planes), ordered)
+
+    def inBox(self, boxMin, boxMax):
+        return self.query(classifyBox(numpy.asarray(boxMin), numpy.asarray(boxMax)))
+
+    def inSphere(self, center, radius):
+        return self.query(classifySphere(numpy.asarray(center), radius))
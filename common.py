@@ -1,9 +1,10 @@
 import sys
 import time
 import maths
+import profiler
 import pygame
-import OpenGL.GL.shaders as shaders
-from OpenGL import GL
+import gl_backend
+from gl_backend import GL
 
 PI = 3.141592653589
 
@@ -63,10 +64,13 @@ class Timer(object):
     def __init__(self, name=None):
         self.name = name
     def __enter__(self):
+        self.scope = profiler.scope(self.name if self.name else 'Timer')
+        self.scope.__enter__()
         self.start = time.time()
         return self
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.end = time.time()
+        self.scope.__exit__(exc_type, exc_val, exc_tb)
         print '%s took %.5fs' % (self.name if self.name else 'Timer', self.end - self.start)
 
 
@@ -77,13 +81,13 @@ class ShaderCompileError(Exception):
 
 def compileShaderStage(source, shaderType):
     try:
-        return shaders.compileShader(source, shaderType)
+        return gl_backend.compileShader(source, shaderType)
     except RuntimeError as e:
         raise ShaderCompileError(e.args[0], ''.join(e.args[1]), e.args[2])
 
 def compileShaderProgram(*stages, **named):
     try:
-        return shaders.compileProgram(*stages, **named)
+        return gl_backend.compileProgram(*stages, **named)
     except RuntimeError as e:
         print 'Error while linking shader'
         print e
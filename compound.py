@@ -1,39 +1,187 @@
+import numpy
+import weakref
 from maths import IDENTITY
-from itertools import chain
 from functools import partial
+from collections import OrderedDict, defaultdict
+from instances import InstanceBlock, paramArrays, asTransformStack, broadcastParam
 from registered_type import makeRegisteredType
 
+class ChildGroup(object):
+    '''
+    Every child of a compound that uses one child object, stored as an
+    InstanceBlock of their transforms and params. Children added one at a
+    time are collected and converted to arrays in bulk when next needed.
+    '''
+
+    def __init__(self, obj):
+        self.obj = obj
+        self.blocks = []
+        self.pending = [] # [(transform, params)]
+
+    def __len__(self):
+        return sum(len(block) for block in self.blocks) + len(self.pending)
+
+    def addOne(self, transform, params):
+        self.pending.append((transform, params))
+
+    def addBlock(self, block):
+        self.flushPending()
+        self.blocks.append(block)
+
+    def flushPending(self):
+        if self.pending:
+            matrices = numpy.array(
+                [numpy.asarray(t.getMatrix() if t else IDENTITY) for t, _ in self.pending],
+                dtype=numpy.float32
+            )
+            self.blocks.append(InstanceBlock(matrices, paramArrays([p for _, p in self.pending])))
+            self.pending = []
+
+    def block(self):
+        self.flushPending()
+        if len(self.blocks) > 1:
+            self.blocks = [InstanceBlock.concatenate(self.blocks)]
+        return self.blocks[0]
+
+
+def describeTransform(matrix):
+    if numpy.array_equal(matrix[:3, :3], numpy.identity(3)):
+        if not matrix[:3, 3].any():
+            return None
+        return 'Translate(%g, %g, %g)' % tuple(matrix[:3, 3])
+    return 'Matrix(%s)' % ', '.join('[%s]' % ', '.join('%g' % v for v in row) for row in matrix[:3])
+
+
 class Compound(object):
 
     INSTANCES = {}
 
     def __init__(self):
-        self.children = []
+        self.groups = OrderedDict() # {child object: ChildGroup}
         self.name = self.__class__.__name__
+        self.parents = weakref.WeakSet()
+        self.flattened = None
+
+    def childGroup(self, obj):
+        group = self.groups.get(obj)
+        if group is None:
+            self.groups[obj] = group = ChildGroup(obj)
+            if isinstance(obj, Compound):
+                obj.parents.add(self)
+        return group
 
     def add(self, obj, transform=None, **params):
-        self.children.append((obj, transform, params))
+        self.childGroup(obj).addOne(transform, params)
+        self.invalidate()
 
-    def addToGroup(self, group, transform=IDENTITY, **params):
-        for childObject, childTransform, childParams in self.children:
-            childObject.addToGroup(
-                group,
-                transform*childTransform.getMatrix() if childTransform else transform,
-                **dict(chain(params.iteritems(), childParams.iteritems()))
+    def addMany(self, obj, transforms, **params):
+        '''
+        Adds len(transforms) copies of obj in one go. transforms is a batch
+        transform such as maths.TranslateBatch, an (N,4,4) stack of matrices
+        or an (N,3) array of translations, and each
+        param is either one value for every copy or an (N,k) array with a
+        row per copy.
+        '''
+        matrices = asTransformStack(transforms)
+        self.childGroup(obj).addBlock(InstanceBlock(
+            matrices,
+            dict((name, broadcastParam(values, len(matrices))) for name, values in params.iteritems())
+        ))
+        self.invalidate()
+
+    def invalidate(self):
+        '''
+        Drops everything cached about this compound's contents, here and
+        in every compound that (indirectly) contains it.
+        '''
+        self.flattened = None
+        self.__dict__.pop('_primCount', None)
+        self.__dict__.pop('_numTriangles', None)
+        for parent in list(self.parents):
+            parent.invalidate()
+
+    @property
+    def numChildren(self):
+        return sum(len(group) for group in self.groups.itervalues())
+
+    @property
+    def children(self):
+        '''
+        Yields (childObject, matrix, params) for every child, one at a time.
+        This is slow, and only meant for inspecting small compounds.
+        '''
+        for group in self.groups.itervalues():
+            block = group.block()
+            for i in xrange(len(block)):
+                params = dict(
+                    (name, values[i])
+                    for name, (values, mask) in block.params.iteritems()
+                    if mask[i]
+                )
+                yield group.obj, block.matrices[i], params
+
+    def flatten(self):
+        '''
+        Returns {primitive: InstanceBlock} with every primitive instance in
+        this compound, in its local space. The result is kept until a child
+        is added here or further down, so a compound shared by many parents
+        is only expanded once, and each parent places all the copies of it
+        with one batched multiply. The blocks are shared, so don't modify
+        them.
+        '''
+        if self.flattened is None:
+            perPrimitive = defaultdict(list)
+            for group in self.groups.itervalues():
+                groupBlock = group.block()
+                for primitive, childBlock in group.obj.flatten().iteritems():
+                    perPrimitive[primitive].append(childBlock.repeated(groupBlock.matrices, groupBlock.params))
+            self.flattened = dict(
+                (primitive, InstanceBlock.concatenate(childBlocks))
+                for primitive, childBlocks in perPrimitive.iteritems()
+            )
+        return self.flattened
+
+    def flattenPart(self, part, numParts):
+        '''
+        Like flatten, but only for the part'th of numParts equal runs of
+        each child group's instances, so that the parts can be flattened
+        separately (e.g. in different processes). Not kept.
+        '''
+        perPrimitive = defaultdict(list)
+        for group in self.groups.itervalues():
+            groupBlock = group.block()
+            start = len(groupBlock) * part // numParts
+            end = len(groupBlock) * (part + 1) // numParts
+            if start == end:
+                continue
+            params = dict(
+                (name, (values[start:end], mask[start:end]))
+                for name, (values, mask) in groupBlock.params.iteritems()
             )
+            for primitive, childBlock in group.obj.flatten().iteritems():
+                perPrimitive[primitive].append(childBlock.repeated(groupBlock.matrices[start:end], params))
+        return dict(
+            (primitive, InstanceBlock.concatenate(childBlocks))
+            for primitive, childBlocks in perPrimitive.iteritems()
+        )
+
+    def addToGroup(self, group, transform=IDENTITY, **params):
+        for primitive, block in self.flatten().iteritems():
+            group.addInstances(primitive, block.transformed(transform, params))
 
     def shallowString(self):
         return '%s with %s children (%s prims, %s triangles total)' % (
             self.name,
-            len(self.children),
+            self.numChildren,
             self.primCount,
             self.numTriangles
         )
 
     def deepLines(self):
         lines = ['%s(' % self.shallowString()]
-        for i, (childObject, childTransform, childParams) in enumerate(self.children):
+        for i, (childObject, childMatrix, childParams) in enumerate(self.children):
             childLines = childObject.deepLines()
+            childTransform = describeTransform(childMatrix)
             lines.append('\tchild %s%s%s: %s' % (
                 i,
                 (' (%s)' % childTransform if childTransform else ''),
@@ -50,13 +198,13 @@ class Compound(object):
     @property
     def primCount(self):
         if not hasattr(self, '_primCount'):
-            self._primCount = sum(child[0].primCount for child in self.children)
+            self._primCount = sum(len(group) * group.obj.primCount for group in self.groups.itervalues())
         return self._primCount
 
     @property
     def numTriangles(self):
         if not hasattr(self, '_numTriangles'):
-            self._numTriangles = sum(child[0].numTriangles for child in self.children)
+            self._numTriangles = sum(len(group) * group.obj.numTriangles for group in self.groups.itervalues())
         return self._numTriangles
 
 
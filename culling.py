@@ -0,0 +1,48 @@
+import numpy
+
+
+def frustumPlanes(viewProjMatrix):
+    '''
+    Returns the six clip planes (left, right, bottom, top, near, far) of a
+    view-projection matrix as a (6,4) array of (a, b, c, d) rows with unit
+    normals pointing into the frustum, so a point p is inside a plane when
+    a*p.x + b*p.y + c*p.z + d >= 0.
+    '''
+    M = numpy.asarray(viewProjMatrix, dtype=numpy.float64)
+    planes = numpy.array([
+        M[3] + M[0],
+        M[3] - M[0],
+        M[3] + M[1],
+        M[3] - M[1],
+        M[3] + M[2],
+        M[3] - M[2],
+    ])
+    return planes / numpy.linalg.norm(planes[:, :3], axis=1)[:, None]
+
+
+def worldBounds(matrices, localMin, localMax):
+    '''
+    Transforms a local axis-aligned box by each of an (N,4,4) stack of
+    model matrices, and returns the (centers, extents) of the world
+    axis-aligned boxes around the results, each an (N,3) array.
+    '''
+    localCenter = 0.5 * (localMin + localMax)
+    localExtent = 0.5 * (localMax - localMin)
+    rotations = matrices[:, :3, :3]
+    centers = numpy.dot(rotations, localCenter) + matrices[:, :3, 3]
+    extents = numpy.dot(numpy.abs(rotations), localExtent)
+    return centers, extents
+
+
+def boxesInFrustum(planes, centers, extents):
+    '''
+    Returns an (N,) bool array that is False for the boxes that are
+    entirely outside one of the planes. Boxes near the frustum's corners
+    may be kept even though they are outside, which is safe.
+    '''
+    visible = numpy.ones((len(centers),), dtype=bool)
+    for a, b, c, d in planes:
+        distance = centers[:, 0]*a + centers[:, 1]*b + centers[:, 2]*c + d
+        radius = extents[:, 0]*abs(a) + extents[:, 1]*abs(b) + extents[:, 2]*abs(c)
+        visible &= distance >= -radius
+    return visible
@@ -1,46 +1,25 @@
 import math
 import numpy
 import os
+import mesh_cache
+import mesh_builders
 from primitives import makePrimitive
 from compound import makeCompound
 from maths import Vec3
 from registered_type import getInstance
-from mesh_types import VertexMesh, VertexNormalMesh
-from maths import Translate, RotateX
-from random import random as r
+from mesh_types import VertexNormalMesh, flatMeshType
+from maths import RotateX
+from wavefront import parseWavefront
 
 @makePrimitive
 def Cube(self, **kwargs):
-    self.underlying = VertexMesh(
-        'Cube',
-        [
-            Vec3(0.0, 0.0, 0.0), # Left bottom back (0)
-            Vec3(0.0, 0.0, 1.0), # Left bottom front (1)
-            Vec3(0.0, 1.0, 0.0), # Left top back (2)
-            Vec3(0.0, 1.0, 1.0), # Left top front (3)
-            Vec3(1.0, 0.0, 0.0), # Right bottom back (4)
-            Vec3(1.0, 0.0, 1.0), # Right bottom front (5)
-            Vec3(1.0, 1.0, 0.0), # Right top back (6)
-            Vec3(1.0, 1.0, 1.0), # Right top front (7)
-        ],
-        [
-            1, 5, 7, 7, 3, 1, # Front
-            3, 7, 6, 6, 2, 3, # Top
-            0, 1, 3, 3, 2, 0, # Left
-            5, 4, 6, 6, 7, 5, # Right
-            4, 0, 2, 2, 6, 4, # Back
-            0, 4, 5, 5, 1, 0, # Bottom
-        ]
-    )
+    self.underlying = flatMeshType(kwargs.get('policy'))('Cube', *mesh_builders.box())
 
 @makePrimitive
 def Quad(self, **kwargs):
-    self.underlying = VertexNormalMesh(
-        'Quad',
-        [Vec3(0.0, 0.0, 0.0), Vec3(1.0, 0.0, 0.0), Vec3(1.0, 1.0, 0.0), Vec3(0.0, 1.0, 0.0)],
-        [Vec3(0.0, 0.0, 1.0), Vec3(0.0, 0.0, 1.0), Vec3(0.0, 0.0, 1.0), Vec3(0.0, 0.0, 1.0)],
-        [0, 1, 2, 2, 3, 0]
-    )
+    vertices, indices = mesh_builders.grid(1.0, 1.0, 2, 2)
+    normals = numpy.tile(Vec3(0.0, 0.0, 1.0), (len(vertices), 1))
+    self.underlying = VertexNormalMesh('Quad', vertices, normals, indices)
 
 @makePrimitive
 def Brick(self, **kwargs):
@@ -50,71 +29,38 @@ def Brick(self, **kwargs):
     y_rows = kwargs['y_rows']
     max_bump = kwargs['max_bump']
 
-    # Make front face
-    all_x = numpy.concatenate([numpy.linspace(0.0, x_size, x_rows, dtype=numpy.float32)] * y_rows)
-    all_x += numpy.clip(numpy.random.normal(scale=0.7*max_bump, size=x_rows*y_rows), -max_bump, max_bump)
-
-    all_y = numpy.concatenate(numpy.meshgrid(range(x_rows), numpy.linspace(0.0, y_size, y_rows, dtype=numpy.float32))[1])
-    all_y += numpy.clip(numpy.random.normal(scale=0.7*max_bump, size=x_rows*y_rows), -max_bump, max_bump)
-
-    all_z = numpy.zeros((x_rows*y_rows,), dtype=numpy.float32)
-    all_z += numpy.clip(numpy.random.normal(scale=0.7*max_bump, size=x_rows*y_rows), -max_bump, max_bump)
-
-    # Interleave
-    vertices = numpy.vstack((all_x, all_y, all_z)).reshape((-1,), order='F')
+    # Make a bumpy front face
+    vertices, indices = mesh_builders.grid(x_size, y_size, x_rows, y_rows)
+    mesh_builders.jitter(vertices, max_bump)
 
-    # Make indexes
-    indices = []
-    for y_row in range(y_rows - 1):
-        row_start_index = x_rows * y_row
-        for x_row in range(x_rows - 1):
-            this_index = row_start_index + x_row
-            indices.extend([this_index, this_index + 1, this_index + x_rows, this_index + x_rows, this_index + 1, this_index + x_rows + 1])
-
-    self.underlying = VertexMesh('Brick', vertices, indices)
+    self.underlying = flatMeshType(kwargs.get('policy'))('Brick', vertices, indices)
 
 
 @makePrimitive
-def WavefrontPrimitive(**kwargs):
+def WavefrontPrimitive(self, **kwargs):
     filename = kwargs['filename']
     usingNormals = kwargs.get('normals', False)
-
-    # Add dummy elements because indices in file start with 1
-    vertices, indices = [Vec3(0.0, 0.0, 0.0)], []
-
-    if usingNormals:
-        normals, comboMap = [Vec3(0.0, 0.0, 0.0)], {} # Unique (vertex, normal): index map
-
-    with open(filename, 'r') as f:
-        for line in f:
-            lineSplit = line.split(' ')
-            lineType = lineSplit[0]
-            if lineType == 'vn' and usingNormals:
-                normals.append(Vec3(*lineSplit[1:]))
-            elif lineType == 'v':
-                vertices.append(Vec3(*lineSplit[1:]))
-            elif lineType == 'f':
-                assert len(lineSplit) == 4
-                face = [part.split('/') for part in lineSplit[1:]]
-                if usingNormals:
-                    for f in face:
-                        indices.append(comboMap.setdefault((int(f[0]), int(f[2])), len(comboMap)))
-                else:
-                    indices.extend(f[0] for f in face)
+    optimize = kwargs.get('optimize', True)
 
     name = os.path.split(filename)[-1]
+    meshType = VertexNormalMesh if usingNormals else flatMeshType(kwargs.get('policy'))
 
-    if usingNormals:
-        newVertices = [Vec3(0.0, 0.0, 0.0)] * len(comboMap)
-        newNormals = [Vec3(0.0, 0.0, 0.0)] * len(comboMap)
+    cacheKey = mesh_cache.cacheKey(filename, normals=usingNormals, optimize=optimize, meshType=meshType.__name__)
+    cached = mesh_cache.load(cacheKey)
+    if cached is not None:
+        self.underlying = meshType.fromBuffers(name, *cached)
+    else:
+        vertices, normals, indices = parseWavefront(filename, usingNormals)
 
-        for (vertexIndex, normalIndex), newIndex in comboMap.iteritems():
-            newVertices[newIndex] = vertices[vertexIndex]
-            newNormals[newIndex] = normals[normalIndex]
+        if usingNormals:
+            self.underlying = VertexNormalMesh(name, vertices, normals, indices, optimize=optimize)
+        else:
+            self.underlying = meshType(name, vertices, indices, optimize=optimize)
 
-        return VertexNormalMesh(name, newVertices, newNormals, indices)
-    else:
-        return VertexMesh(name, vertices, indices)
+        mesh_cache.store(cacheKey, self.underlying.vertexData, self.underlying.indexData)
+
+    if kwargs.get('lods', False):
+        self.setLevelsOfDetail(cacheKey=cacheKey)
 
 
 @makeCompound
@@ -130,73 +76,85 @@ def BritishFlag(self, **kwargs):
 
     redDiagIntDist, redDiagDist = (height/30.0) / math.cos(math.atan(0.5)), height/30.0
 
+    # Everything below works on whole arrays of cells at once
     def lineDist(x, y, grad, intercept):
         return abs(-grad*x + y - intercept) / math.sqrt(grad*grad + 1.0)
 
-    inRange = lambda x, lower, upper: x >= lower and x <= upper
+    inRange = lambda x, lower, upper: (x >= lower) & (x <= upper)
 
     def middleRed(x, y):
-        return inRange(x*60, 27*width, 32*width) or inRange(y*30, 12*height, 17*height)
+        return inRange(x*60, 27*width, 32*width) | inRange(y*30, 12*height, 17*height)
 
     def middleWhite(x, y):
-        return (
-            (x*60 >= 25*width and x*60 <= 34*width) or
-            (y*30 >= 10*height and y*30 <= 19*height)
-        )
+        return inRange(x*60, 25*width, 34*width) | inRange(y*30, 10*height, 19*height)
 
     def diagWhite(x, y):
-        return min(lineDist(x, y, 0.5, 0.0), lineDist(x, y, -0.5, height)) <= 0.1 * height
+        return numpy.minimum(lineDist(x, y, 0.5, 0.0), lineDist(x, y, -0.5, height)) <= 0.1 * height
 
     def diagRed(x, y):
-        if x <= 0.5*width and y <= 0.5*height: # Bottom left
-            return lineDist(x, y, 0.5, -redDiagIntDist) <= redDiagDist
-        elif x <= 0.5*width: # Top left
-            return lineDist(x, y, -0.5, height-redDiagIntDist) <= redDiagDist
-        elif y <= 0.5*height: # Bottom right
-            return lineDist(x, y, -0.5, height+redDiagIntDist) <= redDiagDist
-        else: # Top right
-            return lineDist(x, y, 0.5, redDiagIntDist) <= redDiagDist
+        left, bottom = x <= 0.5*width, y <= 0.5*height
+        return numpy.select(
+            [
+                left & bottom, # Bottom left
+                left,          # Top left
+                bottom,        # Bottom right
+            ],
+            [
+                lineDist(x, y, 0.5, -redDiagIntDist) <= redDiagDist,
+                lineDist(x, y, -0.5, height-redDiagIntDist) <= redDiagDist,
+                lineDist(x, y, -0.5, height+redDiagIntDist) <= redDiagDist,
+            ],
+            default=lineDist(x, y, 0.5, redDiagIntDist) <= redDiagDist # Top right
+        )
 
     red = Vec3(204.0/256.0, 0.0, 0.0)
     white = Vec3(1.0, 1.0, 1.0)
     blue = Vec3(0.0, 0.0, 102.0/256.0)
 
-    for _x in range(width):
-        for _y in range(height):
-            x, y = _x + 0.5, _y + 0.5
-            if middleRed(x, y):     diffuse, bumpHeight = red, 0.3
-            elif middleWhite(x, y): diffuse, bumpHeight = white, 0.1
-            elif diagRed(x, y):     diffuse, bumpHeight = red, 0.3
-            elif diagWhite(x, y):   diffuse, bumpHeight = white, 0.1
-            else:                   diffuse, bumpHeight = blue, 0.2
-            self.add(obj, Translate(spacing*_x, spacing*_y, bumpHeight*r()), diffuse=diffuse)
+    RED, WHITE, BLUE = range(3)
+    colours = numpy.array([red, white, blue])
+    bumpHeights = numpy.array([0.3, 0.1, 0.2])
+
+    _x, _y = [a.reshape((-1,)) for a in numpy.meshgrid(range(width), range(height), indexing='ij')]
+    x, y = _x + 0.5, _y + 0.5
+    stripe = numpy.select(
+        [middleRed(x, y), middleWhite(x, y), diagRed(x, y), diagWhite(x, y)],
+        [RED, WHITE, RED, WHITE],
+        default=BLUE
+    )
+
+    offsets = numpy.column_stack((
+        spacing*_x,
+        spacing*_y,
+        bumpHeights[stripe] * numpy.random.random(len(stripe))
+    ))
+    self.addMany(obj, offsets, diffuse=colours[stripe])
 
 @makeCompound
 def BrickWall(self, **kwargs):
     brick = getInstance('Cube')
     #brick = standard_primitives.WavefrontPrimitive.get(filename='meshes/plisson.obj')
-    for y in range(30):
-        for x in range(30):
-            self.add(brick, Translate(x*1.1, y*1.1, 0.0))
+    y, x = [a.reshape((-1,)) for a in numpy.mgrid[0:30, 0:30]]
+    self.addMany(brick, numpy.column_stack((x*1.1, y*1.1, numpy.zeros(len(x)))))
 
 @makeCompound
 def BrickWallCollection(self, **kwargs):
     wall = BrickWall()
-    for z in range(30):
-        self.add(wall, Translate(0.0, 0.0, z * 1.1))
+    z = numpy.arange(30)
+    self.addMany(wall, numpy.column_stack((numpy.zeros(30), numpy.zeros(30), z * 1.1)))
 
 @makeCompound
 def Suburbia(self, **kwargs):
-    house = getInstance('WavefrontPrimitive', filename='meshes/plisson.obj')
+    house = getInstance('WavefrontPrimitive', filename='meshes/plisson.obj', lods=True)
 
-    for x in range(10):
-        for z in range(10):
-            if x == 3:
-                self.add(house, Translate(20.0*x, 0.0, 20.0*z), diffuse=Vec3(1.0, 0.0, 0.0))
-            elif z == 4:
-                self.add(house, Translate(20.0*x, 0.0, 20.0*z), diffuse=Vec3(0.0, 0.0, 1.0))
-            else:
-                self.add(house, Translate(20.0*x, 0.0, 20.0*z))
+    x, z = [a.reshape((-1,)) for a in numpy.mgrid[0:10, 0:10]]
+    offsets = numpy.column_stack((20.0*x, numpy.zeros(len(x)), 20.0*z))
+
+    red = x == 3
+    blue = (z == 4) & ~red
+    self.addMany(house, offsets[red], diffuse=Vec3(1.0, 0.0, 0.0))
+    self.addMany(house, offsets[blue], diffuse=Vec3(0.0, 0.0, 1.0))
+    self.addMany(house, offsets[~(red | blue)])
 
 @makePrimitive
 def BasicHouseRoof(self, **kwargs):
@@ -204,42 +162,25 @@ def BasicHouseRoof(self, **kwargs):
     sizeZ = kwargs['sizeZ'] # Depth
     gradient = kwargs['gradient']
 
-    name = 'BasicHouseRoof'
+    # Loft from the base up to the ridge (or apex), with each base
+    # corner joined to the nearest end of the ridge
+    apexDist = 0.5 * min(sizeX, sizeZ)
+    apexHeight = gradient * apexDist
+    base = [Vec3(0.0, 0.0, 0.0), Vec3(sizeX, 0.0, 0.0), Vec3(sizeX, 0.0, -sizeZ), Vec3(0.0, 0.0, -sizeZ)]
 
     if sizeX == sizeZ:
-        size = sizeX
-        vertices = [
-            Vec3(0.0, 0.0, 0.0),
-            Vec3(size, 0.0, 0.0),
-            Vec3(size, 0.0, -size),
-            Vec3(0.0, 0.0, -size),
-            Vec3(0.5*size, gradient*0.5*size, -0.5*size)
-        ]
-        indices = [0, 1, 4, 1, 2, 4, 2, 3, 4, 3, 0, 4, 2, 1, 0, 0, 3, 2]
-    else:
-        if sizeX > sizeZ:
-            apexDist = 0.5 * sizeZ
-            vertices = [
-                Vec3(0.0, 0.0, 0.0),
-                Vec3(sizeX, 0.0, 0.0),
-                Vec3(sizeX, 0.0, -sizeZ),
-                Vec3(0.0, 0.0, -sizeZ),
-                Vec3(apexDist, gradient*apexDist, -apexDist),
-                Vec3(sizeX-apexDist, gradient*apexDist, -apexDist)
-            ]
-            indices = [0, 1, 4, 4, 1, 5, 1, 2, 5, 2, 3, 5, 5, 3, 4, 3, 0, 4, 2, 1, 0, 0, 3, 2]
-        else: # sizeZ > sizeX
-            apexDist = 0.5 * sizeX
-            vertices = [
-                Vec3(0.0, 0.0, 0.0),
-                Vec3(sizeX, 0.0, 0.0),
-                Vec3(sizeX, 0.0, -sizeZ),
-                Vec3(0.0, 0.0, -sizeZ),
-                Vec3(apexDist, gradient*apexDist, -apexDist),
-                Vec3(apexDist, gradient*apexDist, -(sizeZ-apexDist))
-            ]
-            indices = [0, 1, 4, 1, 2, 4, 4, 2, 5, 2, 3, 5, 3, 0, 5, 5, 0, 4, 2, 1, 0, 0, 3, 2]
-    self.underlying = VertexMesh(name, vertices, indices)
+        ridge = [Vec3(apexDist, apexHeight, -apexDist)] * 4
+    elif sizeX > sizeZ:
+        left = Vec3(apexDist, apexHeight, -apexDist)
+        right = Vec3(sizeX-apexDist, apexHeight, -apexDist)
+        ridge = [left, right, right, left]
+    else: # sizeZ > sizeX
+        front = Vec3(apexDist, apexHeight, -apexDist)
+        back = Vec3(apexDist, apexHeight, -(sizeZ-apexDist))
+        ridge = [front, front, back, back]
+
+    vertices, indices = mesh_builders.loft([base, ridge], capStart=True)
+    self.underlying = flatMeshType(kwargs.get('policy'))('BasicHouseRoof', vertices, indices)
 
 @makeCompound
 def House(self, **kwargs):
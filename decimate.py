@@ -0,0 +1,151 @@
+import numpy
+
+# Resolutions tried when searching for a triangle budget, as the number
+# of grid cells along the mesh's longest side
+MIN_RESOLUTION = 1
+MAX_RESOLUTION = 1024
+
+
+def faceQuadrics(positions, triangles):
+    '''
+    Returns a (T,4,4) array with the error quadric of each triangle's
+    plane, weighted by its area, so that for a point p = (x, y, z, 1)
+    p.Q.p is the area times the squared distance from p to the plane.
+    '''
+    corners = positions[triangles].astype(numpy.float64)
+    normals = numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    doubleAreas = numpy.sqrt((normals * normals).sum(axis=1))
+    normals /= numpy.maximum(doubleAreas, 1e-30)[:, None]
+
+    planes = numpy.empty((len(triangles), 4))
+    planes[:, :3] = normals
+    planes[:, 3] = -(normals * corners[:, 0]).sum(axis=1)
+    return 0.5 * doubleAreas[:, None, None] * planes[:, :, None] * planes[:, None, :]
+
+
+def sumByIndex(values, indices, count):
+    '''
+    Sums the rows of values (N,...) into count bins by indices (N,).
+    '''
+    flat = values.reshape((len(values), -1))
+    sums = numpy.empty((count, flat.shape[1]))
+    for column in xrange(flat.shape[1]):
+        sums[:, column] = numpy.bincount(indices, flat[:, column], minlength=count)
+    return sums.reshape((count,) + values.shape[1:])
+
+
+def vertexQuadrics(positions, triangles):
+    '''
+    Returns a (V,4,4) array where each vertex's quadric is the sum of
+    those of the triangles around it.
+    '''
+    quadrics = faceQuadrics(positions, triangles)
+    return sumByIndex(numpy.repeat(quadrics, 3, axis=0), triangles.reshape((-1,)), len(positions))
+
+
+def clusterVertices(positions, resolution):
+    '''
+    Buckets vertices into a grid with resolution cells along the longest
+    side of their bounding box. Returns (cluster index of each vertex,
+    number of clusters).
+    '''
+    low, high = positions.min(axis=0), positions.max(axis=0)
+    cellSize = max((high - low).max() / resolution, 1e-12)
+    cells = numpy.floor((positions - low) / cellSize).astype(numpy.int64)
+    cells = numpy.minimum(cells, resolution - 1)
+    keys = (cells[:, 0] * resolution + cells[:, 1]) * resolution + cells[:, 2]
+    _, clusters = numpy.unique(keys, return_inverse=True)
+    return clusters, clusters.max() + 1
+
+
+def clusterPositions(positions, quadrics, clusters, count):
+    '''
+    Places each cluster's vertex where it best fits the planes of the
+    triangles around it, i.e. where its summed quadric is smallest. Where
+    that point is badly determined (e.g. on a flat area) or falls outside
+    the cluster's vertices' bounding box, the mean position is used.
+    '''
+    positions = positions.astype(numpy.float64)
+    sizes = numpy.bincount(clusters, minlength=count).astype(numpy.float64)
+    means = sumByIndex(positions, clusters, count) / sizes[:, None]
+
+    Q = sumByIndex(quadrics, clusters, count)
+    A, b = Q[:, :3, :3], -Q[:, :3, 3]
+    # Only trust systems that are well conditioned
+    wellPosed = numpy.linalg.cond(A) < 1e6
+    best = means.copy()
+    if wellPosed.any():
+        best[wellPosed] = numpy.linalg.solve(A[wellPosed], b[wellPosed][:, :, None])[:, :, 0]
+
+    lows = numpy.full((count, 3), numpy.inf)
+    highs = numpy.full((count, 3), -numpy.inf)
+    numpy.minimum.at(lows, clusters, positions)
+    numpy.maximum.at(highs, clusters, positions)
+    outside = ((best < lows - 1e-9) | (best > highs + 1e-9)).any(axis=1)
+    best[outside] = means[outside]
+    return best.astype(numpy.float32)
+
+
+def collapse(triangles, clusters):
+    '''
+    Moves each triangle's corners to their clusters, and drops triangles
+    that collapse or that duplicate another one.
+    '''
+    triangles = clusters[triangles]
+    keep = (
+        (triangles[:, 0] != triangles[:, 1]) &
+        (triangles[:, 1] != triangles[:, 2]) &
+        (triangles[:, 2] != triangles[:, 0])
+    )
+    triangles = triangles[keep]
+
+    # Triangles with the same corners in any order are duplicates
+    _, first = numpy.unique(numpy.sort(triangles, axis=1), axis=0, return_index=True)
+    return triangles[numpy.sort(first)]
+
+
+def decimate(positions, indices, targetTriangles, normals=None):
+    '''
+    Simplifies a triangle mesh to at most targetTriangles triangles (where
+    possible) by quadric-based vertex clustering: vertices are merged in
+    grid cells, each merged vertex is placed to minimise the summed
+    quadric error of its triangles' planes, and the grid is refined as
+    far as the triangle budget allows. Normals, if given, are averaged
+    over each cluster.
+    Returns (positions, normals or None, indices).
+    '''
+    positions = numpy.asarray(positions, dtype=numpy.float32).reshape((-1, 3))
+    triangles = numpy.asarray(indices, dtype=numpy.int64).reshape((-1, 3))
+    if len(triangles) <= targetTriangles:
+        return positions, normals, numpy.asarray(indices, dtype=numpy.uint32)
+
+    # Binary search for the finest grid that meets the budget
+    low, high = MIN_RESOLUTION, MAX_RESOLUTION
+    best = None
+    while low <= high:
+        resolution = (low + high) // 2
+        clusters, count = clusterVertices(positions, resolution)
+        collapsed = collapse(triangles, clusters)
+        if len(collapsed) <= targetTriangles:
+            best = (clusters, count, collapsed)
+            low = resolution + 1
+        else:
+            high = resolution - 1
+    if best is None:
+        best = (clusters, count, collapsed)
+    clusters, count, collapsed = best
+
+    newPositions = clusterPositions(positions, vertexQuadrics(positions, triangles), clusters, count)
+    newNormals = None
+    if normals is not None:
+        newNormals = sumByIndex(numpy.asarray(normals, dtype=numpy.float64), clusters, count)
+        newNormals /= numpy.maximum(numpy.sqrt((newNormals * newNormals).sum(axis=1)), 1e-12)[:, None]
+        newNormals = newNormals.astype(numpy.float32)
+
+    # Drop the clusters that no remaining triangle uses
+    used, remapped = numpy.unique(collapsed, return_inverse=True)
+    return (
+        newPositions[used],
+        None if newNormals is None else newNormals[used],
+        remapped.astype(numpy.uint32)
+    )
@@ -1,45 +1,443 @@
+import bvh
+import numpy
+import culling
+import profiler
+import primitives
 from collections import defaultdict
-from OpenGL import GL
-from mesh_types import NULL_PTR
+from gl_backend import GL
+from mesh_types import INSTANCE_DTYPE, packInstances
+from instances import InstanceBlock, asTransformStack
+from materials import MaterialTable
+from ring_buffer import RingBuffer
+from gl_state import STATE
+from draw_list import DrawList
+from frame_uniforms import FrameUniforms
+from gpu_timer import GpuTimer
+from geometry_arena import DRAW_COMMAND_DTYPE
+
+# Towards the light, until setLightDirection is called
+DEFAULT_LIGHT_DIRECTION = (0.5, 0.5, 0.5)
 
 
 class DisplayGroup(object):
 
     def __init__(self):
-        # {program: {vao: [model_matrix]}}
+        # {program: {primitive: [InstanceBlock]}}
         self.mapping = defaultdict(lambda: defaultdict(list))
+        # The distinct materials of every instance, shared by all meshes
+        self.materials = MaterialTable()
+        self.frameUniforms = FrameUniforms()
+        # Only used while profiling
+        self.gpuTimer = GpuTimer()
+        self.lightDirection = DEFAULT_LIGHT_DIRECTION
+
+        self.cullingEnabled = True
+        # Every instance of every primitive, numbered in the tree by a
+        # global id. Each primitive also numbers its own instances from 0,
+        # and instanceKeys holds (primitive number << 32 | that index) for
+        # each global id
+        self.bvh = None
+        self.primitives = []
+        self.primitiveNumbers = {}
+        self.instanceKeys = numpy.zeros((0,), dtype=numpy.int64)
+        # The INSTANCE_DTYPE record of every instance, by global id,
+        # whichever of its primitive's meshes it is drawn with
+        self.instanceData = numpy.zeros((0,), dtype=INSTANCE_DTYPE)
+        self.alive = numpy.zeros((0,), dtype=bool)
+        self.numAlive = 0
+        # Global ids given out so far. The arrays indexed by them have
+        # room for more, and double in size when full
+        self.numIds = 0
+        # {primitive: global id of each of its instances}
+        self.globalIds = {}
+        # {primitive: number of its instances, removed or not}
+        self.numSlots = {}
+        # {primitive: [indices of removed instances, free for reuse]}
+        self.freeSlots = {}
+        # Global ids of the instances to draw this frame, in draw list
+        # order, and how many of them each draw list command draws
+        self.visibleIds = numpy.zeros((0,), dtype=numpy.intp)
+        self.visibleCounts = numpy.zeros((0,), dtype=numpy.intp)
+        # Each frame's instance records and draw commands are streamed
+        # through these
+        self.instanceRing = None
+        self.commandRing = None
+        # Rebuilt on the next draw whenever it is None
+        self.drawList = None
+        # Byte offset of this frame's commands in commandRing
+        self.commandOffset = 0
+
+        self.lodEnabled = True
+        # World bounding sphere of every instance, by global id
+        self.centers = numpy.zeros((0, 3), dtype=numpy.float32)
+        self.radii = numpy.zeros((0,), dtype=numpy.float32)
+
+        # Counters for the last frame drawn
+        self.numDrawn = 0
+        self.numCulled = 0
+        self.numTrianglesDrawn = 0
+
+    def addInstances(self, primitive, block):
+        self.mapping[primitive.underlying.program][primitive].append(block)
 
     def addPrimitive(self, primitive, transform, params):
-        self.mapping[primitive.underlying.program][primitive].append((transform, params))
+        self.addInstances(primitive, InstanceBlock.single(transform, params))
 
     def updateUniforms(self, cameraPosition, viewMatrix, projMatrix):
         self.cameraPosition = cameraPosition
         self.viewMatrix = viewMatrix
         self.projMatrix = projMatrix
+        self.viewProjMatrix = numpy.dot(projMatrix, viewMatrix)
+
+    def setLightDirection(self, lightDirection):
+        self.lightDirection = lightDirection # TOWARDS the light
 
     def setModelMatrixBuffers(self):
+        '''
+        Builds every mesh's instance buffers, and the tree used to cull
+        them, from the instances added so far. Any live edits since the
+        last call are lost.
+        '''
+        self.primitives = []
+        self.primitiveNumbers = {}
+        self.globalIds = {}
+        self.numSlots = {}
+        self.freeSlots = {}
+        allCenters, allExtents, allKeys, allInstances = [], [], [], []
+        numInstances = 0
         for program, primitiveMap in self.mapping.iteritems():
-            for primitive, modelMatrixAndParamsList in primitiveMap.iteritems():
-                primitive.underlying.setAttribLists(modelMatrixAndParamsList)
+            for primitive, blocks in primitiveMap.items():
+                if not blocks:
+                    # Only ever had live instances, which are gone now
+                    del primitiveMap[primitive]
+                    continue
+                block = InstanceBlock.concatenate(blocks)
+                primitiveMap[primitive] = [block]
+                mesh = primitive.underlying
+                allInstances.append(packInstances(block, self.materials.intern(block)))
+                centers, extents = culling.worldBounds(block.matrices, mesh.boundsMin, mesh.boundsMax)
+                allCenters.append(centers)
+                allExtents.append(extents)
+
+                self.primitiveNumbers[primitive] = len(self.primitives)
+                self.primitives.append(primitive)
+                self.globalIds[primitive] = numInstances + numpy.arange(len(block))
+                self.numSlots[primitive] = len(block)
+                allKeys.append((numpy.int64(len(self.primitives) - 1) << 32) + numpy.arange(len(block)))
+                self.freeSlots[primitive] = []
+                numInstances += len(block)
+
+        self.materials.upload()
+
+        self.instanceKeys = numpy.concatenate(allKeys or [numpy.zeros((0,), dtype=numpy.int64)])
+        self.instanceData = numpy.concatenate(allInstances or [numpy.zeros((0,), dtype=INSTANCE_DTYPE)])
+        self.alive = numpy.ones((numInstances,), dtype=bool)
+        self.numAlive = numInstances
+        self.numIds = numInstances
+        self.makeInstanceRing(numInstances)
+        self.drawList = None
+
+        if self.primitives:
+            self.centers = numpy.concatenate(allCenters)
+            extents = numpy.concatenate(allExtents)
+            self.radii = numpy.sqrt((extents * extents).sum(axis=1))
+            self.bvh = bvh.InstanceBVH(self.centers, extents)
+        else:
+            self.bvh = None
+
+    def splitByPrimitive(self, ids):
+        '''
+        Turns global instance ids into [(primitive, instanceIndices)],
+        skipping removed instances.
+        '''
+        keys = self.instanceKeys[ids[self.alive[ids]]]
+        if (keys[1:] < keys[:-1]).any():
+            keys = numpy.sort(keys)
+        bounds = numpy.searchsorted(keys, numpy.arange(len(self.primitives) + 1, dtype=numpy.int64) << 32)
+        return [
+            (primitive, keys[bounds[i]:bounds[i+1]] & 0xffffffff)
+            for i, primitive in enumerate(self.primitives)
+        ]
+
+    def registerPrimitive(self, primitive):
+        '''
+        Gets a primitive that isn't in the group yet ready to have
+        instances added to it live.
+        '''
+        self.primitiveNumbers[primitive] = len(self.primitives)
+        self.primitives.append(primitive)
+        self.globalIds[primitive] = numpy.zeros((0,), dtype=numpy.intp)
+        self.numSlots[primitive] = 0
+        self.freeSlots[primitive] = []
+        self.mapping[primitive.underlying.program][primitive] = []
+        self.drawList = None
+
+    def newSlots(self, primitive, count):
+        '''
+        Makes room for count more instances of a primitive, with new
+        global ids, and returns (their indices, their global ids). They
+        start out removed, with no bounds.
+        '''
+        if self.bvh is None:
+            self.bvh = bvh.InstanceBVH(numpy.zeros((0, 3)), numpy.zeros((0, 3)))
+        if primitive not in self.primitiveNumbers:
+            self.registerPrimitive(primitive)
+
+        start = self.numSlots[primitive]
+        indices = start + numpy.arange(count)
+        globalIds = self.numIds + numpy.arange(count)
+        self.numSlots[primitive] = start + count
+        self.numIds += count
+
+        self.globalIds[primitive] = bvh.grown(self.globalIds[primitive], start + count)
+        self.globalIds[primitive][indices] = globalIds
+        for name in ('instanceKeys', 'instanceData', 'alive', 'centers', 'radii'):
+            setattr(self, name, bvh.grown(getattr(self, name), self.numIds))
+        self.instanceKeys[globalIds] = (numpy.int64(self.primitiveNumbers[primitive]) << 32) + indices
+        self.bvh.append(numpy.zeros((count, 3)), numpy.zeros((count, 3)))
+        return indices, globalIds
+
+    def addInstance(self, primitive, transform, ambient, diffuse, specular):
+        '''
+        Adds one instance of a primitive to the group after
+        setModelMatrixBuffers, and returns a handle to it for
+        updateInstance and removeInstance. It is drawn from the next frame.
+        Its material must be given in full, as a new slot has none.
+        '''
+        freeSlots = self.freeSlots.get(primitive)
+        if freeSlots:
+            index = freeSlots.pop()
+            globalId = self.globalIds[primitive][index]
+        else:
+            indices, globalIds = self.newSlots(primitive, 1)
+            index, globalId = indices[0], globalIds[0]
+
+        self.alive[globalId] = True
+        self.numAlive += 1
+        self.updateInstance((primitive, index), transform, ambient=ambient, diffuse=diffuse, specular=specular)
+        return (primitive, index)
+
+    def addInstanceBlock(self, primitive, block):
+        '''
+        Adds every instance in an InstanceBlock to the group after
+        setModelMatrixBuffers (or instead of it), like addInstance but in
+        one go. Returns their indices, which make handles with primitive.
+        '''
+        indices, globalIds = self.newSlots(primitive, len(block))
+        self.alive[globalIds] = True
+        self.numAlive += len(block)
+
+        mesh = primitive.underlying
+        centers, extents = culling.worldBounds(block.matrices, mesh.boundsMin, mesh.boundsMax)
+        self.centers[globalIds] = centers
+        self.radii[globalIds] = numpy.sqrt((extents * extents).sum(axis=1))
+        self.bvh.itemMins[globalIds] = centers - extents
+        self.bvh.itemMaxs[globalIds] = centers + extents
+
+        self.instanceData[globalIds] = packInstances(block, self.materials.intern(block))
+        return indices
+
+    def removeInstance(self, handle):
+        '''
+        Stops drawing an instance from the next frame. Its handle may be
+        reused by a later addInstance.
+        '''
+        primitive, index = handle
+        globalId = self.globalIds[primitive][index]
+        assert self.alive[globalId]
+        self.alive[globalId] = False
+        self.numAlive -= 1
+        self.freeSlots[primitive].append(index)
+
+    def updateInstance(self, handle, transform=None, **params):
+        '''
+        Changes the transform and/or any of the material params (ambient,
+        diffuse, specular) of an instance, from the next frame.
+        '''
+        primitive, index = handle
+        globalId = self.globalIds[primitive][index]
+
+        if params:
+            names = ('ambient', 'diffuse', 'specular')
+            if not all(name in params for name in names):
+                # Fill in the params not given from the current material
+                material = self.materials.materials[self.instanceData['materialId'][globalId]]
+                params = dict((name, params.get(name, material[name])) for name in names)
+            self.instanceData['materialId'][globalId] = self.materials.internMaterial(*[params[name] for name in names])
+
+        if transform is not None:
+            matrix = asTransformStack(transform)
+            mesh = primitive.underlying
+            centers, extents = culling.worldBounds(matrix, mesh.boundsMin, mesh.boundsMax)
+            self.centers[globalId] = centers[0]
+            self.radii[globalId] = numpy.sqrt((extents[0] * extents[0]).sum())
+            self.bvh.setBounds(globalId, centers[0] - extents[0], centers[0] + extents[0])
+            self.instanceData['modelRows'][globalId] = matrix[0, :3]
+
+    def flushEdits(self):
+        '''
+        Sends any new materials, and rebuilds the tree once enough
+        instances have been added or moved.
+        '''
+        if self.bvh is not None and self.bvh.needsRebuild():
+            self.bvh = bvh.InstanceBVH.rebuilt(self.bvh)
+        self.materials.upload()
+
+    def makeInstanceRing(self, capacity):
+        '''
+        Replaces the ring buffer that instances are streamed through with
+        one that can hold capacity instances a frame.
+        '''
+        if self.instanceRing is not None:
+            self.instanceRing.delete()
+        self.instanceRing = RingBuffer(INSTANCE_DTYPE, capacity)
+
+    def makeCommandRing(self, capacity):
+        '''
+        Replaces the ring buffer that draw commands are streamed through
+        with one that can hold capacity commands a frame.
+        '''
+        if self.commandRing is not None:
+            self.commandRing.delete()
+            # Its name may be reused by the next buffer made
+            STATE.invalidate()
+        self.commandRing = RingBuffer(DRAW_COMMAND_DTYPE, capacity)
+
+    def compileDrawList(self):
+        self.drawList = DrawList(self.primitives)
+        for arena in self.drawList.arenas:
+            arena.upload()
+        if self.commandRing is None or self.commandRing.capacity < len(self.drawList):
+            self.makeCommandRing(len(self.drawList))
+
+    def streamInstances(self):
+        '''
+        Writes the records of every instance to be drawn this frame into
+        the next region of the instance ring, in draw list order, and the
+        draw list's commands into the next region of the command ring.
+        '''
+        if self.instanceRing is None or self.numAlive > self.instanceRing.capacity:
+            # Leave room to grow
+            self.makeInstanceRing(2 * self.numAlive)
+        self.instanceRing.beginFrame()
+        baseInstance, records = self.instanceRing.allocate(len(self.visibleIds))
+        numpy.take(self.instanceData, self.visibleIds, out=records, mode='clip')
+        self.instanceRing.flush()
+
+        # Meshes with nothing to draw keep their commands, with no instances
+        counts = self.visibleCounts
+        self.commandRing.beginFrame()
+        start, commands = self.commandRing.allocate(len(counts))
+        commands[:] = self.drawList.commands
+        commands['instanceCount'] = counts
+        commands['baseInstance'] = baseInstance + numpy.cumsum(counts) - counts
+        self.commandRing.flush()
+        self.commandOffset = start * DRAW_COMMAND_DTYPE.itemsize
+
+    def instancesInBox(self, boxMin, boxMax):
+        '''
+        Returns [(primitive, instanceIndices)] for the instances whose
+        world bounds overlap an axis-aligned box.
+        '''
+        if self.bvh is None:
+            return []
+        return self.splitByPrimitive(self.bvh.inBox(boxMin, boxMax))
+
+    def instancesInSphere(self, center, radius):
+        '''
+        Returns [(primitive, instanceIndices)] for the instances whose
+        world bounds come within radius of center.
+        '''
+        if self.bvh is None:
+            return []
+        return self.splitByPrimitive(self.bvh.inSphere(center, radius))
+
+    def cull(self, viewProjMatrix):
+        '''
+        Works out which instances are at least partly inside the view
+        frustum, and which level of detail to draw each of them at, as the
+        draw list command that draws them. Needs an up to date draw list.
+        '''
+        if self.bvh is None:
+            ids = numpy.zeros((0,), dtype=numpy.intp)
+        elif self.cullingEnabled:
+            ids = self.bvh.inFrustum(culling.frustumPlanes(viewProjMatrix), ordered=False)
+        else:
+            ids = numpy.arange(len(self.bvh))
+        ids = ids[self.alive[ids]]
+
+        drawList = self.drawList
+        primitiveNumbers = self.instanceKeys[ids] >> 32
+        if self.lodEnabled and drawList.lodSizes.shape[1]:
+            sizes = primitives.screenSizes(self.centers[ids], self.radii[ids], self.cameraPosition)
+            levels = (sizes[:, None] < drawList.lodSizes[primitiveNumbers]).sum(axis=1)
+            slots = drawList.slots[primitiveNumbers, levels]
+        else:
+            slots = drawList.slots[primitiveNumbers, 0]
+
+        # In command order, each command's instances in the order the tree
+        # found them
+        self.visibleIds = ids[numpy.argsort(slots, kind='mergesort')]
+        self.visibleCounts = numpy.bincount(slots, minlength=len(drawList))
+        self.numDrawn, self.numCulled = len(ids), self.numAlive - len(ids)
+        self.numTrianglesDrawn = int(numpy.dot(self.visibleCounts, drawList.numTriangles))
 
     def draw(self):
-        for program, primitiveMap in self.mapping.iteritems():
-            GL.glUseProgram(program.program)
-            GL.glUniformMatrix4fv(program.uniform_vp, 1, True, self.projMatrix * self.viewMatrix)
-            # Send program-level uniforms that don't vary per mesh
-            GL.glUniform3f(program.uniform_eyePos, self.cameraPosition[0], self.cameraPosition[1], self.cameraPosition[2])
-            for primitive, modelMatrixList in primitiveMap.iteritems():
-                GL.glBindVertexArray(primitive.underlying.vao)
-                # Convert this to instancing in future
-                GL.glDrawElementsInstanced(GL.GL_TRIANGLES, 3*primitive.underlying.numTriangles, GL.GL_UNSIGNED_INT, NULL_PTR, len(modelMatrixList))
+        with profiler.scope('flushEdits'):
+            self.flushEdits()
+        if self.instanceRing is None and not self.numAlive:
+            return
+        if self.drawList is None:
+            with profiler.scope('compileDrawList'):
+                self.compileDrawList()
+        with profiler.scope('cull'):
+            self.cull(self.viewProjMatrix)
+        with profiler.scope('stream'):
+            self.streamInstances()
+
+        with profiler.scope('submit'):
+            self.frameUniforms.update(self.viewProjMatrix, self.cameraPosition, self.lightDirection)
+            self.frameUniforms.bind()
+            self.materials.bind()
+            STATE.bindBuffer(GL.GL_DRAW_INDIRECT_BUFFER, self.commandRing.buffer)
+
+            timingGpu = profiler.ENABLED
+            if timingGpu:
+                self.gpuTimer.beginFrame()
+
+            # One multi-draw per arena, with each program's arenas together
+            for program, batch in self.drawList.batches:
+                STATE.useProgram(program.program)
+                if timingGpu:
+                    self.gpuTimer.begin(type(program).__name__)
+                for arena, firstCommand, numCommands in batch:
+                    arena.drawInstances(
+                        self.instanceRing, self.commandOffset + firstCommand * DRAW_COMMAND_DTYPE.itemsize, numCommands
+                    )
+                    profiler.count('drawCalls')
+                    profiler.count('drawCommands', numCommands)
+                if timingGpu:
+                    self.gpuTimer.end()
+
+            self.instanceRing.endFrame()
+            self.commandRing.endFrame()
+
+        profiler.count('instancesDrawn', self.numDrawn)
+        profiler.count('instancesCulled', self.numCulled)
+        profiler.count('trianglesDrawn', self.numTrianglesDrawn)
+
+    def numInstances(self, primitive):
+        if primitive in self.globalIds:
+            return self.alive[self.globalIds[primitive][:self.numSlots[primitive]]].sum()
+        return sum(len(block) for block in self.mapping[primitive.underlying.program][primitive])
 
     def __str__(self):
         desc = []
         for program, primitiveMap in self.mapping.iteritems():
             desc.append('\tProgram %s:' % program)
             desc.extend(
-                '\t\t%s: %s instances' % (primitive, len(modelMatrixList))
-                for primitive, modelMatrixList in primitiveMap.iteritems()
+                '\t\t%s: %s instances' % (primitive, self.numInstances(primitive))
+                for primitive in primitiveMap
             )
         return 'DisplayGroup(\n%s\n)' % '\n'.join(desc)
 
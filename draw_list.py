@@ -0,0 +1,56 @@
+import numpy
+from collections import defaultdict
+from geometry_arena import DRAW_COMMAND_DTYPE
+
+
+class DrawList(object):
+    '''
+    The meshes of a set of primitives, ordered so that each arena's meshes
+    are together and each program's arenas are together, along with the
+    parts of their draw commands that don't change from frame to frame.
+    Only the instance counts and base instances are filled in each frame.
+    Must be rebuilt whenever the primitives change.
+
+    slots[n, level] is the command that draws the nth primitive at a level
+    of detail, and lodSizes[n] is its lodSizes padded with zeros, which no
+    instance is smaller than, to the most levels of any primitive.
+    '''
+
+    def __init__(self, primitives):
+        # {arena: [(primitive number, level, mesh)]}
+        meshesByArena = defaultdict(list)
+        for number, primitive in enumerate(primitives):
+            for level, mesh in enumerate(primitive.meshes):
+                meshesByArena[mesh.arena].append((number, level, mesh))
+        arenasByProgram = defaultdict(list)
+        for arena in meshesByArena:
+            arenasByProgram[arena.program].append(arena)
+
+        numLevels = max([len(primitive.meshes) for primitive in primitives] or [1])
+        self.slots = numpy.zeros((len(primitives), numLevels), dtype=numpy.intp)
+        self.lodSizes = numpy.zeros((len(primitives), numLevels - 1), dtype=numpy.float32)
+        for number, primitive in enumerate(primitives):
+            self.lodSizes[number, :len(primitive.lodSizes)] = primitive.lodSizes
+
+        # Every mesh, in draw order
+        self.meshes = []
+        # [(program, [(arena, index of first command, number of commands)])]
+        self.batches = []
+        for program, arenas in arenasByProgram.iteritems():
+            batch = []
+            for arena in arenas:
+                batch.append((arena, len(self.meshes), len(meshesByArena[arena])))
+                for number, level, mesh in meshesByArena[arena]:
+                    self.slots[number, level] = len(self.meshes)
+                    self.meshes.append(mesh)
+            self.batches.append((program, batch))
+        self.arenas = meshesByArena.keys()
+
+        self.commands = numpy.zeros((len(self.meshes),), dtype=DRAW_COMMAND_DTYPE)
+        self.commands['count'] = [3*mesh.numTriangles for mesh in self.meshes]
+        self.commands['firstIndex'] = [mesh.firstIndex for mesh in self.meshes]
+        self.commands['baseVertex'] = [mesh.baseVertex for mesh in self.meshes]
+        self.numTriangles = numpy.array([mesh.numTriangles for mesh in self.meshes], dtype=numpy.int64)
+
+    def __len__(self):
+        return len(self.meshes)
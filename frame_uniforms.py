@@ -0,0 +1,44 @@
+import numpy
+import profiler
+from gl_backend import GL
+
+# Uniform buffer binding point of the block; matches the shaders' Frame block
+FRAME_BINDING = 0
+
+# The std140 Frame block. The matrix is declared row_major in the shaders
+# so it can be sent as numpy lays it out; the vec3s are padded to vec4s
+FRAME_DTYPE = numpy.dtype([
+    ('viewProj', numpy.float32, (4, 4)),
+    ('eyePosition', numpy.float32, 4),
+    ('lightDirection', numpy.float32, 4),
+])
+
+
+class FrameUniforms(object):
+    '''
+    The uniforms shared by every program and draw in a frame, held in one
+    uniform buffer that is written once per frame.
+    '''
+
+    def __init__(self):
+        self.data = numpy.zeros((1,), dtype=FRAME_DTYPE)
+        self.buffer = None
+
+    def update(self, viewProjMatrix, eyePosition, lightDirection):
+        data = self.data
+        data['viewProj'][0] = viewProjMatrix
+        data['eyePosition'][0, :3] = eyePosition[:3]
+        data['lightDirection'][0, :3] = lightDirection[:3]
+
+        if self.buffer is None:
+            self.buffer = GL.glGenBuffers(1)
+            GL.glBindBuffer(GL.GL_UNIFORM_BUFFER, self.buffer)
+            GL.glBufferData(GL.GL_UNIFORM_BUFFER, data.nbytes, data, GL.GL_DYNAMIC_DRAW)
+        else:
+            GL.glBindBuffer(GL.GL_UNIFORM_BUFFER, self.buffer)
+            GL.glBufferSubData(GL.GL_UNIFORM_BUFFER, 0, data.nbytes, data)
+        GL.glBindBuffer(GL.GL_UNIFORM_BUFFER, 0)
+        profiler.count('bytesUploaded', data.nbytes)
+
+    def bind(self):
+        GL.glBindBufferBase(GL.GL_UNIFORM_BUFFER, FRAME_BINDING, self.buffer)
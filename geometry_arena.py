@@ -0,0 +1,168 @@
+import ctypes
+import numpy
+import threading
+import profiler
+from gl_backend import GL
+from gl_state import STATE
+
+# Vertex buffer binding points of each arena's vertex array
+VERTEX_BINDING = 0
+INSTANCE_BINDING = 1
+
+# The layout glMultiDrawElementsIndirect reads each draw from
+DRAW_COMMAND_DTYPE = numpy.dtype([
+    ('count', numpy.uint32),
+    ('instanceCount', numpy.uint32),
+    ('firstIndex', numpy.uint32),
+    ('baseVertex', numpy.int32),
+    ('baseInstance', numpy.uint32),
+])
+
+# Every mesh's indices, drawn as GL_UNSIGNED_INT
+INDEX_DTYPE = numpy.dtype(numpy.uint32)
+
+# {(vertex dtype, program type): GeometryArena}
+ARENAS = {}
+# Meshes may be made on several loading threads at once
+ARENAS_LOCK = threading.Lock()
+
+
+def arenaFor(vertexDtype, programType, instanceDtype):
+    '''
+    Returns the arena shared by every mesh with a vertex layout and program.
+    '''
+    key = (vertexDtype, programType)
+    with ARENAS_LOCK:
+        arena = ARENAS.get(key)
+        if arena is None:
+            ARENAS[key] = arena = GeometryArena(vertexDtype, programType, instanceDtype)
+    return arena
+
+
+class GeometryArena(object):
+    '''
+    The vertices and indices of many meshes with the same vertex layout,
+    packed one after another into one vertex buffer and one index buffer,
+    so that they can all be drawn through one vertex array with a single
+    glMultiDrawElementsIndirect. Meshes are added on the CPU, and only
+    sent to the GL when upload is called.
+    '''
+
+    def __init__(self, vertexDtype, programType, instanceDtype):
+        self.vertexDtype = vertexDtype
+        self.programType = programType
+        self.instanceDtype = instanceDtype
+        self.meshes = []
+        # Meshes may be built on loading threads
+        self.lock = threading.Lock()
+        self.numVertices = 0
+        self.numIndices = 0
+        self.numUploaded = 0
+        # Bytes the GL buffers have room for
+        self.vertexCapacity = 0
+        self.indexCapacity = 0
+        self.vao = None
+        # The RingBuffer the vertex array's instance binding points at
+        self.instanceRing = None
+
+    @property
+    def program(self):
+        return self.programType.get()
+
+    def add(self, mesh):
+        '''
+        Places a mesh's vertexData and indexData after those already in
+        the arena, setting its baseVertex and firstIndex.
+        '''
+        with self.lock:
+            mesh.arena = self
+            mesh.baseVertex = self.numVertices
+            mesh.firstIndex = self.numIndices
+            self.numVertices += len(mesh.vertexData)
+            self.numIndices += len(mesh.indexData)
+            self.meshes.append(mesh)
+
+    def upload(self):
+        '''
+        Sends the meshes added since the last upload to the GL, straight
+        from their own arrays.
+        '''
+        with self.lock:
+            meshes = list(self.meshes)
+            numVertices, numIndices = self.numVertices, self.numIndices
+        if self.numUploaded == len(meshes):
+            return
+        if self.vao is None:
+            self.createVertexArray()
+
+        self.vertexCapacity = self.uploadBuffer(
+            self.vbo, self.vertexCapacity, numVertices * self.vertexDtype.itemsize,
+            [(mesh.baseVertex * self.vertexDtype.itemsize, mesh.vertexData) for mesh in meshes]
+        )
+        self.indexCapacity = self.uploadBuffer(
+            self.ibo, self.indexCapacity, numIndices * INDEX_DTYPE.itemsize,
+            [(mesh.firstIndex * INDEX_DTYPE.itemsize, mesh.indexData) for mesh in meshes]
+        )
+        self.numUploaded = len(meshes)
+
+    def uploadBuffer(self, buffer, capacity, size, pieces):
+        '''
+        Writes the pieces [(byte offset, array)] not yet uploaded to a
+        buffer with room for capacity bytes, of which size are now used.
+        If it's too small, it's remade at least twice as big and every
+        piece is sent again. Returns the buffer's capacity.
+        '''
+        newPieces = pieces[self.numUploaded:]
+        # Goes through GL_ARRAY_BUFFER, as binding GL_ELEMENT_ARRAY_BUFFER
+        # would change whichever vertex array is bound
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, buffer)
+        if size > capacity:
+            capacity = max(size, 2 * capacity)
+            GL.glBufferData(GL.GL_ARRAY_BUFFER, capacity, None, GL.GL_STATIC_DRAW)
+            newPieces = pieces
+        for offset, data in newPieces:
+            GL.glBufferSubData(GL.GL_ARRAY_BUFFER, offset, data.nbytes, data)
+            profiler.count('bytesUploaded', data.nbytes)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        return capacity
+
+    def createVertexArray(self):
+        program = self.program
+        self.vao = GL.glGenVertexArrays(1)
+        self.vbo, self.ibo = GL.glGenBuffers(2)
+
+        STATE.bindVertexArray(self.vao)
+        GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+
+        # Per-vertex attributes, one for each field of the vertex layout
+        for field in self.vertexDtype.names:
+            location = getattr(program, 'attrib_' + field)
+            GL.glEnableVertexAttribArray(location)
+            GL.glVertexAttribFormat(location, 3, GL.GL_FLOAT, False, self.vertexDtype.fields[field][1])
+            GL.glVertexAttribBinding(location, VERTEX_BINDING)
+        GL.glBindVertexBuffer(VERTEX_BINDING, self.vbo, 0, self.vertexDtype.itemsize)
+
+        # Per-instance attributes, read from whatever buffer drawInstances binds
+        rowsOffset = self.instanceDtype.fields['modelRows'][1]
+        for i in range(3):
+            GL.glEnableVertexAttribArray(program.attrib_m + i)
+            GL.glVertexAttribFormat(program.attrib_m + i, 4, GL.GL_FLOAT, False, rowsOffset + 16*i)
+            GL.glVertexAttribBinding(program.attrib_m + i, INSTANCE_BINDING)
+        GL.glEnableVertexAttribArray(program.attrib_materialId)
+        GL.glVertexAttribIFormat(program.attrib_materialId, 1, GL.GL_UNSIGNED_INT, self.instanceDtype.fields['materialId'][1])
+        GL.glVertexAttribBinding(program.attrib_materialId, INSTANCE_BINDING)
+        GL.glVertexBindingDivisor(INSTANCE_BINDING, 1)
+
+    def drawInstances(self, instanceRing, commandOffset, numCommands):
+        '''
+        Issues numCommands DRAW_COMMAND_DTYPE draws, read from the bound
+        GL_DRAW_INDIRECT_BUFFER at byte commandOffset, whose baseInstances
+        index records in instanceRing.
+        '''
+        STATE.bindVertexArray(self.vao)
+        if instanceRing is not self.instanceRing:
+            GL.glBindVertexBuffer(INSTANCE_BINDING, instanceRing.buffer, 0, self.instanceDtype.itemsize)
+            self.instanceRing = instanceRing
+        GL.glMultiDrawElementsIndirect(
+            GL.GL_TRIANGLES, GL.GL_UNSIGNED_INT, ctypes.c_void_p(commandOffset), numCommands, 0
+        )
@@ -0,0 +1,223 @@
+'''
+Everything that talks to the GL does so through GL, which forwards to the
+backend chosen with use():
+
+    PyOpenGLBackend  - the real thing, needing a live context
+    NullBackend      - does nothing, so that scenes can be built, culled and
+                       drawn headless
+    RecordingBackend - logs every call, and the sizes of buffers and the
+                       bytes uploaded to them, on top of another backend
+
+The choice must be made before any GL objects are made.
+'''
+
+import itertools
+from collections import defaultdict
+
+
+class PyOpenGLBackend(object):
+
+    def __init__(self):
+        import OpenGL.GL
+        import OpenGL.GL.shaders
+        import OpenGL.extensions
+        self.module = OpenGL.GL
+        self.shaders = OpenGL.GL.shaders
+        self.extensions = OpenGL.extensions
+
+    def __getattr__(self, name):
+        return getattr(self.module, name)
+
+    def compileShader(self, source, shaderType):
+        return self.shaders.compileShader(source, shaderType)
+
+    def compileProgram(self, *stages, **named):
+        return self.shaders.compileProgram(*stages, **named)
+
+    def hasExtension(self, name):
+        return bool(self.extensions.hasGLExtension(name))
+
+
+class NullBackend(object):
+    '''
+    Accepts every GL call and does nothing. Object names count up from 1,
+    and constants take PyOpenGL's values where it is installed.
+    '''
+
+    def __init__(self):
+        self.names = itertools.count(1)
+        try:
+            import OpenGL.GL
+            self.constants = OpenGL.GL
+        except ImportError:
+            self.constants = None
+        # Stand-ins for constants when PyOpenGL isn't installed
+        self.madeUpConstants = defaultdict(itertools.count(0x10000).next)
+
+    def __getattr__(self, name):
+        if name.startswith('GL_'):
+            value = getattr(self.constants, name, None)
+            if value is None:
+                value = self.madeUpConstants[name]
+        elif name.startswith('gl'):
+            value = self.doNothing
+        else:
+            raise AttributeError(name)
+        setattr(self, name, value)
+        return value
+
+    def doNothing(self, *args, **kwargs):
+        return 0
+
+    def makeNames(self, count, *args):
+        names = [next(self.names) for _ in xrange(count)]
+        return names[0] if count == 1 else names
+
+    def makeName(self, *args):
+        return next(self.names)
+
+    glGenBuffers = glGenVertexArrays = glGenQueries = makeNames
+    glCreateShader = glCreateProgram = makeName
+    glGetAttribLocation = glGetUniformLocation = glGetUniformBlockIndex = makeName
+    glFenceSync = makeName
+
+    def glClientWaitSync(self, *args):
+        return self.GL_ALREADY_SIGNALED
+
+    def compileShader(self, source, shaderType):
+        return self.makeName()
+
+    def compileProgram(self, *stages, **named):
+        return self.makeName()
+
+    def hasExtension(self, name):
+        return False
+
+
+class RecordingBackend(object):
+    '''
+    Forwards to another backend (a NullBackend unless given), keeping:
+
+        calls         - [(name, args)] of every call, if keepCalls
+        counts        - {name: number of calls}
+        bufferSizes   - {buffer: size in bytes}
+        bytesUploaded - bytes sent with glBufferData/glBufferSubData
+    '''
+
+    def __init__(self, backend=None, keepCalls=True):
+        self.backend = backend if backend is not None else NullBackend()
+        self.keepCalls = keepCalls
+        self.reset()
+        # {target: buffer bound to it}
+        self.bound = {}
+        self.bufferSizes = {}
+
+    def reset(self):
+        '''
+        Clears the call log, counts and bytes uploaded; buffer sizes are
+        kept as they describe the GL's state rather than what was done.
+        '''
+        self.calls = []
+        self.counts = defaultdict(int)
+        self.bytesUploaded = 0
+
+    def __getattr__(self, name):
+        value = getattr(self.backend, name)
+        if name.startswith('gl'):
+            value = self.recorder(name, value)
+            setattr(self, name, value)
+        return value
+
+    def recorder(self, name, function):
+        track = getattr(self, 'track_' + name, None)
+
+        def record(*args, **kwargs):
+            if self.keepCalls:
+                self.calls.append((name, args))
+            self.counts[name] += 1
+            if track is not None:
+                track(*args)
+            return function(*args, **kwargs)
+        return record
+
+    def track_glBindBuffer(self, target, buffer):
+        self.bound[target] = buffer
+
+    def track_glBufferData(self, target, size, data, usage):
+        self.bufferSizes[self.bound.get(target)] = size
+        if data is not None:
+            self.bytesUploaded += size
+
+    def track_glBufferStorage(self, target, size, data, flags):
+        self.bufferSizes[self.bound.get(target)] = size
+        if data is not None:
+            self.bytesUploaded += size
+
+    def track_glBufferSubData(self, target, offset, size, data):
+        self.bytesUploaded += size
+
+    def track_glDeleteBuffers(self, count, buffers):
+        for buffer in buffers:
+            self.bufferSizes.pop(buffer, None)
+
+    def bufferBytes(self):
+        '''
+        Total size of every buffer that exists.
+        '''
+        return sum(self.bufferSizes.itervalues())
+
+    def compileShader(self, source, shaderType):
+        self.counts['compileShader'] += 1
+        return self.backend.compileShader(source, shaderType)
+
+    def compileProgram(self, *stages, **named):
+        self.counts['compileProgram'] += 1
+        return self.backend.compileProgram(*stages, **named)
+
+    def hasExtension(self, name):
+        return self.backend.hasExtension(name)
+
+
+class GLProxy(object):
+    '''
+    Stands in for the OpenGL.GL module, forwarding to the current backend.
+    Looked up names are kept on the proxy, so that later calls cost no
+    more than calling the module directly, until the backend changes.
+    '''
+
+    def __getattr__(self, name):
+        value = getattr(current(), name)
+        setattr(self, name, value)
+        return value
+
+
+BACKEND = None
+GL = GLProxy()
+
+
+def use(backend):
+    '''
+    Makes backend the one that GL forwards to, and returns it.
+    '''
+    global BACKEND
+    BACKEND = backend
+    GL.__dict__.clear()
+    return backend
+
+
+def current():
+    if BACKEND is None:
+        use(PyOpenGLBackend())
+    return BACKEND
+
+
+def compileShader(source, shaderType):
+    return current().compileShader(source, shaderType)
+
+
+def compileProgram(*stages, **named):
+    return current().compileProgram(*stages, **named)
+
+
+def hasExtension(name):
+    return current().hasExtension(name)
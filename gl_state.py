@@ -0,0 +1,37 @@
+from gl_backend import GL
+
+
+class GLState(object):
+    '''
+    Remembers the program, vertex array and buffers last bound through it,
+    so that binding the same one again costs nothing. Code that binds any
+    of these directly must call invalidate afterwards.
+    '''
+
+    def __init__(self):
+        self.invalidate()
+
+    def invalidate(self):
+        self.program = None
+        self.vertexArray = None
+        # {target: buffer}
+        self.buffers = {}
+
+    def useProgram(self, program):
+        if program != self.program:
+            GL.glUseProgram(program)
+            self.program = program
+
+    def bindVertexArray(self, vertexArray):
+        if vertexArray != self.vertexArray:
+            GL.glBindVertexArray(vertexArray)
+            self.vertexArray = vertexArray
+
+    def bindBuffer(self, target, buffer):
+        if buffer != self.buffers.get(target):
+            GL.glBindBuffer(target, buffer)
+            self.buffers[target] = buffer
+
+
+# There is only ever one context
+STATE = GLState()
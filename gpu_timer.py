@@ -0,0 +1,58 @@
+import profiler
+from gl_backend import GL
+
+# Frames of queries in flight; results are read this many frames late
+NUM_FRAMES = 3
+
+
+class GpuTimer(object):
+    '''
+    Times batches of draws on the GPU with GL_TIME_ELAPSED queries, and
+    adds the results to the profiler as 'gpu/<batch>' scopes (and their
+    sum as 'gpu'). Each frame's queries are only read back NUM_FRAMES
+    frames later, when they have normally finished, so reading them never
+    stalls; results that still aren't ready then are dropped.
+    Batches can't nest, as only one GL_TIME_ELAPSED query can be active.
+    '''
+
+    def __init__(self, numFrames=NUM_FRAMES):
+        self.numFrames = numFrames
+        # Per frame slot: [(batch name, query)] issued in it
+        self.issued = [[] for _ in xrange(numFrames)]
+        # Per frame slot: [query] made for it, reused in order
+        self.queries = [[] for _ in xrange(numFrames)]
+        self.slot = numFrames - 1
+
+    def beginFrame(self):
+        '''
+        Reads back the results of the frame that last used the next slot,
+        and moves on to it.
+        '''
+        self.slot = (self.slot + 1) % self.numFrames
+        issued = self.issued[self.slot]
+        if issued:
+            self.readResults(issued)
+        self.issued[self.slot] = []
+
+    def readResults(self, issued):
+        # The last query finishing means all the others have
+        if not GL.glGetQueryObjectiv(issued[-1][1], GL.GL_QUERY_RESULT_AVAILABLE):
+            return
+        total = 0.0
+        for name, query in issued:
+            seconds = 1e-9 * GL.glGetQueryObjectui64v(query, GL.GL_QUERY_RESULT)
+            profiler.addTime('gpu/' + name, seconds)
+            total += seconds
+        profiler.addTime('gpu', total)
+
+    def begin(self, name):
+        queries = self.queries[self.slot]
+        issued = self.issued[self.slot]
+        if len(issued) == len(queries):
+            queries.append(GL.glGenQueries(1))
+        query = queries[len(issued)]
+        issued.append((name, query))
+        GL.glBeginQuery(GL.GL_TIME_ELAPSED, query)
+
+    def end(self):
+        GL.glEndQuery(GL.GL_TIME_ELAPSED)
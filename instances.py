@@ -0,0 +1,164 @@
+import numpy
+from maths import TranslateBatch
+
+IDENTITY_STACK = numpy.identity(4, dtype=numpy.float32)[None]
+
+
+def asMatrixStack(transforms):
+    '''
+    Returns an (N,4,4) float32 array from a 4x4 matrix or a stack of them.
+    '''
+    return numpy.asarray(transforms, dtype=numpy.float32).reshape((-1, 4, 4))
+
+
+def asTransformStack(transforms):
+    '''
+    Returns an (N,4,4) float32 array from a transform (or batch of them),
+    a stack of matrices or an (N,3) array of translations.
+    '''
+    if hasattr(transforms, 'getMatrices'):
+        return transforms.getMatrices()
+    transforms = numpy.asarray(transforms, dtype=numpy.float32)
+    if transforms.ndim == 2 and transforms.shape[1] == 3:
+        return TranslateBatch(transforms).getMatrices()
+    return asMatrixStack(transforms)
+
+
+def asParamValue(value):
+    return numpy.asarray(value, dtype=numpy.float32).reshape((-1,))
+
+
+def broadcastParam(values, count):
+    '''
+    Returns a (values, mask) param for count instances that all set it, from
+    either one value for all of them or an (N,k) array with one row each.
+    '''
+    values = numpy.asarray(values, dtype=numpy.float32)
+    if values.ndim <= 1:
+        values = numpy.tile(values.reshape((1, -1)), (count, 1))
+    else:
+        values = values.reshape((count, -1))
+    return values, numpy.ones((count,), dtype=bool)
+
+
+def paramArrays(paramDicts):
+    '''
+    Turns a list of N params dicts into {name: (values, mask)}, where
+    values is an (N,k) float32 array and mask is an (N,) bool array that
+    is set where that dict has the param.
+    '''
+    names = set()
+    for params in paramDicts:
+        names.update(params)
+
+    arrays = {}
+    for name in names:
+        mask = numpy.array([name in params for params in paramDicts], dtype=bool)
+        setValues = [asParamValue(params[name]) for params in paramDicts if name in params]
+        values = numpy.zeros((len(paramDicts), len(setValues[0])), dtype=numpy.float32)
+        values[mask] = setValues
+        arrays[name] = (values, mask)
+    return arrays
+
+
+class InstanceBlock(object):
+    '''
+    A batch of instances of one primitive. matrices is an (N,4,4) float32
+    stack of model matrices and params maps each param name to a
+    (values, mask) pair, where values is (N,k) and mask says which
+    instances have the param set. Params set closer to the primitive win
+    over ones inherited from further up the tree.
+    '''
+
+    def __init__(self, matrices, params=None):
+        self.matrices = matrices
+        self.params = params if params is not None else {}
+
+    @classmethod
+    def single(cls, transform=None, params=None):
+        matrices = IDENTITY_STACK if transform is None else asMatrixStack(transform)
+        return cls(matrices, paramArrays([params]) if params else {})
+
+    def __len__(self):
+        return len(self.matrices)
+
+    def repeated(self, transforms, params=None):
+        '''
+        Returns len(transforms) copies of this block, copy i moved by
+        transforms[i] with params[name] = (values, mask) inherited
+        from row i wherever the copy doesn't set the param itself.
+        '''
+        transforms = asMatrixStack(transforms)
+        count, size = len(transforms), len(self)
+
+        # One batched multiply for every (transform, instance) pair
+        matrices = numpy.matmul(transforms[:, None], self.matrices[None]).reshape((-1, 4, 4))
+
+        newParams = {}
+        for name, (values, mask) in self.params.iteritems():
+            newParams[name] = (
+                numpy.tile(values, (count, 1)),
+                numpy.tile(mask, count)
+            )
+
+        for name, (inheritedValues, inheritedMask) in (params or {}).iteritems():
+            inheritedValues = numpy.repeat(inheritedValues, size, axis=0)
+            inheritedMask = numpy.repeat(inheritedMask, size)
+            if name in newParams:
+                values, mask = newParams[name]
+                fill = inheritedMask & ~mask
+                values[fill] = inheritedValues[fill]
+                newParams[name] = (values, mask | fill)
+            else:
+                newParams[name] = (inheritedValues, inheritedMask)
+
+        return InstanceBlock(matrices, newParams)
+
+    def transformed(self, transform, params=None):
+        '''
+        Like repeated, but with a single transform and a params dict.
+        '''
+        return self.repeated(transform, paramArrays([params]) if params else None)
+
+    def slice(self, start, end):
+        '''
+        Returns the instances from start up to end, sharing this block's
+        arrays.
+        '''
+        return InstanceBlock(self.matrices[start:end], dict(
+            (name, (values[start:end], mask[start:end]))
+            for name, (values, mask) in self.params.iteritems()
+        ))
+
+    def param(self, name):
+        '''
+        Returns the (N,k) values of a param that every instance must have.
+        '''
+        values, mask = self.params.get(name, (None, None))
+        if mask is None or not mask.all():
+            raise KeyError(name)
+        return values
+
+    @classmethod
+    def concatenate(cls, blocks):
+        if len(blocks) == 1:
+            return blocks[0]
+
+        widths = {}
+        for block in blocks:
+            for name, (values, _) in block.params.iteritems():
+                widths[name] = values.shape[1]
+
+        params = {}
+        for name, width in widths.iteritems():
+            allValues, allMasks = [], []
+            for block in blocks:
+                values, mask = block.params.get(name, (None, None))
+                if values is None:
+                    values = numpy.zeros((len(block), width), dtype=numpy.float32)
+                    mask = numpy.zeros((len(block),), dtype=bool)
+                allValues.append(values)
+                allMasks.append(mask)
+            params[name] = (numpy.concatenate(allValues), numpy.concatenate(allMasks))
+
+        return cls(numpy.concatenate([block.matrices for block in blocks]), params)
@@ -1,10 +1,30 @@
+import os
 import math
+import numpy
 import maths
 import random
+import shutil
 import common
+import tempfile
 import compound
 import primitives
+import gl_backend
+import multiprocessing
 import registered_type
+from instances import InstanceBlock
+
+# Where workers leave the arrays they build, for the main process to map
+SHARED_MEMORY_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+# With fewer primitive instances than this in all, starting the pool and
+# passing the arrays back is taken to cost more than flattening in
+# parallel saves. This is a guess and hasn't been measured
+MIN_PARALLEL_INSTANCES = 500000
+
+# The jobs, and the objects made for them so far, in a worker; inherited
+# from the main process
+WORKER_JOBS = None
+WORKER_OBJECTS = None
 
 
 class MissingMainException(Exception):
@@ -45,3 +65,154 @@ def loadObjectFromModule(moduleName):
         raise MissingMainException()
 
     return module.main()
+
+
+def writeShared(directory, name, array):
+    '''
+    Writes array to a file in directory that another process can map with
+    readShared, and returns its path.
+    '''
+    path = os.path.join(directory, '%s.npy' % name)
+    shared = numpy.lib.format.open_memmap(path, mode='w+', dtype=array.dtype, shape=array.shape)
+    shared[...] = array
+    shared.flush()
+    return path
+
+def readShared(path):
+    '''
+    Maps an array written by writeShared. The file is removed straight
+    away; its memory lasts as long as the array does.
+    '''
+    array = numpy.load(path, mmap_mode='c')
+    os.unlink(path)
+    return array
+
+def buildObjects(jobs):
+    '''
+    Makes the object of each job, along with everything that flattening
+    parts of it needs, so that workers forked afterwards share them
+    rather than each making them again.
+    '''
+    objects = []
+    for makeObject, _, _ in jobs:
+        obj = makeObject()
+        if isinstance(obj, compound.Compound):
+            for group in obj.groups.itervalues():
+                group.block()
+                group.obj.flatten()
+        objects.append(obj)
+    return objects
+
+def placedInstances(jobs, objects):
+    '''
+    Flattens and places the object of each job, here, and returns
+    {primitive: InstanceBlock}.
+    '''
+    blocks = {}
+    for obj, (_, transform, params) in zip(objects, jobs):
+        for primitive, block in obj.flatten().iteritems():
+            blocks.setdefault(primitive, []).append(block.transformed(transform, params))
+    return dict((primitive, InstanceBlock.concatenate(b)) for primitive, b in blocks.iteritems())
+
+def startWorker(jobs, objects):
+    # Workers must never touch the main process's GL context
+    gl_backend.use(gl_backend.NullBackend())
+    registered_type.afterFork()
+    global WORKER_JOBS, WORKER_OBJECTS
+    WORKER_JOBS, WORKER_OBJECTS = jobs, list(objects)
+
+def flattenPart(args):
+    '''
+    Runs in a worker: makes one job's object, unless the main process
+    made it already, flattens the part'th of numParts of it, places it
+    and writes each primitive's instance arrays to directory. Returns
+    [(primitive registry key, matrices path, {param: (values path, mask
+    path)})].
+    '''
+    jobIndex, part, numParts, directory = args
+    makeObject, transform, params = WORKER_JOBS[jobIndex]
+    obj = WORKER_OBJECTS[jobIndex]
+    if obj is None:
+        obj = WORKER_OBJECTS[jobIndex] = makeObject()
+    if isinstance(obj, compound.Compound):
+        flattened = obj.flattenPart(part, numParts)
+    else:
+        flattened = obj.flatten() if part == 0 else {}
+
+    results = []
+    for i, (primitive, block) in enumerate(flattened.iteritems()):
+        block = block.transformed(transform, params)
+        prefix = '%s-%s-%s' % (jobIndex, part, i)
+        results.append((
+            primitive.registryKey,
+            writeShared(directory, prefix + '-matrices', block.matrices),
+            dict(
+                (name, (
+                    writeShared(directory, '%s-%s-values' % (prefix, name), values),
+                    writeShared(directory, '%s-%s-mask' % (prefix, name), mask)
+                ))
+                for name, (values, mask) in block.params.iteritems()
+            )
+        ))
+    return results
+
+def flattenInParallel(jobs, processes=None):
+    '''
+    Makes, flattens and places top-level objects across a pool of worker
+    processes, and returns {primitive: InstanceBlock} of all of their
+    instances. jobs is [(makeObject, transform matrix, params)], each as
+    it would be passed to AssetPipeline.loadObject, so this can be handed
+    to AssetPipeline.load.
+
+    With at least as many jobs as processes, each worker makes the objects
+    of the jobs it is given, so that their construction runs in parallel
+    too. With fewer, the objects are made here before the pool is started
+    and every worker flattens an equal part of each, as making an object
+    once per part would cost more than it saves. Workers send instance
+    arrays back through shared memory rather than pickling them, and the
+    primitives are fetched here by registry key. With one process, or
+    fewer than MIN_PARALLEL_INSTANCES instances in objects made here,
+    everything is done here.
+    '''
+    processes = processes or multiprocessing.cpu_count()
+    if processes == 1:
+        return placedInstances(jobs, [makeObject() for makeObject, _, _ in jobs])
+
+    if len(jobs) >= processes:
+        objects, numParts = [None] * len(jobs), 1
+    else:
+        objects = buildObjects(jobs)
+        if sum(obj.primCount for obj in objects) < MIN_PARALLEL_INSTANCES:
+            return placedInstances(jobs, objects)
+        numParts = -(-processes // len(jobs))
+
+    blocks = {}
+    directory = tempfile.mkdtemp(prefix='architect-', dir=SHARED_MEMORY_DIR)
+    pool = multiprocessing.Pool(processes, initializer=startWorker, initargs=(jobs, objects))
+    try:
+        tasks = [
+            (jobIndex, part, numParts, directory)
+            for jobIndex in xrange(len(jobs))
+            for part in xrange(numParts)
+        ]
+        for results in pool.imap(flattenPart, tasks):
+            for key, matricesPath, paramPaths in results:
+                params = dict(
+                    (name, (readShared(valuesPath), readShared(maskPath)))
+                    for name, (valuesPath, maskPath) in paramPaths.iteritems()
+                )
+                primitive = registered_type.getInstanceByKey(key)
+                blocks.setdefault(primitive, []).append(InstanceBlock(readShared(matricesPath), params))
+    finally:
+        pool.terminate()
+        pool.join()
+        shutil.rmtree(directory, ignore_errors=True)
+    return dict((primitive, InstanceBlock.concatenate(b)) for primitive, b in blocks.iteritems())
+
+def addToGroupInParallel(group, jobs, processes=None):
+    '''
+    Adds the instances of jobs to a DisplayGroup, made as by
+    flattenInParallel.
+    '''
+    for primitive, block in flattenInParallel(jobs, processes).iteritems():
+        group.addInstances(primitive, block)
@@ -4,29 +4,27 @@ OpenGL.FULL_LOGGING = False
 
 import pygame
 import pygame.locals
-import OpenGL.GL as GL
+from gl_backend import GL
 import common
 import maths
 import camera
 import display_group
-import traceback, sys
+import asset_pipeline
+import profiler
+import traceback, sys, os
 
-from shaders import BlinnWithNormalsProgram
-from shaders import BlinnWithoutNormalsProgram
-
-def testLoadedGroup():
-    group = display_group.DisplayGroup()
+def testLoadedGroup(pipeline):
     import loader
-    #obj = loader.loadObjectFromFile('data.py')
-    obj = loader.loadObjectFromModule('data')
-    obj.addToGroup(
-        group,
-        maths.Scale(0.3, 0.3, 0.3).getMatrix(),
+    from functools import partial
+    #makeObject = partial(loader.loadObjectFromFile, 'data.py')
+    makeObject = partial(loader.loadObjectFromModule, 'data')
+    params = dict(
         ambient=maths.Vec3(0.0, 0.0, 0.0),
         diffuse=maths.Vec3(1.5, 0.5, 0.5),
         specular=maths.Vec4(0.0, 1.0, 1.0, 32.0),
     )
-    return group
+    # Made and flattened across a process pool, off the main thread
+    pipeline.load(loader.flattenInParallel, [(makeObject, maths.Scale(0.3, 0.3, 0.3).getMatrix(), params)])
 
 def main():
 
@@ -44,41 +42,51 @@ def main():
 
     common.getAndResetMouse()
 
-    group = testLoadedGroup()
-    group.setModelMatrixBuffers()
-
-    lightDir = (0.5, 0.5, 0.5) # TOWARDS the light
-
-    # Set up colours
-    for program in (
-        BlinnWithoutNormalsProgram.get(),
-        BlinnWithNormalsProgram.get()
-    ):
-        GL.glUseProgram(program.program)
-        GL.glUniform3f(program.uniform_lightDir, *lightDir) # TOWARDS the light
+    # The scene loads in the background and appears as it is ready
+    group = display_group.DisplayGroup()
+    pipeline = asset_pipeline.AssetPipeline(group)
+    testLoadedGroup(pipeline)
 
+    group.setLightDirection((0.5, 0.5, 0.5)) # TOWARDS the light
 
     while True:
+        profiler.beginFrame()
+
         # Recalculate from inputs
-        events = common.getEvents()
-        inputStatus.handleEvents(events)
+        with profiler.scope('events'):
+            events = common.getEvents()
+            inputStatus.handleEvents(events)
 
-        inputStatus.mouseDx, inputStatus.mouseDy = common.getAndResetMouse()
+            inputStatus.mouseDx, inputStatus.mouseDy = common.getAndResetMouse()
 
         elapsed = 0.001 * (pygame.time.get_ticks() - startTime)
-        cam.update(elapsed - lastElapsed, inputStatus)
+        with profiler.scope('camera'):
+            cam.update(elapsed - lastElapsed, inputStatus)
         lastElapsed = elapsed
 
-        group.updateUniforms(cam.position, cam.viewMatrix, common.projMatrix)
+        with profiler.scope('load'):
+            pipeline.update()
+
+        with profiler.scope('updateUniforms'):
+            group.updateUniforms(cam.position, cam.viewMatrix, common.projMatrix)
 
         # Clear and redraw
-        GL.glClear(GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT)
-        group.draw()
+        with profiler.scope('draw'):
+            GL.glClear(GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT)
+            group.draw()
 
-        pygame.display.flip()
+        with profiler.scope('flip'):
+            pygame.display.flip()
+
+        profiler.endFrame()
 
 CATCHING_EXCEPTIONS = True
 
+def reportProfile():
+    if profiler.ENABLED:
+        print(profiler.PROFILER.report())
+        profiler.export(os.environ.get('ARCHITECT_PROFILE') or 'profile')
+
 def handleException(e):
     excType, excValue, excTraceback = sys.exc_info()
     if isinstance(e, common.ShaderCompileError):
@@ -97,9 +105,11 @@ if __name__ == '__main__':
         except Exception as e:
             handleException(e)
         finally:
+            reportProfile()
             pygame.quit()
     else:
         try:
             main()
         finally:
+            reportProfile()
             pygame.quit()
\ No newline at end of file
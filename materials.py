@@ -0,0 +1,99 @@
+import numpy
+import profiler
+from gl_backend import GL
+
+# Shader storage binding point of the table; matches the shaders' Materials block
+MATERIAL_BINDING = 0
+
+# One std430 Material struct: ambient, diffuse and specular as vec4s,
+# with the specular exponent in specular.a
+MATERIAL_DTYPE = numpy.dtype([
+    ('ambient', numpy.float32, 4),
+    ('diffuse', numpy.float32, 4),
+    ('specular', numpy.float32, 4),
+])
+
+
+def materialRows(block):
+    '''
+    Returns the MATERIAL_DTYPE record of each instance in an InstanceBlock.
+    '''
+    rows = numpy.zeros(len(block), dtype=MATERIAL_DTYPE)
+    rows['ambient'][:, :3] = block.param('ambient')[:, :3]
+    rows['diffuse'][:, :3] = block.param('diffuse')[:, :3]
+    rows['specular'] = block.param('specular')[:, :4]
+    return rows
+
+
+class MaterialTable(object):
+    '''
+    The distinct materials used by a set of instances, each stored once
+    and referred to by its index. The table lives in a shader storage
+    buffer that the shaders look materials up in.
+    '''
+
+    def __init__(self):
+        self.materials = numpy.zeros((0,), dtype=MATERIAL_DTYPE)
+        # {material record bytes: index}
+        self.indices = {}
+        self.buffer = None
+        self.numUploaded = 0
+
+    def __len__(self):
+        return len(self.materials)
+
+    def intern(self, block):
+        '''
+        Adds any new materials used by an InstanceBlock to the table, and
+        returns a uint32 array of each instance's material index.
+        '''
+        rows = materialRows(block)
+        keys = rows.view(numpy.dtype((numpy.void, MATERIAL_DTYPE.itemsize)))
+        unique, first, inverse = numpy.unique(keys, return_index=True, return_inverse=True)
+
+        # Only the few distinct materials go through Python
+        uniqueIndices = numpy.empty((len(unique),), dtype=numpy.uint32)
+        newRows = []
+        for i, key in enumerate(unique):
+            key = key.tobytes()
+            index = self.indices.get(key)
+            if index is None:
+                self.indices[key] = index = len(self.materials) + len(newRows)
+                newRows.append(first[i])
+            uniqueIndices[i] = index
+        if newRows:
+            self.materials = numpy.concatenate((self.materials, rows[newRows]))
+
+        return uniqueIndices[inverse]
+
+    def internMaterial(self, ambient, diffuse, specular):
+        '''
+        Returns the index of one material, adding it if it's new.
+        '''
+        record = numpy.zeros((1,), dtype=MATERIAL_DTYPE)
+        record['ambient'][0, :3] = ambient[:3]
+        record['diffuse'][0, :3] = diffuse[:3]
+        record['specular'][0] = specular[:4]
+        key = record.tobytes()
+        index = self.indices.get(key)
+        if index is None:
+            self.indices[key] = index = len(self.materials)
+            self.materials = numpy.concatenate((self.materials, record))
+        return index
+
+    def upload(self):
+        '''
+        Sends the table to the GL if it has grown since the last upload.
+        '''
+        if self.buffer is None:
+            self.buffer = GL.glGenBuffers(1)
+        if self.numUploaded == len(self.materials) or not len(self.materials):
+            return
+        GL.glBindBuffer(GL.GL_SHADER_STORAGE_BUFFER, self.buffer)
+        GL.glBufferData(GL.GL_SHADER_STORAGE_BUFFER, self.materials.nbytes, self.materials, GL.GL_STATIC_DRAW)
+        GL.glBindBuffer(GL.GL_SHADER_STORAGE_BUFFER, 0)
+        self.numUploaded = len(self.materials)
+        profiler.count('bytesUploaded', self.materials.nbytes)
+
+    def bind(self):
+        GL.glBindBufferBase(GL.GL_SHADER_STORAGE_BUFFER, MATERIAL_BINDING, self.buffer)
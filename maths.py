@@ -1,7 +1,5 @@
 import math
 import numpy
-import numpy.matlib
-import operator
 
 def Vec3(x, y, z):
     return numpy.array([x, y, z], dtype=numpy.float32)
@@ -13,15 +11,19 @@ def normalise(v):
     return v / numpy.linalg.norm(v)
 
 def zeroMatrix(size):
-    return numpy.matlib.zeros(size, dtype=numpy.float32)
+    return numpy.zeros(size, dtype=numpy.float32)
 
 def identityMatrix(size):
-    return numpy.matlib.identity(size, dtype=numpy.float32)
+    return numpy.identity(size, dtype=numpy.float32)
 
-IDENTITY = identityMatrix(4)
+def readOnly(array):
+    array.setflags(write=False)
+    return array
+
+IDENTITY = readOnly(identityMatrix(4))
 
 def lookAt(position, direction, up):
-    V = numpy.matlib.identity(4, dtype=numpy.float32)
+    V = identityMatrix(4)
     direction /= numpy.linalg.norm(direction)
 
     s = numpy.cross(direction, up)
@@ -38,8 +40,25 @@ def lookAt(position, direction, up):
 
     return V
 
+# Transforms are immutable. Each builds its (read-only) matrix the first
+# time it's asked for, and keeps it. The batch forms hold arrays of
+# parameters and build an (N,4,4) stack of matrices in one go.
+
+
+class Transform(object):
+    __slots__ = ('_matrix',)
+
+    def getMatrix(self):
+        if self._matrix is None:
+            self._matrix = readOnly(self.buildMatrix())
+        return self._matrix
+
+    def getMatrices(self):
+        '''
+        Returns the transform as an (N,4,4) stack, N being 1 for a single transform.
+        '''
+        return self.getMatrix()[None]
 
-class SimpleTransform(object):
     def __and__(self, other):
         if isinstance(other, CompoundTransform):
             return CompoundTransform([self] + other.transforms)
@@ -47,11 +66,45 @@ class SimpleTransform(object):
             return CompoundTransform([self, other])
 
 
-class CompoundTransform(object):
+class SimpleTransform(Transform):
+    __slots__ = ()
+
+
+class TransformBatch(Transform):
+    __slots__ = ()
+
+    def getMatrix(self):
+        raise TypeError('%s holds several transforms; use getMatrices' % self.__class__.__name__)
+
+    def getMatrices(self):
+        if self._matrix is None:
+            self._matrix = readOnly(self.buildMatrices())
+        return self._matrix
+
+    def __len__(self):
+        return len(self.getMatrices())
+
+
+class CompoundTransform(Transform):
+    '''
+    Applies its transforms right to left, like multiplying their matrices.
+    If any of them is a batch, use getMatrices to get the composed stack.
+    '''
+    __slots__ = ('transforms',)
+
     def __init__(self, transforms):
+        self._matrix = None
         self.transforms = transforms
-    def getMatrix(self):
-        return reduce(operator.mul, (t.getMatrix() for t in self.transforms))
+    def buildMatrix(self):
+        matrices = [t.getMatrix() for t in self.transforms]
+        return matrices[0] if len(matrices) == 1 else numpy.linalg.multi_dot(matrices)
+    def getMatrices(self):
+        if not any(isinstance(t, (TransformBatch, CompoundTransform)) for t in self.transforms):
+            return self.getMatrix()[None]
+        result = self.transforms[0].getMatrices()
+        for t in self.transforms[1:]:
+            result = numpy.matmul(result, t.getMatrices())
+        return result
     def __and__(self, other):
         if isinstance(other, CompoundTransform):
             return CompoundTransform(self.transforms + other.transforms)
@@ -61,123 +114,179 @@ class CompoundTransform(object):
         return ', '.join(repr(t) for t in self.transforms)
 
 
+def translationMatrices(x, y, z):
+    x, y, z = numpy.broadcast_arrays(x, y, z)
+    M = numpy.zeros(x.shape + (4, 4), dtype=numpy.float32)
+    M[..., 0, 0] = M[..., 1, 1] = M[..., 2, 2] = M[..., 3, 3] = 1.0
+    M[..., 0, 3], M[..., 1, 3], M[..., 2, 3] = x, y, z
+    return M
+
+def scaleMatrices(x, y, z):
+    x, y, z = numpy.broadcast_arrays(x, y, z)
+    M = numpy.zeros(x.shape + (4, 4), dtype=numpy.float32)
+    M[..., 0, 0], M[..., 1, 1], M[..., 2, 2] = x, y, z
+    M[..., 3, 3] = 1.0
+    return M
+
+def rotationMatrices(angles, axis):
+    '''
+    Rotations by each of angles (radians, any shape) about the unit vector
+    axis, following the right hand rule.
+    '''
+    x, y, z = axis
+    c, s = numpy.cos(angles), numpy.sin(angles)
+    cx, cy, cz = (1-c)*x, (1-c)*y, (1-c)*z
+    M = numpy.zeros(numpy.shape(angles) + (4, 4), dtype=numpy.float32)
+    M[..., 0, 0], M[..., 0, 1], M[..., 0, 2] =   cx*x + c, cy*x - z*s, cz*x + y*s
+    M[..., 1, 0], M[..., 1, 1], M[..., 1, 2] = cx*y + z*s,   cy*y + c, cz*y - x*s
+    M[..., 2, 0], M[..., 2, 1], M[..., 2, 2] = cx*z - y*s, cy*z + x*s,   cz*z + c
+    M[..., 3, 3] = 1.0
+    return M
+
+
+X_AXIS = (1.0, 0.0, 0.0)
+Y_AXIS = (0.0, 1.0, 0.0)
+Z_AXIS = (0.0, 0.0, 1.0)
+
+
 class Translate(SimpleTransform):
+    __slots__ = ('x', 'y', 'z')
+
     def __init__(self, x, y, z):
+        self._matrix = None
         self.x, self.y, self.z = x, y, z
-    def getMatrix(self):
-        return numpy.matrix(
-            [
-                [ 1, 0, 0, self.x],
-                [ 0, 1, 0, self.y],
-                [ 0, 0, 1, self.z],
-                [ 0, 0, 0,      1]
-            ],
-            dtype=numpy.float32
-        )
+    def buildMatrix(self):
+        M = identityMatrix(4)
+        M[0,3], M[1,3], M[2,3] = self.x, self.y, self.z
+        return M
 
     def __repr__(self):
         return 'Translate(%s, %s, %s)' % (self.x, self.y, self.z)
 
 
 class Scale(SimpleTransform):
+    __slots__ = ('x', 'y', 'z')
+
     def __init__(self, x, y, z):
+        self._matrix = None
         self.x, self.y, self.z = x, y, z
-    def getMatrix(self):
-        return numpy.matrix(
-            [
-                [self.x,      0,      0, 0],
-                [     0, self.y,      0, 0],
-                [     0,      0, self.z, 0],
-                [     0,      0,      0, 1]
-            ],
-            dtype=numpy.float32
-        )
+    def buildMatrix(self):
+        M = identityMatrix(4)
+        M[0,0], M[1,1], M[2,2] = self.x, self.y, self.z
+        return M
     def __repr__(self):
         return 'Scale(%s, %s, %s)' % (self.x, self.y, self.z)
 
 
 class RotateX(SimpleTransform):
+    __slots__ = ('angle',)
+
     def __init__(self, angle):
+        self._matrix = None
         self.angle = angle
 
-    def getMatrix(self):
-        cosT, sinT = math.cos(self.angle), math.sin(self.angle)
-        return numpy.matrix(
-            [
-                [1.0,  0.0,   0.0, 0.0],
-                [0.0, cosT, -sinT, 0.0],
-                [0.0, sinT,  cosT, 0.0],
-                [0.0,  0.0,   0.0, 1.0]
-            ],
-            dtype=numpy.float32
-        )
+    def buildMatrix(self):
+        return rotationMatrices(self.angle, X_AXIS)
 
     def __repr__(self):
         return 'RotateX(%s)' % self.angle
 
 
 class RotateY(SimpleTransform):
+    __slots__ = ('angle',)
+
     def __init__(self, angle):
+        self._matrix = None
         self.angle = angle
 
-    def getMatrix(self):
-        cosT, sinT = math.cos(self.angle), math.sin(self.angle)
-        return numpy.matrix(
-            [
-                [ cosT, 0.0, sinT, 0.0],
-                [ 0.0,  1.0,  0.0, 0.0],
-                [-sinT, 0.0, cosT, 0.0],
-                [ 0.0,  0.0,  0.0, 1.0]
-            ],
-            dtype=numpy.float32
-        )
+    def buildMatrix(self):
+        return rotationMatrices(self.angle, Y_AXIS)
 
     def __repr__(self):
         return 'RotateY(%s)' % self.angle
 
 
 class RotateZ(SimpleTransform):
+    __slots__ = ('angle',)
+
     def __init__(self, angle):
+        self._matrix = None
         self.angle = angle
 
-    def getMatrix(self):
-        cosT, sinT = math.cos(self.angle), math.sin(self.angle)
-        return numpy.matrix(
-            [
-                [cosT, -sinT, 0.0, 0.0],
-                [sinT,  cosT, 0.0, 0.0],
-                [ 0.0,   0.0, 1.0, 0.0],
-                [ 0.0,   0.0, 0.0, 1.0]
-            ],
-            dtype=numpy.float32
-        )
+    def buildMatrix(self):
+        return rotationMatrices(self.angle, Z_AXIS)
 
     def __repr__(self):
         return 'RotateZ(%s)' % self.angle
 
 
 class Rotate(SimpleTransform):
+    __slots__ = ('angle', 'x', 'y', 'z')
+
     def __init__(self, angle, axis):
+        self._matrix = None
         self.angle = angle
         axis = normalise(axis)
         self.x, self.y, self.z = axis[0], axis[1], axis[2]
 
-    def getMatrix(self):
-        c, s = math.cos(self.angle), math.sin(self.angle)
-        cx, cy, cz = (1-c)*self.x, (1-c)*self.y, (1-c)*self.z
-        return numpy.matrix(
-            [
-                [       cx*self.x + c, cy*self.x - self.z*s, cz*self.x + self.y*s, 0.0],
-                [cx*self.y + self.z*s,        cy*self.y + c, cz*self.y - self.x*s, 0.0],
-                [cx*self.z - self.y*s, cy*self.z + self.x*s,        cz*self.z + c, 0.0],
-                [                 0.0,                  0.0,                  0.0, 1.0]
-            ],
-            dtype=numpy.float32
-        )
+    def buildMatrix(self):
+        return rotationMatrices(self.angle, (self.x, self.y, self.z))
 
     def __repr__(self):
         return 'Rotate(angle=%s, axis=(%s, %s, %s))' % (self.angle, self.x, self.y, self.z)
 
+
+class TranslateBatch(TransformBatch):
+    __slots__ = ('offsets',)
+
+    def __init__(self, offsets):
+        '''
+        offsets is an (N,3) array of translations.
+        '''
+        self._matrix = None
+        self.offsets = numpy.asarray(offsets, dtype=numpy.float32).reshape((-1, 3))
+
+    def buildMatrices(self):
+        return translationMatrices(self.offsets[:, 0], self.offsets[:, 1], self.offsets[:, 2])
+
+    def __repr__(self):
+        return 'TranslateBatch(%s offsets)' % len(self.offsets)
+
+
+class ScaleBatch(TransformBatch):
+    __slots__ = ('factors',)
+
+    def __init__(self, factors):
+        '''
+        factors is an (N,3) array of per-axis scale factors.
+        '''
+        self._matrix = None
+        self.factors = numpy.asarray(factors, dtype=numpy.float32).reshape((-1, 3))
+
+    def buildMatrices(self):
+        return scaleMatrices(self.factors[:, 0], self.factors[:, 1], self.factors[:, 2])
+
+    def __repr__(self):
+        return 'ScaleBatch(%s factors)' % len(self.factors)
+
+
+class RotateBatch(TransformBatch):
+    __slots__ = ('angles', 'axis')
+
+    def __init__(self, angles, axis):
+        '''
+        angles is an (N,) array of angles about the shared axis.
+        '''
+        self._matrix = None
+        self.angles = numpy.asarray(angles, dtype=numpy.float64).reshape((-1,))
+        self.axis = tuple(normalise(numpy.asarray(axis, dtype=numpy.float64)))
+
+    def buildMatrices(self):
+        return rotationMatrices(self.angles, self.axis)
+
+    def __repr__(self):
+        return 'RotateBatch(%s angles, axis=(%s, %s, %s))' % ((len(self.angles),) + self.axis)
+
 '''
 
 def ortho(left, right, bottom, top, znear, zfar):
@@ -213,7 +322,7 @@ def frustum(left, right, bottom, top, znear, zfar):
 
 def perspective(fovy, ar, n, f):
     h = 1.0 / math.tan(0.5 * fovy)
-    return numpy.matrix(
+    return numpy.array(
         [
             [ h / ar, 0.0,               0.0,                     0.0],
             [    0.0,   h,               0.0,                     0.0],
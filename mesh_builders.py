@@ -0,0 +1,161 @@
+import numpy
+
+# Triangles of a box whose corner i is at ((i>>2)&1, (i>>1)&1, i&1)
+BOX_INDICES = numpy.array(
+    [
+        1, 5, 7, 7, 3, 1, # Front
+        3, 7, 6, 6, 2, 3, # Top
+        0, 1, 3, 3, 2, 0, # Left
+        5, 4, 6, 6, 7, 5, # Right
+        4, 0, 2, 2, 6, 4, # Back
+        0, 4, 5, 5, 1, 0, # Bottom
+    ],
+    dtype=numpy.uint32
+)
+
+
+def gridIndices(numX, numY, start=0):
+    '''
+    Triangle indices for a numX by numY grid of vertices stored row by row
+    (x varying fastest), counter-clockwise when x is right and y is up.
+    '''
+    rowStarts = start + numX * numpy.arange(numY - 1, dtype=numpy.uint32)
+    cells = (rowStarts[:, None] + numpy.arange(numX - 1, dtype=numpy.uint32)).reshape((-1, 1))
+    return (cells + numpy.array([0, 1, numX, numX, 1, numX + 1], dtype=numpy.uint32)).reshape((-1,))
+
+
+def grid(xSize, ySize, numX, numY):
+    '''
+    A flat numX by numY grid of vertices covering [0, xSize] x [0, ySize]
+    in the z=0 plane, facing +z. Returns (vertices, indices).
+    '''
+    vertices = numpy.zeros((numY, numX, 3), dtype=numpy.float32)
+    vertices[:, :, 0] = numpy.linspace(0.0, xSize, numX, dtype=numpy.float32)[None, :]
+    vertices[:, :, 1] = numpy.linspace(0.0, ySize, numY, dtype=numpy.float32)[:, None]
+    return vertices.reshape((-1, 3)), gridIndices(numX, numY)
+
+
+def heightfield(heights, xSize, ySize):
+    '''
+    Like grid, but with z taken from heights, a (numY, numX) array.
+    '''
+    numY, numX = heights.shape
+    vertices, indices = grid(xSize, ySize, numX, numY)
+    vertices[:, 2] = heights.reshape((-1,))
+    return vertices, indices
+
+
+def jitter(vertices, maxOffset, scale=None):
+    '''
+    Moves every coordinate of vertices in place by normally distributed
+    noise (standard deviation scale, default 0.7*maxOffset) clipped to
+    [-maxOffset, maxOffset].
+    '''
+    if scale is None:
+        scale = 0.7 * maxOffset
+    vertices += numpy.clip(numpy.random.normal(scale=scale, size=vertices.shape), -maxOffset, maxOffset)
+    return vertices
+
+
+def box(xSize=1.0, ySize=1.0, zSize=1.0):
+    '''
+    An axis-aligned box from the origin to (xSize, ySize, zSize).
+    Returns (vertices, indices).
+    '''
+    corners = numpy.arange(8)
+    vertices = numpy.empty((8, 3), dtype=numpy.float32)
+    vertices[:, 0] = xSize * ((corners >> 2) & 1)
+    vertices[:, 1] = ySize * ((corners >> 1) & 1)
+    vertices[:, 2] = zSize * (corners & 1)
+    return vertices, BOX_INDICES.copy()
+
+
+def fanIndices(start, count, reverse=False):
+    '''
+    Triangle fan over count vertices starting at index start, for capping
+    a convex polygon.
+    '''
+    second = start + numpy.arange(1, count - 1, dtype=numpy.uint32)
+    fan = numpy.empty((count - 2, 3), dtype=numpy.uint32)
+    fan[:, 0] = start
+    fan[:, 1], fan[:, 2] = (second + 1, second) if reverse else (second, second + 1)
+    return fan.reshape((-1,))
+
+
+def loft(rings, closed=True, capStart=False, capEnd=False):
+    '''
+    Joins a sequence of rings, an (R, K, 3) array of R rings of K points,
+    with a band of quads between each ring and the next. Corresponding
+    points of neighbouring rings are joined, so a ring may collapse several
+    points onto one (e.g. a roof ridge); the degenerate triangles this
+    makes are dropped. If closed, the last point of each ring is joined to
+    the first. The caps fan-triangulate the first and last rings, which
+    must then be convex.
+
+    The bands face outwards when going from point k to k+1 is
+    counter-clockwise seen from the end of the loft. Returns
+    (vertices, indices).
+    '''
+    rings = numpy.asarray(rings, dtype=numpy.float32)
+    numRings, numPoints = rings.shape[:2]
+
+    this = numpy.arange(numPoints if closed else numPoints - 1, dtype=numpy.uint32)
+    following = (this + 1) % numPoints
+
+    # One row per quad: this ring's two points, then the next ring's two
+    ringStarts = numPoints * numpy.arange(numRings - 1, dtype=numpy.uint32)[:, None]
+    a, b = ringStarts + this, ringStarts + following
+    c, d = b + numPoints, a + numPoints
+    quads = numpy.dstack((a, b, c, c, d, a)).reshape((-1,))
+
+    parts = [quads]
+    if capStart:
+        parts.append(fanIndices(0, numPoints, reverse=True))
+    if capEnd:
+        parts.append(fanIndices((numRings - 1) * numPoints, numPoints))
+
+    return removeDegenerate(rings.reshape((-1, 3)), numpy.concatenate(parts))
+
+
+def extrude(polygon, height):
+    '''
+    Extrudes a convex polygon in the xz plane, given as a (K, 2) array of
+    (x, z) points, from y=0 up to y=height, with both ends capped. The
+    points should go counter-clockwise when seen from above (+y).
+    Returns (vertices, indices).
+    '''
+    polygon = numpy.asarray(polygon, dtype=numpy.float32)
+    rings = numpy.zeros((2, len(polygon), 3), dtype=numpy.float32)
+    rings[:, :, 0] = polygon[:, 0]
+    rings[:, :, 2] = polygon[:, 1]
+    rings[1, :, 1] = height
+    return loft(rings, capStart=True, capEnd=True)
+
+
+def removeDegenerate(vertices, indices, epsilon=1e-12):
+    '''
+    Drops zero-area triangles, then any vertices no longer used.
+    Returns (vertices, indices).
+    '''
+    triangles = indices.reshape((-1, 3))
+    corners = vertices[triangles]
+    doubleAreas = numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    triangles = triangles[(doubleAreas * doubleAreas).sum(axis=1) > epsilon]
+
+    used, remapped = numpy.unique(triangles, return_inverse=True)
+    return vertices[used], remapped.astype(numpy.uint32)
+
+
+def splitFaces(vertices, indices):
+    '''
+    Gives every triangle its own three vertices, so each can carry the
+    triangle's face normal. Returns (vertices, normals, indices).
+    '''
+    corners = numpy.asarray(vertices, dtype=numpy.float32)[numpy.asarray(indices).reshape((-1, 3))]
+    normals = numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    normals /= numpy.maximum(numpy.sqrt((normals * normals).sum(axis=1)), 1e-30)[:, None]
+    return (
+        corners.reshape((-1, 3)),
+        numpy.repeat(normals, 3, axis=0),
+        numpy.arange(3 * len(corners), dtype=numpy.uint32)
+    )
@@ -0,0 +1,149 @@
+import os
+import errno
+import numpy
+import hashlib
+import tempfile
+
+# Bump this whenever a change to the loaders (or to decimate) changes the
+# buffers they produce, so that stale entries stop being found
+LOADER_VERSION = 2
+
+CACHE_DIR = os.environ.get(
+    'ARCHITECT_MESH_CACHE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.mesh_cache')
+)
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+
+ENABLED = True
+
+ARRAY_NAMES = ('vertices', 'indices')
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def fileHash(filename):
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cacheKey(filename, **options):
+    '''
+    Builds a key from the contents of filename, the loader version
+    and any options (such as normals=True) that change the output.
+    '''
+    h = hashlib.sha1(fileHash(filename))
+    h.update(str(LOADER_VERSION))
+    for name, value in sorted(options.iteritems()):
+        h.update('%s=%r' % (name, value))
+    return h.hexdigest()
+
+
+def derivedKey(key, **options):
+    '''
+    Builds a key for buffers made from those cached under key, such as
+    a simplified version of a mesh.
+    '''
+    h = hashlib.sha1(key)
+    for name, value in sorted(options.iteritems()):
+        h.update('%s=%r' % (name, value))
+    return h.hexdigest()
+
+
+def _path(key, arrayName):
+    return os.path.join(CACHE_DIR, '%s.%s.npy' % (key, arrayName))
+
+
+def load(key):
+    '''
+    Returns a read-only, memory-mapped (vertexData, indexData) pair for
+    key, or None if it isn't cached.
+    '''
+    if not ENABLED:
+        return None
+    try:
+        arrays = tuple(numpy.load(_path(key, name), mmap_mode='r') for name in ARRAY_NAMES)
+    except (IOError, ValueError):
+        return None
+
+    # Mark the entry as recently used for eviction
+    for name in ARRAY_NAMES:
+        try:
+            os.utime(_path(key, name), None)
+        except OSError:
+            pass
+    return arrays
+
+
+def store(key, vertexData, indexData):
+    if not ENABLED:
+        return
+    try:
+        os.makedirs(CACHE_DIR)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+    # Write to temporary files and rename, so a reader never sees half an entry
+    for name, data in zip(ARRAY_NAMES, (vertexData, indexData)):
+        fd, tempPath = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                numpy.save(f, numpy.ascontiguousarray(data))
+            os.rename(tempPath, _path(key, name))
+        except:
+            os.remove(tempPath)
+            raise
+
+    evict()
+
+
+def invalidate(key):
+    for name in ARRAY_NAMES:
+        try:
+            os.remove(_path(key, name))
+        except OSError:
+            pass
+
+
+def _entries():
+    '''
+    Returns [(lastUsed, size, key)] for every entry in the cache directory.
+    '''
+    entries = {}
+    try:
+        filenames = os.listdir(CACHE_DIR)
+    except OSError:
+        return []
+    for filename in filenames:
+        if not filename.endswith('.npy'):
+            continue
+        try:
+            stat = os.stat(os.path.join(CACHE_DIR, filename))
+        except OSError:
+            continue
+        key = filename.split('.', 1)[0]
+        lastUsed, size = entries.get(key, (0, 0))
+        entries[key] = (max(lastUsed, stat.st_mtime), size + stat.st_size)
+    return [(lastUsed, size, key) for key, (lastUsed, size) in entries.iteritems()]
+
+
+def evict(maxBytes=None):
+    '''
+    Removes least recently used entries until the cache directory holds
+    no more than maxBytes (MAX_CACHE_BYTES by default).
+    '''
+    if maxBytes is None:
+        maxBytes = MAX_CACHE_BYTES
+    entries = sorted(_entries())
+    total = sum(size for _, size, _ in entries)
+    for _, size, key in entries:
+        if total <= maxBytes:
+            break
+        invalidate(key)
+        total -= size
+
+
+def clear():
+    evict(0)
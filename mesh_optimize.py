@@ -0,0 +1,181 @@
+import sys
+import numpy
+
+# Post-transform vertex cache size assumed when ordering triangles
+CACHE_SIZE = 16
+
+
+def weld(vertexData, indices):
+    '''
+    Merges vertices whose records are byte-for-byte identical.
+    Returns (vertexData, indices).
+    '''
+    records = numpy.ascontiguousarray(vertexData)
+    keys = records.view(numpy.dtype((numpy.void, records.dtype.itemsize)))
+    _, first, remap = numpy.unique(keys, return_index=True, return_inverse=True)
+    return records[first], remap[indices].astype(numpy.uint32)
+
+
+def acmr(indices, cacheSize=CACHE_SIZE):
+    '''
+    Average cache miss ratio: vertices transformed per triangle with a
+    FIFO post-transform cache of cacheSize entries. 0.5 is about the best
+    possible for a large regular mesh, and 3.0 the worst.
+    '''
+    indices = numpy.asarray(indices).tolist()
+    if not indices:
+        return 0.0
+    # Each vertex's position in the stream of misses; it is still cached
+    # while fewer than cacheSize misses have come after it
+    missedAt = {}
+    misses = 0
+    for v in indices:
+        if misses - missedAt.get(v, -cacheSize - 1) > cacheSize:
+            missedAt[v] = misses
+            misses += 1
+    return misses / (len(indices) / 3.0)
+
+
+def vertexTriangles(triangles, numVertices):
+    '''
+    Returns (offsets, triangleIds) such that the triangles using vertex v
+    are triangleIds[offsets[v]:offsets[v+1]].
+    '''
+    corners = triangles.reshape((-1,))
+    triangleIds = numpy.argsort(corners, kind='mergesort') // 3
+    offsets = numpy.zeros((numVertices + 1,), dtype=numpy.intp)
+    numpy.cumsum(numpy.bincount(corners, minlength=numVertices), out=offsets[1:])
+    return offsets.tolist(), triangleIds.tolist()
+
+
+def tipsify(triangles, numVertices, cacheSize=CACHE_SIZE):
+    '''
+    Orders triangles for the post-transform vertex cache, after Sander,
+    Nehab and Barczak's Tipsify: triangles are emitted in fans around a
+    vertex, moving on each time to a vertex that is likely still cached.
+    Returns (triangle order, starts of the runs between cache flushes).
+    '''
+    offsets, adjacency = vertexTriangles(triangles, numVertices)
+    corners = triangles.tolist()
+    live = numpy.bincount(triangles.reshape((-1,)), minlength=numVertices).tolist()
+    cachedAt = [-cacheSize - 1] * numVertices
+    emitted = [False] * len(corners)
+
+    order, clusterStarts = [], [0]
+    deadEnds = []
+    time = cacheSize + 1
+    cursor = 0
+    fan = 0 if numVertices else -1
+
+    while fan >= 0:
+        candidates = []
+        for t in adjacency[offsets[fan]:offsets[fan + 1]]:
+            if emitted[t]:
+                continue
+            emitted[t] = True
+            order.append(t)
+            for v in corners[t]:
+                deadEnds.append(v)
+                candidates.append(v)
+                live[v] -= 1
+                if time - cachedAt[v] > cacheSize:
+                    cachedAt[v] = time
+                    time += 1
+
+        # Prefer the candidate that has been cached longest but whose
+        # remaining triangles would still find it in the cache
+        fan, best = -1, -1
+        for v in candidates:
+            if live[v] > 0:
+                priority = time - cachedAt[v] if time - cachedAt[v] + 2*live[v] <= cacheSize else 0
+                if priority > best:
+                    fan, best = v, priority
+        if fan >= 0:
+            continue
+
+        # Dead end: go back to a recently used vertex, or else the next
+        # vertex in input order, with triangles left
+        while deadEnds and fan < 0:
+            v = deadEnds.pop()
+            if live[v] > 0:
+                fan = v
+        while fan < 0 and cursor < numVertices:
+            if live[cursor] > 0:
+                fan = cursor
+            cursor += 1
+        if fan >= 0:
+            clusterStarts.append(len(order))
+
+    return numpy.array(order, dtype=numpy.intp), numpy.array(clusterStarts, dtype=numpy.intp)
+
+
+def sortClustersForOverdraw(positions, triangles, clusterStarts):
+    '''
+    Reorders runs of triangles so that the ones facing out from the middle
+    of the mesh come first, and tend to hide the ones drawn after them.
+    Returns the new triangle order.
+    '''
+    corners = positions[triangles].astype(numpy.float64)
+    faceNormals = numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    faceCenters = corners.mean(axis=1)
+
+    # Area weighted normal and centroid of each cluster
+    areas = numpy.sqrt((faceNormals * faceNormals).sum(axis=1))
+    clusterNormals = numpy.add.reduceat(faceNormals, clusterStarts)
+    clusterCenters = numpy.add.reduceat(faceCenters * areas[:, None], clusterStarts)
+    clusterCenters /= numpy.maximum(numpy.add.reduceat(areas, clusterStarts), 1e-30)[:, None]
+
+    meshCenter = faceCenters.mean(axis=0)
+    facing = ((clusterCenters - meshCenter) * clusterNormals).sum(axis=1)
+    clusterOrder = numpy.argsort(-facing, kind='mergesort')
+
+    clusterEnds = numpy.append(clusterStarts[1:], len(triangles))
+    return numpy.concatenate([
+        numpy.arange(clusterStarts[c], clusterEnds[c]) for c in clusterOrder
+    ])
+
+
+def reorderVertices(vertexData, indices):
+    '''
+    Renumbers vertices in the order the indices first use them, so that
+    vertex fetches walk through memory. Unused vertices are dropped.
+    Returns (vertexData, indices).
+    '''
+    used, first = numpy.unique(indices, return_index=True)
+    byFirstUse = used[numpy.argsort(first)]
+    remap = numpy.empty((len(vertexData),), dtype=numpy.uint32)
+    remap[byFirstUse] = numpy.arange(len(byFirstUse), dtype=numpy.uint32)
+    return vertexData[byFirstUse], remap[indices]
+
+
+def optimize(vertexData, indices, cacheSize=CACHE_SIZE):
+    '''
+    Welds duplicate vertices, reorders triangles for the vertex cache and
+    then for overdraw, and reorders vertices for fetch. vertexData is an
+    array of vertex records with a 'position' field.
+    Returns (vertexData, indices).
+    '''
+    vertexData, indices = weld(vertexData, numpy.asarray(indices, dtype=numpy.uint32))
+    triangles = indices.reshape((-1, 3))
+    if not len(triangles):
+        return vertexData, indices
+
+    order, clusterStarts = tipsify(triangles, len(vertexData), cacheSize)
+    triangles = triangles[order]
+    triangles = triangles[sortClustersForOverdraw(vertexData['position'], triangles, clusterStarts)]
+
+    return reorderVertices(vertexData, triangles.reshape((-1,)))
+
+
+if __name__ == '__main__':
+    # Reports the effect on each OBJ file given
+    from wavefront import parseWavefront
+    from mesh_types import POSITION_DTYPE
+
+    for filename in sys.argv[1:]:
+        vertices, _, indices = parseWavefront(filename)
+        vertexData = numpy.ascontiguousarray(vertices).view(POSITION_DTYPE).reshape((-1,))
+        optimizedData, optimizedIndices = optimize(vertexData, indices)
+        print '%s: %s -> %s vertices, ACMR %.3f -> %.3f' % (
+            filename, len(vertexData), len(optimizedData), acmr(indices), acmr(optimizedIndices)
+        )
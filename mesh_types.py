@@ -1,177 +1,211 @@
 import numpy
 import ctypes
-import itertools
-import OpenGL.GL as GL
+import decimate
+import mesh_optimize
+import mesh_builders
+from geometry_arena import arenaFor
 from shaders.blinn_with_normals import BlinnWithNormalsProgram
 from shaders.blinn_without_normals import BlinnWithoutNormalsProgram
 
 
 SIZE_OF_FLOAT32 = 4
 SIZE_OF_UNSIGNED32 = 4
-list_sum = lambda iterable: sum(iterable, [])
 NULL_PTR = ctypes.c_void_p(0)
 
+# Vertex layouts; each field is fed to the program attribute of the same name
+POSITION_DTYPE = numpy.dtype([('position', numpy.float32, 3)])
+POSITION_NORMAL_DTYPE = numpy.dtype([('position', numpy.float32, 3), ('normal', numpy.float32, 3)])
+
+# Per-instance attribute layout: the top three rows of the model matrix
+# (the bottom row is always (0, 0, 0, 1)) and an index into the group's
+# MaterialTable
+INSTANCE_DTYPE = numpy.dtype([
+    ('modelRows', numpy.float32, (3, 4)),
+    ('materialId', numpy.uint32),
+])
+
+# How to build flat shaded meshes from shared vertices: MEMORY keeps the
+# vertices shared and has a geometry shader work out each face's normal,
+# SPEED gives each face its own vertices with a precomputed normal, so that
+# the cheaper program without a geometry shader can draw them
+MEMORY = 'memory'
+SPEED = 'speed'
+FLAT_SHADING_POLICY = SPEED
+
+
+def asVec3Array(values):
+    '''
+    Returns an (N,3) float32 array from a list of Vec3s, an (N,3) array or
+    a flat array of xyz triples, without copying if it already is one.
+    '''
+    if not isinstance(values, numpy.ndarray):
+        values = numpy.array(values, dtype=numpy.float32)
+    return numpy.ascontiguousarray(values, dtype=numpy.float32).reshape((-1, 3))
+
+
+def asVertexData(vertexData, dtype):
+    '''
+    Views vertexData as a 1D array of dtype records. Flat float32 arrays
+    with the same layout are viewed rather than copied.
+    '''
+    if vertexData.dtype == dtype:
+        return vertexData
+    return numpy.ascontiguousarray(vertexData, dtype=numpy.float32).reshape((-1,)).view(dtype)
+
+
+def packInstances(block, materialIds):
+    '''
+    Builds the interleaved INSTANCE_DTYPE array for an InstanceBlock, with
+    each instance's index into a MaterialTable.
+    '''
+    instances = numpy.empty(len(block), dtype=INSTANCE_DTYPE)
+    instances['modelRows'] = block.matrices[:, :3]
+    instances['materialId'] = materialIds
+    return instances
+
 
 class BlinnShadedMesh(object):
 
     def __del__(self):
         pass # Should delete GL objects
 
-    def setAttribLists(self, attribLists):
-        GL.glBindVertexArray(self.vao)
-
-        # Build one buffer for each non-position attribute
-        # that our program needs
-        self.ambientBuffer, self.diffuseBuffer, self.specularBuffer, self.modelMatrixBuffer = GL.glGenBuffers(4)
+    @classmethod
+    def fromBuffers(cls, name, vertexData, indexData):
+        '''
+        Makes a mesh straight from a vertex array in the mesh's layout (or
+        a flat float32 array with the same layout) and a uint32 index array,
+        e.g. ones memory-mapped from the mesh cache.
+        The arrays are kept as they are, without copying.
+        '''
+        mesh = cls.__new__(cls)
+        mesh.build(name, vertexData, indexData)
+        return mesh
+
+    def build(self, name, vertexData, indexData):
+        '''
+        Sets up the mesh on the CPU and adds it to the GeometryArena for its
+        vertex layout; its buffers are sent to the GL along with the rest
+        of the arena's when it is first drawn.
+        '''
+        self.name = name
 
-        # Set up ambient
-        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.ambientBuffer)
-        GL.glBufferData(
-            GL.GL_ARRAY_BUFFER,
-            len(attribLists) * SIZE_OF_FLOAT32 * 3,
-            numpy.concatenate([m[1]['ambient'] for m in attribLists]).astype(numpy.float32, copy=False),
-            GL.GL_STATIC_DRAW
-        )
-        GL.glEnableVertexAttribArray(self.program.attrib_ambient)
-        GL.glVertexAttribPointer(self.program.attrib_ambient, 3, GL.GL_FLOAT, False, 3*SIZE_OF_FLOAT32, ctypes.c_void_p(0))
-        GL.glVertexAttribDivisor(self.program.attrib_ambient, 1)
-
-        # Set up diffuse
-        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.diffuseBuffer)
-        GL.glBufferData(
-            GL.GL_ARRAY_BUFFER,
-            len(attribLists) * SIZE_OF_FLOAT32 * 3,
-            numpy.concatenate([m[1]['diffuse'] for m in attribLists]).astype(numpy.float32, copy=False),
-            GL.GL_STATIC_DRAW
+        assert len(indexData) % 3 == 0
+        self.numTriangles = len(indexData) / 3
+
+        # Kept so that the buffers can be cached or rebuilt later
+        self.vertexData = asVertexData(vertexData, self.VERTEX_DTYPE)
+        self.indexData = indexData
+        self.setBounds()
+
+        arenaFor(self.VERTEX_DTYPE, self.PROGRAM, INSTANCE_DTYPE).add(self)
+
+    @property
+    def program(self):
+        return self.PROGRAM.get()
+
+    def optimizeBuffers(self, vertexData, indexData):
+        '''
+        Runs vertexData and indexData through mesh_optimize, noting the
+        average cache miss ratio before and after in self.acmr.
+        '''
+        before = mesh_optimize.acmr(indexData)
+        vertexData, indexData = mesh_optimize.optimize(vertexData, indexData)
+        self.acmr = (before, mesh_optimize.acmr(indexData))
+        return vertexData, indexData
+
+    def decimatedName(self, ratio):
+        return '%s@%g' % (self.name, ratio)
+
+    def decimated(self, ratio):
+        '''
+        Returns a new mesh of the same type with about ratio times as many
+        triangles, for drawing at a distance.
+        '''
+        hasNormals = 'normal' in self.VERTEX_DTYPE.names
+        positions, normals, indices = decimate.decimate(
+            self.vertexData['position'],
+            self.indexData,
+            max(1, int(ratio * self.numTriangles)),
+            normals=self.vertexData['normal'] if hasNormals else None
         )
-        GL.glEnableVertexAttribArray(self.program.attrib_diffuse)
-        GL.glVertexAttribPointer(self.program.attrib_diffuse, 3, GL.GL_FLOAT, False, 3*SIZE_OF_FLOAT32, ctypes.c_void_p(0))
-        GL.glVertexAttribDivisor(self.program.attrib_diffuse, 1)
-
-        # Set up specular
-        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.specularBuffer)
-        GL.glBufferData(
-            GL.GL_ARRAY_BUFFER,
-            len(attribLists) * SIZE_OF_FLOAT32 * 4,
-            numpy.concatenate([m[1]['specular'] for m in attribLists]).astype(numpy.float32, copy=False),
-            GL.GL_STATIC_DRAW
-        )
-        GL.glEnableVertexAttribArray(self.program.attrib_specular)
-        GL.glVertexAttribPointer(self.program.attrib_specular, 4, GL.GL_FLOAT, False, 4*SIZE_OF_FLOAT32, ctypes.c_void_p(0))
-        GL.glVertexAttribDivisor(self.program.attrib_specular, 1)
-
-        # Set up model matrix
-        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.modelMatrixBuffer)
-        GL.glBufferData(
-            GL.GL_ARRAY_BUFFER,
-            len(attribLists) * SIZE_OF_FLOAT32 * 16,
-            numpy.concatenate([m[0].T for m in attribLists]).astype(numpy.float32, copy=False),
-            GL.GL_STATIC_DRAW
+        vertexData = numpy.empty(len(positions), dtype=self.VERTEX_DTYPE)
+        vertexData['position'] = positions
+        if hasNormals:
+            vertexData['normal'] = normals
+        vertexData, indices = mesh_optimize.optimize(vertexData, indices)
+        return self.fromBuffers(self.decimatedName(ratio), vertexData, indices)
+
+    def setBounds(self):
+        '''
+        Sets the local axis-aligned bounding box of the mesh's vertices.
+        '''
+        positions = self.vertexData['position']
+        if len(positions):
+            self.boundsMin, self.boundsMax = positions.min(axis=0), positions.max(axis=0)
+        else:
+            self.boundsMin = self.boundsMax = numpy.zeros((3,), dtype=numpy.float32)
+
+    def __str__(self):
+        return '%s(%s, firstIndex=%s, %s triangles)' % (
+            self.name, type(self).__name__, self.firstIndex, self.numTriangles
         )
-        for i in range(4):
-            GL.glEnableVertexAttribArray(self.program.attrib_m + i)
-            GL.glVertexAttribPointer(
-                self.program.attrib_m + i,
-                4,
-                GL.GL_FLOAT,
-                False,
-                16*SIZE_OF_FLOAT32,
-                ctypes.c_void_p(i * 4 * SIZE_OF_FLOAT32)
-            )
-            GL.glVertexAttribDivisor(self.program.attrib_m + i, 1)
-        GL.glBindVertexArray(0)
 
 
 class VertexMesh(BlinnShadedMesh):
-    def __init__(self, name, vertices, indices):
-        self.name = name
-
-        assert len(indices) % 3 == 0
-        self.numTriangles = len(indices) / 3
-
-        vertex_data = vertices if isinstance(vertices, numpy.ndarray) else numpy.concatenate(vertices)
-        index_data = numpy.array(indices, dtype=numpy.uint32)
-
-        self.vao = GL.glGenVertexArrays(1)
-        GL.glBindVertexArray(self.vao)
-
-        self.vbo, self.ibo = GL.glGenBuffers(2)
-        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.vbo)
-        GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, self.ibo)
-
-        self.program = BlinnWithoutNormalsProgram.get()
+    VERTEX_DTYPE = POSITION_DTYPE
+    PROGRAM = BlinnWithoutNormalsProgram
 
-        GL.glEnableVertexAttribArray(self.program.attrib_position)
-        GL.glVertexAttribPointer(self.program.attrib_position, 3, GL.GL_FLOAT, False, 3*SIZE_OF_FLOAT32, ctypes.c_void_p(0))
+    def __init__(self, name, vertices, indices, optimize=False):
+        vertex_data = asVec3Array(vertices).view(self.VERTEX_DTYPE).reshape((-1,))
+        index_data = numpy.asarray(indices, dtype=numpy.uint32)
 
-        # Send the data over to the buffer
-        GL.glBufferData(GL.GL_ARRAY_BUFFER, len(vertex_data) * SIZE_OF_FLOAT32, vertex_data.astype(numpy.float32, copy=False), GL.GL_STATIC_DRAW)
-        GL.glBufferData(GL.GL_ELEMENT_ARRAY_BUFFER, len(index_data) * SIZE_OF_UNSIGNED32, index_data, GL.GL_STATIC_DRAW)
+        if optimize:
+            vertex_data, index_data = self.optimizeBuffers(vertex_data, index_data)
 
-        # Unbind the VAO first (Important)
-        GL.glBindVertexArray(0)
-
-        # Unbind other stuff
-        GL.glDisableVertexAttribArray(self.program.attrib_position)
-        GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, 0)
-        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
-
-    def __str__(self):
-        return '%s(VertexPrimitive, vao=%s, %s triangles)' % (
-            self.name, self.vao, self.numTriangles
-        )
+        self.build(name, vertex_data, index_data)
 
 
 class VertexNormalMesh(BlinnShadedMesh):
-    def __init__(self, name, vertices, normals, indices):
-        self.name = name
-        assert len(vertices) == len(normals)
+    VERTEX_DTYPE = POSITION_NORMAL_DTYPE
+    PROGRAM = BlinnWithNormalsProgram
 
-        assert len(indices) % 3 == 0
-        self.numTriangles = len(indices) / 3
-
-        vertex_data = numpy.array(
-            list_sum(
-                [v[0], v[1], v[2], n[0], n[1], n[2]]
-                for v, n
-                in itertools.izip(vertices, normals)
-            ),
-            dtype=numpy.float32
-        )
-
-        index_data = numpy.array(indices, dtype=numpy.uint32)
-
-        self.vao = GL.glGenVertexArrays(1)
-        GL.glBindVertexArray(self.vao)
+    def __init__(self, name, vertices, normals, indices, optimize=False):
+        vertices, normals = asVec3Array(vertices), asVec3Array(normals)
+        assert len(vertices) == len(normals)
 
-        self.vbo, self.ibo = GL.glGenBuffers(2)
-        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.vbo)
-        GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        vertex_data = numpy.empty(len(vertices), dtype=self.VERTEX_DTYPE)
+        vertex_data['position'] = vertices
+        vertex_data['normal'] = normals
 
-        self.program = BlinnWithNormalsProgram.get()
+        index_data = numpy.asarray(indices, dtype=numpy.uint32)
 
-        GL.glEnableVertexAttribArray(self.program.attrib_position)
-        GL.glEnableVertexAttribArray(self.program.attrib_normal)
+        if optimize:
+            vertex_data, index_data = self.optimizeBuffers(vertex_data, index_data)
 
-        GL.glVertexAttribPointer(self.program.attrib_position, 3, GL.GL_FLOAT, False, 6*SIZE_OF_FLOAT32, ctypes.c_void_p(0))
-        GL.glVertexAttribPointer(self.program.attrib_normal,   3, GL.GL_FLOAT, False, 6*SIZE_OF_FLOAT32, ctypes.c_void_p(3*SIZE_OF_FLOAT32))
+        self.build(name, vertex_data, index_data)
 
-        # Send the data over to the buffer
-        GL.glBufferData(GL.GL_ARRAY_BUFFER, len(vertex_data) * SIZE_OF_FLOAT32, vertex_data, GL.GL_STATIC_DRAW)
-        GL.glBufferData(GL.GL_ELEMENT_ARRAY_BUFFER, len(index_data) * SIZE_OF_UNSIGNED32, index_data, GL.GL_STATIC_DRAW)
 
-        # Unbind the VAO first (Important)
-        GL.glBindVertexArray(0)
+class FlatNormalMesh(VertexNormalMesh):
+    '''
+    A VertexMesh's geometry drawn like a VertexNormalMesh, with every face
+    split off and given its own normal (see FLAT_SHADING_POLICY).
+    '''
 
-        # Unbind other stuff
-        GL.glDisableVertexAttribArray(self.program.attrib_normal)
-        GL.glDisableVertexAttribArray(self.program.attrib_position)
-        GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, 0)
-        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+    def __init__(self, name, vertices, indices, optimize=False):
+        vertices, normals, indices = mesh_builders.splitFaces(asVec3Array(vertices), indices)
+        super(FlatNormalMesh, self).__init__(name, vertices, normals, indices, optimize=optimize)
 
-    def __str__(self):
-        return 'VertexNormalPrimitive(vao=%s, %s triangles)' % (
-            self.vao, self.numTriangles
+    def decimated(self, ratio):
+        # Simplify the shape alone, then split the faces again
+        positions, _, indices = decimate.decimate(
+            self.vertexData['position'], self.indexData, max(1, int(ratio * self.numTriangles))
         )
+        return FlatNormalMesh(self.decimatedName(ratio), positions, indices, optimize=True)
 
 
+def flatMeshType(policy=None):
+    '''
+    Returns the mesh type to build flat shaded geometry with under policy
+    (FLAT_SHADING_POLICY by default). Both take (name, vertices, indices).
+    '''
+    return FlatNormalMesh if (policy or FLAT_SHADING_POLICY) == SPEED else VertexMesh
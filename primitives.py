@@ -1,17 +1,85 @@
+import numpy
+import mesh_cache
 import registered_type
 import functools
 from maths import IDENTITY
+from instances import InstanceBlock
+
+# Default fractions of the full triangle count kept at each level of
+# detail after the first, and the size on screen (bounding radius over
+# distance from the eye) below which each level is used
+LOD_RATIOS = (0.25, 0.05)
+LOD_SIZES = (0.15, 0.05)
+
+
+def screenSizes(centers, radii, eyePosition):
+    '''
+    Returns how big bounding spheres look from eyePosition, as their radius
+    over their distance, for comparing with lodSizes.
+    '''
+    offsets = centers - numpy.asarray(eyePosition, dtype=numpy.float32)
+    distances = numpy.sqrt((offsets * offsets).sum(axis=1))
+    return radii / numpy.maximum(distances, 1e-6)
 
 
 class Primitive(object):
     primCount = 1
 
+    # Simplified meshes, each drawn instead of underlying when an
+    # instance looks smaller than the matching entry of lodSizes
+    lodMeshes = ()
+    lodSizes = ()
+
+    @property
+    def numTriangles(self):
+        return self.underlying.numTriangles
+
+    @property
+    def meshes(self):
+        return (self.underlying,) + tuple(self.lodMeshes)
+
+    def setLevelsOfDetail(self, ratios=LOD_RATIOS, sizes=LOD_SIZES, cacheKey=None):
+        '''
+        Builds a simplified mesh for each of ratios, which should be
+        decreasing, to be used below each of sizes. If cacheKey (the mesh
+        cache key of the full mesh) is given, the simplified buffers are
+        cached too.
+        '''
+        assert len(ratios) == len(sizes)
+        meshType = type(self.underlying)
+        lodMeshes = []
+        for ratio in ratios:
+            if cacheKey is None:
+                lodMeshes.append(self.underlying.decimated(ratio))
+                continue
+            lodKey = mesh_cache.derivedKey(cacheKey, lod=ratio)
+            cached = mesh_cache.load(lodKey)
+            if cached is not None:
+                lodMeshes.append(meshType.fromBuffers(self.underlying.decimatedName(ratio), *cached))
+            else:
+                mesh = self.underlying.decimated(ratio)
+                mesh_cache.store(lodKey, mesh.vertexData, mesh.indexData)
+                lodMeshes.append(mesh)
+
+        self.lodMeshes = tuple(lodMeshes)
+        self.lodSizes = numpy.asarray(sizes, dtype=numpy.float32)
+
+    def lodLevels(self, centers, radii, eyePosition):
+        '''
+        Returns the index into self.meshes to draw each instance with,
+        given their bounding spheres.
+        '''
+        sizes = screenSizes(centers, radii, eyePosition)
+        return (sizes[:, None] < numpy.asarray(self.lodSizes, dtype=numpy.float32)[None, :]).sum(axis=1)
+
     def addToGroup(self, group, transform=IDENTITY, **params):
-        group.addPrimitive(self, transform, params)
+        group.addInstances(self, InstanceBlock.single(transform, params))
+
+    def flatten(self):
+        return {self: InstanceBlock.single()}
 
     def deepLines(self):
         return [str(self)]
 
 
 makePrimitive = functools.partial(registered_type.makeRegisteredType, Primitive)
-
@@ -0,0 +1,256 @@
+'''
+Per-frame profiling: nested named scopes and counters, with a ring buffer
+of recent frames to take percentiles over and export.
+
+    with profiler.scope('draw'):
+        ...
+    profiler.count('drawCalls')
+
+Scopes opened inside another are named by their path, e.g. 'draw/cull'.
+Times measured some other way (e.g. on the GPU) can be added to the
+current frame with addTime, and are reported along with the scopes.
+While ENABLED is False, scope returns a shared do-nothing context and
+count returns straight away, so both can be left in.
+Set ARCHITECT_PROFILE to a filename prefix to enable profiling from the
+start; main then writes <prefix>.json and <prefix>.trace.json on exit.
+'''
+
+import os
+import json
+import time
+import numpy
+from collections import defaultdict, deque
+
+ENABLED = bool(os.environ.get('ARCHITECT_PROFILE'))
+
+# Number of frames kept for percentiles and export
+FRAME_HISTORY = 600
+
+PERCENTILES = (50, 95, 99)
+
+
+class NullScope(object):
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+NULL_SCOPE = NullScope()
+
+
+class Scope(object):
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        profiler = self.profiler
+        profiler.stack.append(self.name)
+        self.path = '/'.join(profiler.stack)
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        end = time.time()
+        profiler = self.profiler
+        profiler.stack.pop()
+        profiler.events.append((self.path, len(profiler.stack), self.start, end - self.start))
+
+
+class Frame(object):
+    '''
+    What was recorded between one beginFrame and endFrame.
+    '''
+
+    def __init__(self, number, start, duration, events, counters, times):
+        self.number = number
+        self.start = start
+        self.duration = duration
+        # [(scope path, depth, start time, duration)]
+        self.events = events
+        self.counters = counters
+        # {name: seconds} added with addTime
+        self.times = times
+
+    def scopeTimes(self):
+        '''
+        Returns {scope path: total seconds} for the frame, including
+        'frame' for the whole of it.
+        '''
+        times = defaultdict(float, self.times)
+        times['frame'] = self.duration
+        for path, _, _, duration in self.events:
+            times[path] += duration
+        return times
+
+
+class Profiler(object):
+
+    def __init__(self, history=FRAME_HISTORY):
+        self.frames = deque(maxlen=history)
+        self.numFrames = 0
+        self.stack = []
+        self.events = []
+        self.counters = defaultdict(int)
+        self.times = defaultdict(float)
+        self.frameStart = None
+
+    def scope(self, name):
+        return Scope(self, name)
+
+    def beginFrame(self):
+        self.frameStart = time.time()
+        self.events = []
+        self.counters = defaultdict(int)
+        self.times = defaultdict(float)
+
+    def endFrame(self):
+        if self.frameStart is None:
+            return
+        now = time.time()
+        self.frames.append(Frame(
+            self.numFrames, self.frameStart, now - self.frameStart, self.events,
+            dict(self.counters), dict(self.times)
+        ))
+        self.numFrames += 1
+        self.frameStart = None
+        self.events = []
+        self.counters = defaultdict(int)
+        self.times = defaultdict(float)
+
+    def series(self):
+        '''
+        Returns ({scope path: array of seconds per frame},
+        {counter: array of values per frame}) over the frames kept. Frames
+        in which a scope or counter didn't appear count as zero.
+        '''
+        times, counters = defaultdict(list), defaultdict(list)
+        for i, frame in enumerate(self.frames):
+            for path, seconds in frame.scopeTimes().iteritems():
+                times[path].append((i, seconds))
+            for name, value in frame.counters.iteritems():
+                counters[name].append((i, value))
+
+        def fill(pairs):
+            values = numpy.zeros((len(self.frames),))
+            for i, value in pairs:
+                values[i] = value
+            return values
+
+        return (
+            dict((path, fill(pairs)) for path, pairs in times.iteritems()),
+            dict((name, fill(pairs)) for name, pairs in counters.iteritems())
+        )
+
+    def summary(self):
+        '''
+        Returns {'scopes': {path: stats}, 'counters': {name: stats}},
+        where stats holds the mean and PERCENTILES (as 'p50' etc.) over
+        the frames kept. Times are in seconds.
+        '''
+        def stats(values):
+            result = {'mean': float(values.mean())}
+            for p, value in zip(PERCENTILES, numpy.percentile(values, PERCENTILES)):
+                result['p%d' % p] = float(value)
+            return result
+
+        times, counters = self.series()
+        return {
+            'frames': len(self.frames),
+            'scopes': dict((path, stats(values)) for path, values in times.iteritems()),
+            'counters': dict((name, stats(values)) for name, values in counters.iteritems()),
+        }
+
+    def report(self):
+        '''
+        Returns the summary as lines of text, times in milliseconds.
+        '''
+        summary = self.summary()
+        header = ''.join('%10s' % ('p%d' % p) for p in PERCENTILES)
+        lines = ['%d frames' % summary['frames'], '%-32s%s' % ('scope (ms)', header)]
+        for path, stats in sorted(summary['scopes'].iteritems()):
+            lines.append('%-32s%s' % (path, ''.join('%10.3f' % (1000 * stats['p%d' % p]) for p in PERCENTILES)))
+        lines.append('%-32s%s' % ('counter', header))
+        for name, stats in sorted(summary['counters'].iteritems()):
+            lines.append('%-32s%s' % (name, ''.join('%10d' % stats['p%d' % p] for p in PERCENTILES)))
+        return '\n'.join(lines)
+
+    def exportJSON(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.summary(), f, indent=2, sort_keys=True)
+
+    def exportChromeTrace(self, filename):
+        '''
+        Writes the frames kept in the Trace Event Format read by
+        chrome://tracing and Perfetto.
+        '''
+        if not self.frames:
+            origin = 0.0
+        else:
+            origin = self.frames[0].start
+        microseconds = lambda seconds: round(1e6 * seconds, 3)
+
+        events = []
+        for frame in self.frames:
+            events.append({
+                'name': 'frame', 'ph': 'X', 'pid': 0, 'tid': 0,
+                'ts': microseconds(frame.start - origin), 'dur': microseconds(frame.duration),
+                'args': {'number': frame.number},
+            })
+            for path, _, start, duration in frame.events:
+                events.append({
+                    'name': path.rsplit('/', 1)[-1], 'ph': 'X', 'pid': 0, 'tid': 0,
+                    'ts': microseconds(start - origin), 'dur': microseconds(duration),
+                    'args': {'path': path},
+                })
+            for name, value in frame.counters.iteritems():
+                events.append({
+                    'name': name, 'ph': 'C', 'pid': 0,
+                    'ts': microseconds(frame.start - origin), 'args': {name: value},
+                })
+            # Added times have no start of their own, so are shown as
+            # counters of milliseconds
+            for name, seconds in frame.times.iteritems():
+                events.append({
+                    'name': name + ' (ms)', 'ph': 'C', 'pid': 0,
+                    'ts': microseconds(frame.start - origin), 'args': {name: 1000 * seconds},
+                })
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+PROFILER = Profiler()
+
+
+def scope(name):
+    if not ENABLED:
+        return NULL_SCOPE
+    return PROFILER.scope(name)
+
+
+def count(name, value=1):
+    if ENABLED:
+        PROFILER.counters[name] += value
+
+
+def addTime(name, seconds):
+    if ENABLED:
+        PROFILER.times[name] += seconds
+
+
+def beginFrame():
+    if ENABLED:
+        PROFILER.beginFrame()
+
+
+def endFrame():
+    if ENABLED:
+        PROFILER.endFrame()
+
+
+def export(prefix):
+    '''
+    Writes <prefix>.json and <prefix>.trace.json.
+    '''
+    PROFILER.exportJSON(prefix + '.json')
+    PROFILER.exportChromeTrace(prefix + '.trace.json')
@@ -1,9 +1,17 @@
 __author__ = 'SMOKER'
 
 import functools
+import threading
 
 __ALL_TYPES__ = {}
 __ALL_INSTANCES__ = {}
+# {key: (instance, thread making it, Event set when it's made)} of the
+# instances being made, so that threads loading in the background wait
+# for (rather than see, or make a second) a half-made instance, while
+# instances with different keys are made at the same time
+__IN_PROGRESS__ = {}
+# Held only while looking up or changing the two dicts above
+__REGISTRY_LOCK__ = threading.Lock()
 
 
 class InvalidTypeException(Exception):
@@ -40,9 +48,54 @@ def getInstance(typeName, **kwargs):
         raise InvalidTypeException(typeName)
 
     key = (typeName, tuple(kwargs.items())) # Fix this: build frozendict
-    instance = __ALL_INSTANCES__.get(key)
-    if instance is None:
-        __ALL_INSTANCES__[key] = instance = typeObject()
+    while True:
+        with __REGISTRY_LOCK__:
+            instance = __ALL_INSTANCES__.get(key)
+            if instance is not None:
+                return instance
+            inProgress = __IN_PROGRESS__.get(key)
+            if inProgress is None:
+                instance = typeObject()
+                ready = threading.Event()
+                __IN_PROGRESS__[key] = (instance, threading.current_thread(), ready)
+                break
+        instance, thread, ready = inProgress
+        if thread is threading.current_thread():
+            # Asked for again while making it
+            return instance
+        # If making it fails, try again here
+        ready.wait()
+
+    try:
+        # Lets another process (with the same types registered) make the
+        # same instance, see getInstanceByKey
+        instance.registryKey = key
         instance.create(**kwargs)
+        with __REGISTRY_LOCK__:
+            __ALL_INSTANCES__[key] = instance
+    finally:
+        with __REGISTRY_LOCK__:
+            del __IN_PROGRESS__[key]
+        ready.set()
     return instance
 
+
+def afterFork():
+    '''
+    Call first thing in a forked child process. The threads of the parent
+    don't exist in the child, so the lock may be held, and instances part
+    made, by threads that will never finish with them.
+    '''
+    global __REGISTRY_LOCK__
+    __REGISTRY_LOCK__ = threading.Lock()
+    # Made again from scratch if asked for
+    __IN_PROGRESS__.clear()
+
+
+def getInstanceByKey(key):
+    '''
+    Fetches (or makes) the instance whose registryKey is key.
+    '''
+    typeName, kwargs = key
+    return getInstance(typeName, **dict(kwargs))
+
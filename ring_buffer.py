@@ -0,0 +1,138 @@
+import ctypes
+import numpy
+import profiler
+import gl_backend
+from gl_backend import GL
+
+# Frames that can be in flight at once, each writing its own region
+NUM_REGIONS = 3
+
+# How long each wait for the GPU to finish with a region lasts, in
+# nanoseconds; the wait is repeated until it has finished
+FENCE_TIMEOUT = 1000000000
+
+# Set to False to always use the fallback path
+USE_BUFFER_STORAGE = True
+
+
+class FenceWaitFailedException(Exception):
+    pass
+
+
+def hasBufferStorage():
+    '''
+    Whether the current context has ARB_buffer_storage (core in GL 4.4).
+    '''
+    if not USE_BUFFER_STORAGE:
+        return False
+    return gl_backend.hasExtension('GL_ARB_buffer_storage')
+
+
+class RingBuffer(object):
+    '''
+    A GL buffer of records split into numRegions regions of capacity
+    records each. Each frame writes into the next region while the GPU may
+    still be drawing from the others, and the region is fenced once the
+    frame's draws have been issued so that it isn't written again until
+    the GPU is done with it.
+
+    With ARB_buffer_storage the buffer is persistently and coherently
+    mapped, and self.records is a numpy view of the mapped memory, so
+    writing to it writes straight to the buffer. Without it, self.records
+    is an ordinary array whose written part is sent with glBufferSubData
+    before drawing.
+    '''
+
+    def __init__(self, dtype, capacity, numRegions=NUM_REGIONS):
+        self.dtype = numpy.dtype(dtype)
+        self.capacity = max(1, capacity)
+        self.numRegions = numRegions
+        self.persistent = hasBufferStorage()
+
+        self.fences = [None] * numRegions
+        self.region = numRegions - 1
+        self.used = 0
+
+        numRecords = self.capacity * numRegions
+        size = numRecords * self.dtype.itemsize
+        self.buffer = GL.glGenBuffers(1)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.buffer)
+        if self.persistent:
+            flags = GL.GL_MAP_WRITE_BIT | GL.GL_MAP_PERSISTENT_BIT | GL.GL_MAP_COHERENT_BIT
+            GL.glBufferStorage(GL.GL_ARRAY_BUFFER, size, None, flags)
+            address = ctypes.cast(GL.glMapBufferRange(GL.GL_ARRAY_BUFFER, 0, size, flags), ctypes.c_void_p).value
+            self.records = numpy.frombuffer((ctypes.c_char * size).from_address(address), dtype=self.dtype)
+        else:
+            GL.glBufferData(GL.GL_ARRAY_BUFFER, size, None, GL.GL_STREAM_DRAW)
+            self.records = numpy.zeros((numRecords,), dtype=self.dtype)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+
+    def delete(self):
+        self.records = None
+        for fence in self.fences:
+            if fence is not None:
+                GL.glDeleteSync(fence)
+        if self.persistent:
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.buffer)
+            GL.glUnmapBuffer(GL.GL_ARRAY_BUFFER)
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        GL.glDeleteBuffers(1, [self.buffer])
+
+    def beginFrame(self):
+        '''
+        Moves on to the next region, first waiting for the GPU to finish
+        drawing from it if it hasn't already.
+        '''
+        self.region = (self.region + 1) % self.numRegions
+        fence = self.fences[self.region]
+        if fence is not None:
+            self.waitFor(fence)
+            GL.glDeleteSync(fence)
+            self.fences[self.region] = None
+        self.used = 0
+
+    def waitFor(self, fence):
+        '''
+        Blocks until the GPU has passed fence, however long that takes, as
+        the region it guards mustn't be written before then.
+        '''
+        flags = GL.GL_SYNC_FLUSH_COMMANDS_BIT
+        while True:
+            result = GL.glClientWaitSync(fence, flags, FENCE_TIMEOUT)
+            if result in (GL.GL_ALREADY_SIGNALED, GL.GL_CONDITION_SATISFIED):
+                return
+            if result != GL.GL_TIMEOUT_EXPIRED:
+                # GL_WAIT_FAILED
+                raise FenceWaitFailedException(result)
+            # The commands have been flushed already
+            flags = 0
+
+    def allocate(self, count):
+        '''
+        Takes count records from this frame's region. Returns the index of
+        the first of them in the whole buffer (the base instance to draw
+        them with) and a view to write them through.
+        '''
+        assert self.used + count <= self.capacity
+        start = self.region * self.capacity + self.used
+        self.used += count
+        return start, self.records[start:start + count]
+
+    def flush(self):
+        '''
+        Makes this frame's writes visible to the GPU, before drawing.
+        '''
+        profiler.count('bytesUploaded', self.used * self.dtype.itemsize)
+        if self.persistent or not self.used:
+            return
+        start = self.region * self.capacity
+        written = self.records[start:start + self.used]
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.buffer)
+        GL.glBufferSubData(GL.GL_ARRAY_BUFFER, start * self.dtype.itemsize, written.nbytes, written)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+
+    def endFrame(self):
+        '''
+        Fences this frame's region, after its draws have been issued.
+        '''
+        self.fences[self.region] = GL.glFenceSync(GL.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
@@ -1,17 +1,37 @@
 import common
-import OpenGL.GL as GL
+from gl_backend import GL
 from programs import SingletonProgram
 
 vs_source = """
 #version 430 core
 
-uniform mat4 u_VP;
+// Binding matches frame_uniforms.FRAME_BINDING
+layout (std140, binding=0) uniform Frame
+{
+    layout (row_major) mat4 u_VP;
+    vec4 u_eyePos_WS; // xyz
+    vec4 u_lightDir_WS; // xyz, TOWARDS the light
+};
+
+struct Material
+{
+    vec4 ambient;
+    vec4 diffuse;
+    vec4 specular; // Exponent in a
+};
+
+// Binding matches materials.MATERIAL_BINDING
+layout (std430, binding=0) readonly buffer Materials
+{
+    Material u_materials[];
+};
 
 layout (location=0) in vec3 in_position_MS;
-layout (location=1) in vec3 in_ambient;
-layout (location=2) in vec3 in_diffuse;
-layout (location=3) in vec4 in_specular;
-layout (location=4) in mat4 in_M;
+layout (location=1) in uint in_materialId;
+// The top three rows of the model matrix
+layout (location=2) in vec4 in_M_row0;
+layout (location=3) in vec4 in_M_row1;
+layout (location=4) in vec4 in_M_row2;
 
 layout (location=0) out vec3 out_position_WS;
 layout (location=1) out vec3 out_ambient;
@@ -20,11 +40,13 @@ layout (location=3) out vec4 out_specular;
 
 void main()
 {
-    out_ambient = in_ambient;
-    out_diffuse = in_diffuse;
-    out_specular = in_specular;
+    Material material = u_materials[in_materialId];
+    out_ambient = material.ambient.rgb;
+    out_diffuse = material.diffuse.rgb;
+    out_specular = material.specular;
 
-    vec4 pos_WS = in_M * vec4(in_position_MS, 1.0);
+    vec4 pos_MS = vec4(in_position_MS, 1.0);
+    vec4 pos_WS = vec4(dot(in_M_row0, pos_MS), dot(in_M_row1, pos_MS), dot(in_M_row2, pos_MS), 1.0);
     out_position_WS = vec3(pos_WS);
     gl_Position = u_VP * pos_WS;
 }
@@ -79,8 +101,13 @@ void main()
 fs_source = """
 #version 430 core
 
-uniform vec3 u_lightDir_WS;
-uniform vec3 u_eyePos_WS;
+// Binding matches frame_uniforms.FRAME_BINDING
+layout (std140, binding=0) uniform Frame
+{
+    layout (row_major) mat4 u_VP;
+    vec4 u_eyePos_WS; // xyz
+    vec4 u_lightDir_WS; // xyz, TOWARDS the light
+};
 
 layout (location=0) in vec3 in_position_WS;
 layout (location=1) in vec3 in_ambient;
@@ -92,9 +119,10 @@ out vec4 out_colour;
 
 void main()
 {
-    float diffuse = max(0.0, dot(in_normal_WS, u_lightDir_WS));
-    vec3 toEye = normalize(u_eyePos_WS - in_position_WS);
-    vec3 h = normalize(u_lightDir_WS + toEye);
+    vec3 lightDir_WS = u_lightDir_WS.xyz;
+    float diffuse = max(0.0, dot(in_normal_WS, lightDir_WS));
+    vec3 toEye = normalize(u_eyePos_WS.xyz - in_position_WS);
+    vec3 h = normalize(lightDir_WS + toEye);
     float specular = pow(max(0.0, dot(in_normal_WS, h)), in_specular.a);
 
     out_colour = vec4(in_ambient + in_diffuse*diffuse + in_specular.rgb*specular, 1.0);
@@ -111,13 +139,7 @@ class BlinnWithoutNormalsProgram(SingletonProgram):
         self.program = common.compileShaderProgram(vs, gs, fs)
 
         self.attrib_position = GL.glGetAttribLocation(self.program, 'in_position_MS')
-        self.attrib_ambient = GL.glGetAttribLocation(self.program, 'in_ambient')
-        self.attrib_diffuse = GL.glGetAttribLocation(self.program, 'in_diffuse')
-        self.attrib_specular = GL.glGetAttribLocation(self.program, 'in_specular')
-        self.attrib_m = GL.glGetAttribLocation(self.program, "in_M")
-
-        self.uniform_vp = GL.glGetUniformLocation(self.program, "u_VP")
-        self.uniform_lightDir = GL.glGetUniformLocation(self.program, "u_lightDir_WS")
-        self.uniform_eyePos = GL.glGetUniformLocation(self.program, "u_eyePos_WS")
+        self.attrib_materialId = GL.glGetAttribLocation(self.program, 'in_materialId')
+        self.attrib_m = GL.glGetAttribLocation(self.program, 'in_M_row0')
 
 
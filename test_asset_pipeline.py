@@ -0,0 +1,106 @@
+'''
+Checks of how the asset pipeline hands finished instances to a group:
+
+    python -m unittest test_asset_pipeline
+'''
+
+import time
+import unittest
+import numpy
+import maths
+import data # Registers the types used below
+from asset_pipeline import AssetPipeline
+from instances import InstanceBlock
+from mesh_types import INSTANCE_DTYPE
+from registered_type import getInstance
+from testing import RecordingTestCase
+
+
+class Group(object):
+    '''
+    Stands in for a DisplayGroup, keeping the blocks added to it.
+    '''
+
+    def __init__(self):
+        self.primitiveNumbers = {}
+        self.added = []
+
+    def addInstanceBlock(self, primitive, block):
+        self.primitiveNumbers.setdefault(primitive, len(self.primitiveNumbers))
+        self.added.append((primitive, block))
+
+
+def row(count):
+    '''
+    A block of count instances along the x axis.
+    '''
+    matrices = numpy.array([maths.Translate(float(x), 0.0, 0.0).getMatrix() for x in xrange(count)], dtype=numpy.float32)
+    return InstanceBlock(matrices)
+
+
+def meshBytes(primitive):
+    return sum(mesh.vertexData.nbytes + mesh.indexData.nbytes for mesh in primitive.meshes)
+
+
+class AssetPipelineTest(RecordingTestCase):
+
+    def setUp(self):
+        RecordingTestCase.setUp(self)
+        self.group = Group()
+        self.cube = getInstance('Cube')
+
+    def finish(self, pipeline, build):
+        '''
+        Loads build and waits until it has run.
+        '''
+        pipeline.load(build)
+        deadline = time.time() + 10.0
+        while pipeline.finished.empty():
+            self.assertTrue(time.time() < deadline)
+            time.sleep(0.001)
+
+    def addedPerFrame(self, pipeline):
+        counts = []
+        while pipeline.busy:
+            start = len(self.group.added)
+            pipeline.update()
+            counts.append([len(block) for _, block in self.group.added[start:]])
+        return counts
+
+    def testBlocksAreSplitToFitTheBudget(self):
+        # The cube's meshes are already in the group, so cost nothing
+        self.group.primitiveNumbers[self.cube] = 0
+        pipeline = AssetPipeline(self.group, numThreads=1, budgetBytes=100 * INSTANCE_DTYPE.itemsize)
+        block = row(250)
+        self.finish(pipeline, lambda: {self.cube: block})
+
+        self.assertEqual(self.addedPerFrame(pipeline), [[100], [100], [50]])
+        numpy.testing.assert_array_equal(
+            numpy.concatenate([added.matrices for _, added in self.group.added]), block.matrices
+        )
+
+    def testNewPrimitivesAreChargedForTheirMeshes(self):
+        budgetBytes = meshBytes(self.cube) + 100 * INSTANCE_DTYPE.itemsize
+        pipeline = AssetPipeline(self.group, numThreads=1, budgetBytes=budgetBytes)
+        self.finish(pipeline, lambda: {self.cube: row(250)})
+        # After the first frame, the meshes are in the group and the whole
+        # budget goes on instances
+        perFrame = budgetBytes // INSTANCE_DTYPE.itemsize
+        self.assertEqual(self.addedPerFrame(pipeline), [[100], [perFrame], [150 - perFrame]])
+
+    def testSomethingIsAddedEachFrameHoweverSmallTheBudget(self):
+        pipeline = AssetPipeline(self.group, numThreads=1, budgetBytes=1)
+        self.finish(pipeline, lambda: {self.cube: row(3)})
+        self.assertEqual(self.addedPerFrame(pipeline), [[1], [1], [1]])
+
+    def testErrorsAreRaisedByUpdate(self):
+        def build():
+            raise ValueError('no such file')
+        pipeline = AssetPipeline(self.group, numThreads=1)
+        self.finish(pipeline, build)
+        self.assertRaises(ValueError, pipeline.update)
+        self.assertFalse(pipeline.busy)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+'''
+Checks of the benchmark's view and its comparison with a baseline:
+
+    python -m unittest test_benchmark
+'''
+
+import unittest
+import maths
+import benchmark
+from display_group import DisplayGroup
+from testing import MATERIAL, RecordingTestCase
+
+
+class ViewTest(RecordingTestCase):
+
+    def testWholeSceneIsInView(self):
+        for scene, size in (('flag', 10000), ('bricks', 30000)):
+            group = DisplayGroup()
+            benchmark.makeScene(scene, size).addToGroup(group, maths.IDENTITY, **MATERIAL)
+            group.setModelMatrixBuffers()
+            group.updateUniforms(*benchmark.viewOfWholeScene(group))
+            group.draw()
+            self.assertEqual(group.numDrawn, group.numAlive)
+
+
+class CompareTest(unittest.TestCase):
+
+    def setUp(self):
+        self.baseline = {
+            'flag:1000': {'build': 0.1, 'frame': 0.001, 'instances': 1000, 'peakMemoryKB': 1000},
+        }
+
+    def compare(self, **measures):
+        return benchmark.compare({'flag:1000': measures}, self.baseline, 0.25)
+
+    def testRegressionsAreReported(self):
+        regressions = self.compare(build=0.2, peakMemoryKB=1300)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith('flag:1000 build: 0.1 -> 0.2'))
+        self.assertTrue(regressions[1].startswith('flag:1000 peakMemoryKB'))
+
+    def testWithinThresholdIsNotReported(self):
+        self.assertEqual(self.compare(build=0.12, peakMemoryKB=1200), [])
+
+    def testCountsShortTimesAndNewMeasuresAreNotCompared(self):
+        # frame's baseline is under MIN_COMPARED_SECONDS, and load has none
+        self.assertEqual(self.compare(frame=0.01, instances=5000, drawn=5000, load=1.0), [])
+        self.assertEqual(benchmark.compare({'bricks:1000': {'build': 1.0}}, self.baseline, 0.25), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+'''
+Checks of the bounding volume hierarchy's queries against brute force:
+
+    python -m unittest test_bvh
+'''
+
+import unittest
+import numpy
+import maths
+import bvh
+import culling
+from testing import CullingTestCase
+
+
+class InstanceBVHTest(CullingTestCase):
+
+    def testTreeMatchesBruteForce(self):
+        tree = bvh.InstanceBVH(self.centers, self.extents, leafSize=16)
+        mins, maxs = self.centers - self.extents, self.centers + self.extents
+
+        # Items added and moved since the build are found too
+        random = numpy.random.RandomState(1)
+        extraCenters = random.uniform(-50.0, 50.0, (100, 3))
+        tree.append(extraCenters - 1.0, extraCenters + 1.0)
+        mins = numpy.concatenate((mins, extraCenters - 1.0))
+        maxs = numpy.concatenate((maxs, extraCenters + 1.0))
+        for item in (0, 17, 4999, 5050):
+            mins[item], maxs[item] = maths.Vec3(5.0, 5.0, -20.0), maths.Vec3(6.0, 6.0, -19.0)
+            tree.setBounds(item, mins[item], maxs[item])
+        centers, extents = 0.5 * (mins + maxs), 0.5 * (maxs - mins)
+
+        for view in self.views:
+            planes = self.planesFor(view)
+            numpy.testing.assert_array_equal(
+                tree.inFrustum(planes), numpy.flatnonzero(culling.boxesInFrustum(planes, centers, extents))
+            )
+
+        boxMin, boxMax = numpy.array([-10.0, -20.0, -5.0]), numpy.array([15.0, 0.0, 25.0])
+        numpy.testing.assert_array_equal(
+            tree.inBox(boxMin, boxMax),
+            numpy.flatnonzero(((maxs >= boxMin) & (mins <= boxMax)).all(axis=1))
+        )
+
+        center, radius = numpy.array([3.0, -4.0, 8.0]), 17.0
+        nearest = numpy.clip(center, mins, maxs)
+        numpy.testing.assert_array_equal(
+            tree.inSphere(center, radius),
+            numpy.flatnonzero(((nearest - center)**2).sum(axis=1) <= radius*radius)
+        )
+
+        rebuilt = bvh.InstanceBVH.rebuilt(tree)
+        self.assertEqual(len(rebuilt), len(tree))
+        numpy.testing.assert_array_equal(rebuilt.inBox(boxMin, boxMax), tree.inBox(boxMin, boxMax))
+
+    def testUnorderedQueryFindsTheSameItems(self):
+        tree = bvh.InstanceBVH(self.centers, self.extents, leafSize=16)
+        for view in self.views:
+            planes = self.planesFor(view)
+            numpy.testing.assert_array_equal(numpy.sort(tree.inFrustum(planes, ordered=False)), tree.inFrustum(planes))
+
+    def testGrownKeepsContentsAndPadsWithZeros(self):
+        array = numpy.arange(6, dtype=numpy.float32).reshape((3, 2))
+        self.assertIs(bvh.grown(array, 3), array)
+        grown = bvh.grown(array, 4)
+        self.assertEqual(grown.shape, (6, 2))
+        numpy.testing.assert_array_equal(grown[:3], array)
+        self.assertFalse(grown[3:].any())
+
+
+if __name__ == '__main__':
+    unittest.main()
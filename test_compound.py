@@ -0,0 +1,111 @@
+'''
+Checks of flattening compounds into instance blocks:
+
+    python -m unittest test_compound
+'''
+
+import unittest
+import numpy
+import maths
+import compound
+import data # Registers the types used below
+from registered_type import getInstance
+from testing import instanceRows
+
+
+def flattenByTraversal(obj, matrix=maths.IDENTITY, params=None):
+    '''
+    Yields (primitive, matrix, params) for every primitive instance in
+    obj, visiting every child in turn. Params set closer to the primitive
+    win.
+    '''
+    params = params or {}
+    if not isinstance(obj, compound.Compound):
+        yield obj, numpy.asarray(matrix), params
+        return
+    for child, childMatrix, childParams in obj.children:
+        merged = dict(params)
+        merged.update(childParams)
+        for result in flattenByTraversal(child, numpy.dot(matrix, childMatrix), merged):
+            yield result
+
+
+class CompoundTest(unittest.TestCase):
+
+    def makeScene(self):
+        cube, quad = getInstance('Cube'), getInstance('Quad')
+
+        inner = compound.Compound()
+        inner.add(cube, maths.Translate(1.0, 0.0, 0.0), diffuse=maths.Vec3(1.0, 0.0, 0.0))
+        inner.add(quad, maths.RotateX(0.5))
+        inner.addMany(cube, numpy.arange(12, dtype=numpy.float32).reshape((4, 3)), specular=maths.Vec4(0.0, 0.0, 1.0, 8.0))
+
+        outer = compound.Compound()
+        outer.add(inner, maths.RotateY(0.25), diffuse=maths.Vec3(0.0, 1.0, 0.0), ambient=maths.Vec3(0.1, 0.1, 0.1))
+        outer.addMany(inner, 10.0 * numpy.arange(9, dtype=numpy.float32).reshape((3, 3)), ambient=maths.Vec3(0.2, 0.2, 0.2))
+        outer.add(cube, maths.Scale(2.0, 2.0, 2.0))
+        return inner, outer
+
+    def assertFlattensAsTraversed(self, obj):
+        flattened = obj.flatten()
+        traversed = {}
+        for primitive, matrix, params in flattenByTraversal(obj):
+            traversed.setdefault(primitive, []).append((matrix, params))
+        self.assertEqual(set(flattened), set(traversed))
+
+        names = ('ambient', 'diffuse', 'specular')
+        for primitive, instances in traversed.iteritems():
+            block = flattened[primitive]
+            self.assertEqual(len(block), len(instances))
+            expectedParams = {}
+            for name in names:
+                mask = numpy.array([name in params for _, params in instances])
+                values = numpy.zeros((len(instances), 4))
+                for i, (_, params) in enumerate(instances):
+                    if name in params:
+                        value = numpy.asarray(params[name], dtype=numpy.float64).reshape((-1,))
+                        values[i, :len(value)] = value
+                expectedParams[name] = (values, mask)
+            actualParams = {}
+            for name in names:
+                values, mask = block.params.get(name, (numpy.zeros((len(block), 0)), numpy.zeros((len(block),), dtype=bool)))
+                padded = numpy.zeros((len(block), 4))
+                padded[:, :values.shape[1]] = values
+                actualParams[name] = (padded, mask)
+
+            numpy.testing.assert_allclose(
+                instanceRows(block.matrices, actualParams, names),
+                instanceRows([matrix for matrix, _ in instances], expectedParams, names),
+                rtol=1e-5, atol=1e-5
+            )
+
+    def testFlattenMatchesTraversal(self):
+        inner, outer = self.makeScene()
+        self.assertFlattensAsTraversed(inner)
+        self.assertFlattensAsTraversed(outer)
+
+    def testSharedCompoundIsExpandedOnce(self):
+        inner, outer = self.makeScene()
+        innerBlocks = inner.flatten()
+        # Expanding inner's children again would fail
+        for group in inner.groups.itervalues():
+            group.block = None
+        other = compound.Compound()
+        other.addMany(inner, numpy.zeros((2, 3), dtype=numpy.float32))
+        for primitive, block in other.flatten().iteritems():
+            self.assertEqual(len(block), 2 * len(innerBlocks[primitive]))
+        self.assertIs(inner.flatten(), innerBlocks)
+        self.assertIs(outer.flatten(), outer.flatten())
+
+    def testNestedAddInvalidates(self):
+        inner, outer = self.makeScene()
+        before = sum(len(block) for block in outer.flatten().itervalues())
+        inner.add(getInstance('Cube'), maths.Translate(0.0, 5.0, 0.0))
+        after = sum(len(block) for block in outer.flatten().itervalues())
+        # One more in each of the four copies of inner
+        self.assertEqual(after, before + 4)
+        self.assertFlattensAsTraversed(outer)
+
+
+if __name__ == '__main__':
+    unittest.main()
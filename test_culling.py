@@ -0,0 +1,51 @@
+'''
+Checks of frustum culling:
+
+    python -m unittest test_culling
+'''
+
+import unittest
+import numpy
+import maths
+import culling
+import data # Registers the types used below
+from registered_type import getInstance
+from display_group import DisplayGroup
+from testing import MATERIAL, CullingTestCase, RecordingTestCase
+
+
+class CullingTest(CullingTestCase):
+
+    def testBoxesInFrustumMatchesCorners(self):
+        # A box is outside if all of its corners are behind one plane
+        signs = numpy.array([[x, y, z] for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)])
+        corners = self.centers[:, None] + signs[None] * self.extents[:, None]
+        for view in self.views:
+            planes = self.planesFor(view)
+            outside = numpy.zeros((len(self.centers),), dtype=bool)
+            for a, b, c, d in planes:
+                outside |= (corners.dot([a, b, c]) + d < 0).all(axis=1)
+            numpy.testing.assert_array_equal(culling.boxesInFrustum(planes, self.centers, self.extents), ~outside)
+
+
+class GroupCullingTest(RecordingTestCase):
+
+    def testGroupDrawsTheInstancesInView(self):
+        group = DisplayGroup()
+        getInstance('BritishFlag', height=20, spacing=1.1).addToGroup(group, maths.IDENTITY, **MATERIAL)
+        group.setModelMatrixBuffers()
+        eye = maths.Vec3(10.0, 5.0, 15.0)
+        view = maths.lookAt(eye, maths.Vec3(0.0, 0.0, -1.0), maths.Vec3(0.0, 1.0, 0.0))
+        group.updateUniforms(eye, view, maths.perspective(0.8, 1.6, 0.1, 100.0))
+        group.draw()
+
+        mins, maxs = group.bvh.itemMins, group.bvh.itemMaxs
+        planes = culling.frustumPlanes(group.viewProjMatrix)
+        inView = culling.boxesInFrustum(planes, 0.5 * (mins + maxs), 0.5 * (maxs - mins))
+        self.assertTrue(0 < group.numDrawn < group.numAlive)
+        self.assertEqual(group.numDrawn, inView.sum())
+        self.assertEqual(group.numDrawn + group.numCulled, group.numAlive)
+
+
+if __name__ == '__main__':
+    unittest.main()
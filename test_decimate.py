@@ -0,0 +1,75 @@
+'''
+Checks of mesh decimation for levels of detail:
+
+    python -m unittest test_decimate
+'''
+
+import unittest
+import numpy
+import decimate
+import mesh_builders
+import mesh_types
+from testing import RecordingTestCase
+
+
+def tilted(vertices):
+    '''
+    Rotates vertices out of the z=0 plane, into the plane x + y + z = 0.
+    '''
+    rotation = numpy.linalg.qr(numpy.array([[1.0, 0.0, 1.0], [0.0, 1.0, 1.0], [-1.0, -1.0, 1.0]]))[0]
+    return numpy.dot(vertices, rotation.T).astype(numpy.float32)
+
+
+class DecimateTest(unittest.TestCase):
+
+    def testMeetsTheBudgetWithValidTriangles(self):
+        vertices, indices = mesh_builders.heightfield(numpy.random.RandomState(0).rand(41, 41), 10.0, 10.0)
+        for target in (1000, 200, 20):
+            positions, normals, newIndices = decimate.decimate(vertices, indices, target)
+            triangles = newIndices.reshape((-1, 3))
+            self.assertTrue(target // 4 <= len(triangles) <= target)
+            self.assertIsNone(normals)
+            self.assertEqual(newIndices.dtype, numpy.uint32)
+            # Every vertex is used, and no triangle is collapsed or repeated
+            self.assertEqual(len(numpy.unique(newIndices)), len(positions))
+            self.assertTrue((triangles[:, 0] != triangles[:, 1]).all())
+            self.assertTrue((triangles[:, 1] != triangles[:, 2]).all())
+            self.assertTrue((triangles[:, 2] != triangles[:, 0]).all())
+            self.assertEqual(len(numpy.unique(numpy.sort(triangles, axis=1), axis=0)), len(triangles))
+
+    def testSmallMeshIsUnchanged(self):
+        vertices, indices = mesh_builders.grid(1.0, 1.0, 3, 3)
+        positions, _, newIndices = decimate.decimate(vertices, indices, len(indices) // 3)
+        numpy.testing.assert_array_equal(positions, vertices)
+        numpy.testing.assert_array_equal(newIndices, indices)
+
+    def testFlatMeshStaysInItsPlaneAndBounds(self):
+        vertices, indices = mesh_builders.grid(4.0, 2.0, 33, 17)
+        vertices = tilted(vertices)
+        positions, _, _ = decimate.decimate(vertices, indices, 100)
+        numpy.testing.assert_allclose(positions.sum(axis=1), 0.0, atol=1e-4)
+        self.assertTrue((positions >= vertices.min(axis=0) - 1e-5).all())
+        self.assertTrue((positions <= vertices.max(axis=0) + 1e-5).all())
+
+    def testNormalsAreAveragedPerVertex(self):
+        vertices, indices = mesh_builders.grid(1.0, 1.0, 21, 21)
+        normals = numpy.tile(numpy.array([0.0, 0.0, 2.0], dtype=numpy.float32), (len(vertices), 1))
+        positions, newNormals, _ = decimate.decimate(vertices, indices, 50, normals=normals)
+        self.assertEqual(newNormals.shape, positions.shape)
+        numpy.testing.assert_allclose(newNormals, numpy.tile([0.0, 0.0, 1.0], (len(positions), 1)), atol=1e-6)
+
+
+class DecimatedMeshTest(RecordingTestCase):
+
+    def testDecimatedMeshHasTheSameTypeAndFewerTriangles(self):
+        vertices, indices = mesh_builders.grid(1.0, 1.0, 21, 21)
+        for meshType in (mesh_types.VertexMesh, mesh_types.FlatNormalMesh):
+            mesh = meshType('Grid', vertices, indices)
+            simplified = mesh.decimated(0.25)
+            self.assertIs(type(simplified), meshType)
+            self.assertEqual(simplified.name, 'Grid@0.25')
+            self.assertTrue(0 < simplified.numTriangles <= 0.25 * mesh.numTriangles)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+'''
+Checks of a display group's instances and drawing, run headless on a
+RecordingBackend:
+
+    python -m unittest test_display_group
+'''
+
+import unittest
+import numpy
+import maths
+import culling
+import mesh_types
+import data # Registers the types used below
+from registered_type import getInstance
+from display_group import DisplayGroup
+from draw_list import DrawList
+from testing import MATERIAL, RecordingTestCase, byPosition
+
+
+class LiveEditTest(RecordingTestCase):
+
+    def makeGroup(self):
+        group = DisplayGroup()
+        getInstance('BritishFlag', height=10, spacing=1.1).addToGroup(group, maths.IDENTITY, **MATERIAL)
+        group.setModelMatrixBuffers()
+        return group
+
+    def recordOf(self, group, handle):
+        primitive, index = handle
+        return group.instanceData[group.globalIds[primitive][index]]
+
+    def materialOf(self, group, handle):
+        return group.materials.materials[self.recordOf(group, handle)['materialId']]
+
+    def found(self, group, handle, boxMin, boxMax):
+        primitive, index = handle
+        return any(p is primitive and index in indices for p, indices in group.instancesInBox(boxMin, boxMax))
+
+    def testAddToEmptyGroup(self):
+        for group in (DisplayGroup(), DisplayGroup()):
+            group.setModelMatrixBuffers()
+            handle = group.addInstance(getInstance('Cube'), maths.Translate(1.0, 2.0, 3.0), **MATERIAL)
+            self.assertEqual(group.numInstances(getInstance('Cube')), 1)
+            numpy.testing.assert_allclose(self.materialOf(group, handle)['diffuse'][:3], MATERIAL['diffuse'])
+            self.assertTrue(self.found(group, handle, (0.5, 1.5, 2.5), (1.5, 2.5, 3.5)))
+
+    def testRoundTrip(self):
+        group = self.makeGroup()
+        cube = getInstance('Cube')
+        numAlive = group.numAlive
+
+        handle = group.addInstance(cube, maths.Translate(100.0, 0.0, 0.0), **MATERIAL)
+        self.assertEqual(group.numAlive, numAlive + 1)
+        self.assertTrue(self.found(group, handle, (99.0, -1.0, -1.0), (101.0, 1.0, 1.0)))
+
+        # Moving it
+        group.updateInstance(handle, maths.Translate(0.0, 100.0, 0.0))
+        numpy.testing.assert_allclose(
+            self.recordOf(group, handle)['modelRows'],
+            numpy.asarray(maths.Translate(0.0, 100.0, 0.0).getMatrix())[:3]
+        )
+        self.assertFalse(self.found(group, handle, (99.0, -1.0, -1.0), (101.0, 1.0, 1.0)))
+        self.assertTrue(self.found(group, handle, (-1.0, 99.0, -1.0), (1.0, 101.0, 1.0)))
+
+        # Changing one param keeps the others
+        group.updateInstance(handle, diffuse=maths.Vec3(0.0, 0.0, 1.0))
+        material = self.materialOf(group, handle)
+        numpy.testing.assert_allclose(material['diffuse'][:3], (0.0, 0.0, 1.0))
+        numpy.testing.assert_allclose(material['specular'], MATERIAL['specular'])
+
+        # Removing it, then reusing its slot
+        group.removeInstance(handle)
+        self.assertEqual(group.numAlive, numAlive)
+        self.assertFalse(self.found(group, handle, (-1.0, 99.0, -1.0), (1.0, 101.0, 1.0)))
+        self.assertEqual(group.addInstance(cube, maths.Translate(0.0, -100.0, 0.0), **MATERIAL), handle)
+        self.assertTrue(self.found(group, handle, (-1.0, -101.0, -1.0), (1.0, -99.0, 1.0)))
+
+    def testAddInstanceBlockMatchesSetUp(self):
+        flag = getInstance('BritishFlag', height=10, spacing=1.1)
+        expected = self.makeGroup()
+        group = DisplayGroup()
+        for primitive, block in flag.flatten().iteritems():
+            # In pieces, as the asset pipeline adds them
+            placed = block.transformed(maths.IDENTITY, MATERIAL)
+            for start in xrange(0, len(placed), 37):
+                group.addInstanceBlock(primitive, placed.slice(start, start + 37))
+        self.assertEqual(group.numAlive, expected.numAlive)
+        boxMin, boxMax = (-1.0, -1.0, -1.0), (8.0, 5.0, 1.0)
+        self.assertEqual(
+            [(p, len(indices)) for p, indices in group.instancesInBox(boxMin, boxMax)],
+            [(p, len(indices)) for p, indices in expected.instancesInBox(boxMin, boxMax)]
+        )
+
+
+class DrawTest(RecordingTestCase):
+
+    def makeGroup(self):
+        group = DisplayGroup()
+        getInstance('BritishFlag', height=10, spacing=1.1).addToGroup(group, maths.IDENTITY, **MATERIAL)
+        # Without normals, so in a second arena
+        cube = getInstance('Cube', policy=mesh_types.MEMORY)
+        cube.addToGroup(group, maths.Translate(0.0, 0.0, -5.0).getMatrix(), **MATERIAL)
+        group.setModelMatrixBuffers()
+        view = maths.lookAt(maths.Vec3(10.0, 5.0, 30.0), maths.Vec3(0.0, 0.0, -1.0), maths.Vec3(0.0, 1.0, 0.0))
+        group.updateUniforms(maths.Vec3(10.0, 5.0, 30.0), view, maths.perspective(45.0, 1.6, 0.1, 100.0))
+        return group
+
+    def testOneMultiDrawPerArena(self):
+        group = self.makeGroup()
+        group.draw()
+        self.assertEqual(len(group.drawList.arenas), 2)
+
+        for _ in xrange(3):
+            self.backend.reset()
+            group.draw()
+            self.assertEqual(self.backend.counts['glMultiDrawElementsIndirect'], 2)
+            # Nothing is reallocated once the first frame is drawn
+            self.assertEqual(self.backend.counts['glBufferData'], 0)
+            self.assertEqual(self.backend.counts['compileProgram'], 0)
+
+    def testStillOneMultiDrawPerArenaAfterAdding(self):
+        group = self.makeGroup()
+        group.draw()
+        group.addInstance(getInstance('Brick', x_size=1.0, y_size=0.5, x_rows=3, y_rows=3, max_bump=0.0), maths.IDENTITY, **MATERIAL)
+        self.backend.reset()
+        group.draw()
+        self.assertEqual(self.backend.counts['glMultiDrawElementsIndirect'], len(group.drawList.arenas))
+
+    def testStreamedCommandsDrawEachVisibleInstanceAtItsLevel(self):
+        group = self.makeGroup()
+        brick = getInstance('Brick', x_size=1.0, y_size=1.0, x_rows=8, y_rows=8, max_bump=0.1)
+        brick.setLevelsOfDetail((0.25,), (0.02,))
+        for z in xrange(0, 200, 4):
+            brick.addToGroup(group, maths.Translate(10.0, 5.0, -float(z)).getMatrix(), **MATERIAL)
+        group.setModelMatrixBuffers()
+        group.draw()
+        self.assertTrue(group.numDrawn < group.numAlive)
+
+        planes = culling.frustumPlanes(group.viewProjMatrix)
+        mins, maxs = group.bvh.itemMins, group.bvh.itemMaxs
+        visible = numpy.flatnonzero(culling.boxesInFrustum(planes, 0.5 * (mins + maxs), 0.5 * (maxs - mins)))
+        numCommands = len(group.drawList)
+        start = group.commandOffset // group.commandRing.dtype.itemsize
+        commands = group.commandRing.records[start:start + numCommands]
+        numLevels = [0, 0]
+        for primitive, indices in group.splitByPrimitive(visible):
+            globalIds = group.globalIds[primitive][indices]
+            levels = primitive.lodLevels(group.centers[globalIds], group.radii[globalIds], group.cameraPosition)
+            for level, mesh in enumerate(primitive.meshes):
+                command = commands[group.drawList.meshes.index(mesh)]
+                self.assertEqual(command['count'], 3 * mesh.numTriangles)
+                base, count = command['baseInstance'], command['instanceCount']
+                numpy.testing.assert_array_equal(
+                    byPosition(group.instanceRing.records[base:base + count]),
+                    byPosition(group.instanceData[globalIds[levels == level]])
+                )
+                if primitive is brick:
+                    numLevels[level] = count
+        # Near bricks are drawn in full and far ones simplified
+        self.assertTrue(all(numLevels))
+        self.assertEqual(commands['instanceCount'].sum(), group.numDrawn)
+
+
+class DrawListTest(RecordingTestCase):
+
+    def testSlotsAndSizesOfEachLevel(self):
+        cube = getInstance('Cube')
+        brick = getInstance('Brick', x_size=1.0, y_size=1.0, x_rows=6, y_rows=6, max_bump=0.1)
+        brick.setLevelsOfDetail((0.5, 0.1), (0.2, 0.05))
+        drawList = DrawList([cube, brick])
+
+        self.assertEqual(drawList.slots.shape, (2, 3))
+        self.assertIs(drawList.meshes[drawList.slots[0, 0]], cube.meshes[0])
+        for level, mesh in enumerate(brick.meshes):
+            self.assertIs(drawList.meshes[drawList.slots[1, level]], mesh)
+        numpy.testing.assert_allclose(drawList.lodSizes, [[0.0, 0.0], [0.2, 0.05]])
+        # Each arena's commands are together
+        for _, batch in drawList.batches:
+            for arena, start, count in batch:
+                self.assertTrue(all(mesh.arena is arena for mesh in drawList.meshes[start:start + count]))
+        self.assertEqual(list(drawList.commands['count']), [3 * mesh.numTriangles for mesh in drawList.meshes])
+        self.assertEqual(list(drawList.numTriangles), [mesh.numTriangles for mesh in drawList.meshes])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+'''
+Checks of the buffers a geometry arena sends to the GL, run headless on a
+RecordingBackend:
+
+    python -m unittest test_geometry_arena
+'''
+
+import unittest
+import numpy
+import mesh_types
+from geometry_arena import GeometryArena, INDEX_DTYPE
+from mesh_types import INSTANCE_DTYPE
+from testing import RecordingTestCase
+
+
+class Piece(object):
+    '''
+    Just the arrays of a mesh, to add to an arena of our own.
+    '''
+
+    def __init__(self, numVertices, numIndices, seed):
+        random = numpy.random.RandomState(seed)
+        self.vertexData = numpy.empty(numVertices, dtype=mesh_types.POSITION_DTYPE)
+        self.vertexData['position'] = random.rand(numVertices, 3)
+        self.indexData = random.randint(0, numVertices, numIndices).astype(INDEX_DTYPE)
+
+
+class GeometryArenaTest(RecordingTestCase):
+
+    def setUp(self):
+        RecordingTestCase.setUp(self)
+        self.backend.keepCalls = True
+        self.arena = GeometryArena(mesh_types.POSITION_DTYPE, mesh_types.VertexMesh.PROGRAM, INSTANCE_DTYPE)
+
+    def contents(self):
+        '''
+        Replays the recorded buffer calls, returning {buffer: bytes}.
+        '''
+        bound, contents = {}, {}
+        for name, args in self.backend.calls:
+            if name == 'glBindBuffer':
+                bound[args[0]] = args[1]
+            elif name == 'glBufferData':
+                contents[bound[args[0]]] = bytearray(args[1])
+            elif name == 'glBufferSubData':
+                target, offset, size, data = args
+                contents[bound[target]][offset:offset + size] = data.tostring()
+        return contents
+
+    def assertHolds(self, pieces):
+        contents = self.contents()
+        vertices = numpy.concatenate([piece.vertexData for piece in pieces]).tostring()
+        indices = numpy.concatenate([piece.indexData for piece in pieces]).tostring()
+        self.assertEqual(bytes(contents[self.arena.vbo][:len(vertices)]), vertices)
+        self.assertEqual(bytes(contents[self.arena.ibo][:len(indices)]), indices)
+
+    def testBuffersHoldTheMeshesOneAfterAnother(self):
+        pieces = [Piece(10 + i, 3 * (5 + i), i) for i in xrange(4)]
+        for piece in pieces:
+            self.arena.add(piece)
+        self.arena.upload()
+        self.assertHolds(pieces)
+        self.assertEqual([piece.baseVertex for piece in pieces], [0, 10, 21, 33])
+        self.assertEqual([piece.firstIndex for piece in pieces], [0, 15, 33, 54])
+
+    def namesSince(self, start):
+        return [name for name, _ in self.backend.calls[start:]]
+
+    def testOnlyNewMeshesAreSent(self):
+        pieces = [Piece(100, 300, 0), Piece(10, 30, 1)]
+        for piece in pieces:
+            self.arena.add(piece)
+            self.arena.upload()
+
+        # Nothing new, nothing sent
+        start, uploaded = len(self.backend.calls), self.backend.bytesUploaded
+        self.arena.upload()
+        self.assertEqual(self.namesSince(start), [])
+
+        # The buffers grew to twice the first piece, so there's room for this
+        pieces.append(Piece(20, 60, 2))
+        self.arena.add(pieces[-1])
+        start = len(self.backend.calls)
+        self.arena.upload()
+        self.assertEqual(self.namesSince(start).count('glBufferData'), 0)
+        self.assertEqual(self.namesSince(start).count('glBufferSubData'), 2)
+        self.assertEqual(
+            self.backend.bytesUploaded - uploaded, pieces[-1].vertexData.nbytes + pieces[-1].indexData.nbytes
+        )
+        self.assertHolds(pieces)
+
+    def testGrowingResendsEverything(self):
+        pieces = [Piece(100, 300, 0)]
+        self.arena.add(pieces[0])
+        self.arena.upload()
+        capacity = self.arena.vertexCapacity
+
+        pieces.append(Piece(10, 30, 1))
+        self.arena.add(pieces[1])
+        start = len(self.backend.calls)
+        self.arena.upload()
+        self.assertEqual(self.arena.vertexCapacity, 2 * capacity)
+        self.assertEqual(self.namesSince(start).count('glBufferData'), 2)
+        self.assertEqual(self.namesSince(start).count('glBufferSubData'), 4)
+        self.assertHolds(pieces)
+
+
+if __name__ == '__main__':
+    unittest.main()
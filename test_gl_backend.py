@@ -0,0 +1,84 @@
+'''
+Checks of the headless GL backends:
+
+    python -m unittest test_gl_backend
+'''
+
+import unittest
+import gl_backend
+from gl_backend import GL, NullBackend, RecordingBackend
+
+
+class NullBackendTest(unittest.TestCase):
+
+    def testNamesCountUp(self):
+        backend = NullBackend()
+        self.assertEqual(backend.glGenBuffers(1), 1)
+        self.assertEqual(backend.glGenBuffers(2), [2, 3])
+        self.assertEqual(backend.glCreateProgram(), 4)
+        self.assertEqual(backend.compileProgram(), 5)
+
+    def testConstantsAreDistinctAndKept(self):
+        backend = NullBackend()
+        self.assertNotEqual(backend.GL_ARRAY_BUFFER, backend.GL_ELEMENT_ARRAY_BUFFER)
+        self.assertEqual(backend.GL_ARRAY_BUFFER, backend.GL_ARRAY_BUFFER)
+        self.assertEqual(backend.glClientWaitSync(1, 0, 0), backend.GL_ALREADY_SIGNALED)
+        self.assertEqual(backend.glDrawArrays(backend.GL_TRIANGLES, 0, 3), 0)
+        self.assertRaises(AttributeError, getattr, backend, 'notAGLName')
+
+
+class RecordingBackendTest(unittest.TestCase):
+
+    def testCallsAndCounts(self):
+        backend = RecordingBackend()
+        backend.glEnable(backend.GL_DEPTH_TEST)
+        backend.glEnable(backend.GL_CULL_FACE)
+        backend.compileProgram()
+        self.assertEqual(backend.counts['glEnable'], 2)
+        self.assertEqual(backend.counts['compileProgram'], 1)
+        self.assertEqual(backend.calls, [('glEnable', (backend.GL_DEPTH_TEST,)), ('glEnable', (backend.GL_CULL_FACE,))])
+
+        backend = RecordingBackend(keepCalls=False)
+        backend.glEnable(backend.GL_DEPTH_TEST)
+        self.assertEqual(backend.calls, [])
+        self.assertEqual(backend.counts['glEnable'], 1)
+
+    def testBufferSizesAndBytesUploaded(self):
+        backend = RecordingBackend()
+        vertices, indices = backend.glGenBuffers(2)
+        backend.glBindBuffer(backend.GL_ARRAY_BUFFER, vertices)
+        backend.glBufferData(backend.GL_ARRAY_BUFFER, 1000, None, backend.GL_STATIC_DRAW)
+        backend.glBufferSubData(backend.GL_ARRAY_BUFFER, 100, 200, None)
+        backend.glBindBuffer(backend.GL_ARRAY_BUFFER, indices)
+        backend.glBufferStorage(backend.GL_ARRAY_BUFFER, 64, b'x' * 64, 0)
+        self.assertEqual(backend.bufferSizes, {vertices: 1000, indices: 64})
+        self.assertEqual(backend.bufferBytes(), 1064)
+        # Allocating without data uploads nothing
+        self.assertEqual(backend.bytesUploaded, 264)
+
+        # Sizes describe the GL's state, so are kept through a reset
+        backend.reset()
+        self.assertEqual((backend.calls, backend.bytesUploaded, backend.counts['glBufferData']), ([], 0, 0))
+        self.assertEqual(backend.bufferBytes(), 1064)
+
+        backend.glDeleteBuffers(1, [vertices])
+        self.assertEqual(backend.bufferSizes, {indices: 64})
+
+
+class UseTest(unittest.TestCase):
+
+    def tearDown(self):
+        gl_backend.use(NullBackend())
+
+    def testProxyForwardsToTheBackendInUse(self):
+        first = gl_backend.use(RecordingBackend())
+        GL.glFlush()
+        self.assertIs(gl_backend.current(), first)
+        # Changing backend drops the names the proxy has kept
+        second = gl_backend.use(RecordingBackend())
+        GL.glFlush()
+        self.assertEqual((first.counts['glFlush'], second.counts['glFlush']), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
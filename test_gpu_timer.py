@@ -0,0 +1,95 @@
+'''
+Checks of the GPU timer's late readback, on a backend that makes up each
+query's result:
+
+    python -m unittest test_gpu_timer
+'''
+
+import itertools
+import unittest
+import gl_backend
+import profiler
+from gpu_timer import GpuTimer, NUM_FRAMES
+
+
+class QueryBackend(gl_backend.NullBackend):
+    '''
+    Gives each query begun a time 1ms longer than the last, and reports
+    results as available or not as self.available says.
+    '''
+
+    def __init__(self):
+        gl_backend.NullBackend.__init__(self)
+        self.nanoseconds = itertools.count(1000000, 1000000)
+        self.results = {}
+        self.numQueries = 0
+        self.available = True
+
+    def glGenQueries(self, count):
+        self.numQueries += count
+        return self.makeNames(count)
+
+    def glBeginQuery(self, target, query):
+        self.results[query] = next(self.nanoseconds)
+
+    def glGetQueryObjectiv(self, query, name):
+        return int(self.available)
+
+    def glGetQueryObjectui64v(self, query, name):
+        return self.results[query]
+
+
+class GpuTimerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = gl_backend.use(QueryBackend())
+        self.saved = profiler.ENABLED, profiler.PROFILER
+        profiler.ENABLED, profiler.PROFILER = True, profiler.Profiler()
+        self.timer = GpuTimer()
+
+    def tearDown(self):
+        profiler.ENABLED, profiler.PROFILER = self.saved
+        gl_backend.use(gl_backend.NullBackend())
+
+    def frame(self, available=True):
+        '''
+        Draws a frame of two timed batches, returning the times added to
+        it, with results reported as available or not.
+        '''
+        self.backend.available = available
+        profiler.beginFrame()
+        self.timer.beginFrame()
+        for name in ('scene', 'ui'):
+            self.timer.begin(name)
+            self.timer.end()
+        times = dict(profiler.PROFILER.times)
+        profiler.endFrame()
+        return times
+
+    def testResultsAreReadNumFramesLate(self):
+        for _ in xrange(NUM_FRAMES):
+            self.assertEqual(self.frame(), {})
+        for i in xrange(2 * NUM_FRAMES):
+            # Frame i's batches took (2i + 1)ms and (2i + 2)ms
+            times = self.frame()
+            self.assertAlmostEqual(times['gpu/scene'], 0.001 * (2*i + 1))
+            self.assertAlmostEqual(times['gpu/ui'], 0.001 * (2*i + 2))
+            self.assertAlmostEqual(times['gpu'], 0.001 * (4*i + 3))
+        # Each slot's queries are reused
+        self.assertEqual(self.backend.numQueries, 2 * NUM_FRAMES)
+
+    def testUnfinishedResultsAreDropped(self):
+        for _ in xrange(NUM_FRAMES):
+            self.frame()
+        # The first frame's queries haven't finished
+        self.assertEqual(self.frame(available=False), {})
+        # Its slot was reused, so the next frame read is the second
+        self.assertAlmostEqual(self.frame()['gpu/scene'], 0.003)
+        for _ in xrange(NUM_FRAMES - 2):
+            self.frame()
+        self.assertAlmostEqual(self.frame()['gpu/scene'], 0.001 * (2*NUM_FRAMES + 1))
+        self.assertEqual(self.backend.numQueries, 2 * NUM_FRAMES)
+
+
+if __name__ == '__main__':
+    unittest.main()
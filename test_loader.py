@@ -0,0 +1,66 @@
+'''
+Checks of making and flattening objects across a process pool:
+
+    python -m unittest test_loader
+'''
+
+import unittest
+import numpy
+import maths
+import loader
+import data # Registers the types used below
+from functools import partial
+from registered_type import getInstance
+from testing import MATERIAL, instanceRows
+
+NAMES = ('ambient', 'diffuse', 'specular')
+
+
+class LoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.minParallelInstances = loader.MIN_PARALLEL_INSTANCES
+
+    def tearDown(self):
+        loader.MIN_PARALLEL_INSTANCES = self.minParallelInstances
+
+    def makeJobs(self):
+        blue = dict(MATERIAL, diffuse=maths.Vec3(0.0, 0.0, 1.0))
+        return [
+            (partial(getInstance, 'BrickWallCollection'), maths.Translate(0.0, 0.0, -50.0).getMatrix(), MATERIAL),
+            (partial(getInstance, 'BrickWall'), maths.Scale(2.0, 2.0, 2.0).getMatrix(), blue),
+            (partial(getInstance, 'House', sizeX=20.0, sizeZ=80.0), maths.IDENTITY, MATERIAL),
+        ]
+
+    def assertSameInstances(self, actual, expected):
+        self.assertEqual(set(actual), set(expected))
+        for primitive, block in expected.iteritems():
+            numpy.testing.assert_allclose(
+                instanceRows(actual[primitive].matrices, actual[primitive].params, NAMES),
+                instanceRows(block.matrices, block.params, NAMES),
+                rtol=1e-6
+            )
+
+    def testObjectsMadeInWorkersMatchSerial(self):
+        jobs = self.makeJobs()
+        # At least as many jobs as processes
+        self.assertSameInstances(loader.flattenInParallel(jobs, 2), loader.flattenInParallel(jobs, 1))
+
+    def testPartsFlattenedInWorkersMatchSerial(self):
+        jobs = self.makeJobs()[:2]
+        loader.MIN_PARALLEL_INSTANCES = 0
+        # Two parts of each job
+        self.assertSameInstances(loader.flattenInParallel(jobs, 3), loader.flattenInParallel(jobs, 1))
+
+    def testFlattenPartsMakeTheWhole(self):
+        obj = getInstance('BrickWallCollection')
+        for primitive, block in obj.flatten().iteritems():
+            parts = [obj.flattenPart(part, 4).get(primitive) for part in xrange(4)]
+            matrices = numpy.concatenate([part.matrices for part in parts if part is not None])
+            numpy.testing.assert_allclose(
+                instanceRows(matrices, {}, ()), instanceRows(block.matrices, {}, ()), rtol=1e-6
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
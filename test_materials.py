@@ -0,0 +1,61 @@
+'''
+Checks of the material table:
+
+    python -m unittest test_materials
+'''
+
+import unittest
+import numpy
+from instances import InstanceBlock, IDENTITY_STACK, paramArrays
+from materials import MaterialTable
+from testing import MATERIAL, RecordingTestCase
+
+RED = dict(MATERIAL, diffuse=(1.0, 0.0, 0.0))
+BLUE = dict(MATERIAL, diffuse=(0.0, 0.0, 1.0))
+
+
+def blockOf(materials):
+    '''
+    An InstanceBlock with an instance for each of a list of materials.
+    '''
+    return InstanceBlock(numpy.repeat(IDENTITY_STACK, len(materials), axis=0), paramArrays(materials))
+
+
+class MaterialTableTest(RecordingTestCase):
+
+    def testInternStoresEachMaterialOnce(self):
+        table = MaterialTable()
+        materials = [RED, BLUE, RED, MATERIAL, BLUE, RED] * 10
+        indices = table.intern(blockOf(materials))
+        self.assertEqual(indices.dtype, numpy.uint32)
+        self.assertEqual(len(table), 3)
+        for index, material in zip(indices, materials):
+            numpy.testing.assert_allclose(table.materials[index]['diffuse'][:3], material['diffuse'])
+            numpy.testing.assert_allclose(table.materials[index]['specular'], material['specular'])
+
+        # Known materials keep their indices, and new ones are appended
+        again = table.intern(blockOf([BLUE, dict(MATERIAL, ambient=(0.1, 0.1, 0.1)), RED]))
+        self.assertEqual(len(table), 4)
+        self.assertEqual(list(again), [indices[1], 3, indices[0]])
+        self.assertEqual(table.internMaterial(**RED), indices[0])
+        self.assertEqual(table.internMaterial(**dict(RED, diffuse=(0.0, 1.0, 0.0))), 4)
+
+    def testUploadsOnlyWhenTheTableGrows(self):
+        table = MaterialTable()
+        table.intern(blockOf([RED, BLUE]))
+        table.upload()
+        self.assertEqual(self.backend.counts['glBufferData'], 1)
+        self.assertEqual(self.backend.bytesUploaded, table.materials.nbytes)
+
+        self.backend.reset()
+        table.intern(blockOf([BLUE, RED]))
+        table.upload()
+        self.assertEqual(self.backend.counts['glBufferData'], 0)
+
+        table.internMaterial(**MATERIAL)
+        table.upload()
+        self.assertEqual(self.backend.counts['glBufferData'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
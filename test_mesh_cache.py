@@ -0,0 +1,79 @@
+'''
+Checks of the on-disk mesh cache, in a temporary directory:
+
+    python -m unittest test_mesh_cache
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+import mesh_cache
+
+
+class MeshCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.saved = mesh_cache.CACHE_DIR, mesh_cache.ENABLED, mesh_cache.LOADER_VERSION
+        mesh_cache.CACHE_DIR = os.path.join(self.directory, 'cache')
+        mesh_cache.ENABLED = True
+        self.vertices = numpy.arange(36, dtype=numpy.float32)
+        self.indices = numpy.arange(12, dtype=numpy.uint32)
+
+    def tearDown(self):
+        mesh_cache.CACHE_DIR, mesh_cache.ENABLED, mesh_cache.LOADER_VERSION = self.saved
+        shutil.rmtree(self.directory)
+
+    def writeSource(self, name, contents):
+        filename = os.path.join(self.directory, name)
+        with open(filename, 'w') as f:
+            f.write(contents)
+        return filename
+
+    def testStoredBuffersAreLoaded(self):
+        key = mesh_cache.cacheKey(self.writeSource('a.obj', 'v 0 0 0\n'))
+        self.assertIsNone(mesh_cache.load(key))
+        mesh_cache.store(key, self.vertices, self.indices)
+
+        vertices, indices = mesh_cache.load(key)
+        numpy.testing.assert_array_equal(vertices, self.vertices)
+        numpy.testing.assert_array_equal(indices, self.indices)
+        self.assertFalse(vertices.flags.writeable)
+
+    def testKeyFollowsContentsOptionsAndVersion(self):
+        key = mesh_cache.cacheKey(self.writeSource('a.obj', 'v 0 0 0\n'), normals=True)
+        # Same contents elsewhere
+        self.assertEqual(mesh_cache.cacheKey(self.writeSource('b.obj', 'v 0 0 0\n'), normals=True), key)
+        self.assertNotEqual(mesh_cache.cacheKey(self.writeSource('a.obj', 'v 1 0 0\n'), normals=True), key)
+        self.assertNotEqual(mesh_cache.cacheKey(self.writeSource('a.obj', 'v 0 0 0\n'), normals=False), key)
+        mesh_cache.LOADER_VERSION += 1
+        self.assertNotEqual(mesh_cache.cacheKey(self.writeSource('a.obj', 'v 0 0 0\n'), normals=True), key)
+        self.assertNotEqual(mesh_cache.derivedKey(key, lod=0.25), mesh_cache.derivedKey(key, lod=0.05))
+
+    def testInvalidatedAndDisabledEntriesAreMissed(self):
+        mesh_cache.store('key', self.vertices, self.indices)
+        mesh_cache.ENABLED = False
+        self.assertIsNone(mesh_cache.load('key'))
+        mesh_cache.ENABLED = True
+        self.assertIsNotNone(mesh_cache.load('key'))
+        mesh_cache.invalidate('key')
+        self.assertIsNone(mesh_cache.load('key'))
+
+    def testEvictionKeepsTheMostRecentlyUsed(self):
+        for i, key in enumerate(('old', 'used', 'new')):
+            mesh_cache.store(key, self.vertices, self.indices)
+            for name in mesh_cache.ARRAY_NAMES:
+                os.utime(mesh_cache._path(key, name), (1000 + i, 1000 + i))
+        entrySize = sum(size for _, size, key in mesh_cache._entries() if key == 'old')
+        # Loading marks it as used just now
+        mesh_cache.load('used')
+        mesh_cache.evict(2 * entrySize)
+        self.assertIsNone(mesh_cache.load('old'))
+        self.assertIsNotNone(mesh_cache.load('used'))
+        self.assertIsNotNone(mesh_cache.load('new'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+'''
+Checks of the index buffer optimization pass:
+
+    python -m unittest test_mesh_optimize
+'''
+
+import unittest
+import numpy
+import mesh_builders
+import mesh_optimize
+from mesh_types import POSITION_DTYPE
+
+
+def trianglePositions(vertexData, indices):
+    '''
+    Returns the sorted rows of each triangle's corner positions, to
+    compare meshes whose triangles and vertices are in any order.
+    '''
+    rows = vertexData['position'][indices].reshape((-1, 9))
+    return rows[numpy.lexsort(rows.T[::-1])]
+
+
+class MeshOptimizeTest(unittest.TestCase):
+
+    def setUp(self):
+        vertices, indices = mesh_builders.heightfield(numpy.random.RandomState(0).rand(30, 30), 5.0, 5.0)
+        self.vertexData = vertices.view(POSITION_DTYPE).reshape((-1,))
+        # Triangles in a random order, so there is something to improve
+        triangles = indices.reshape((-1, 3))
+        self.indices = triangles[numpy.random.RandomState(1).permutation(len(triangles))].reshape((-1,))
+
+    def testAcmr(self):
+        self.assertEqual(mesh_optimize.acmr([]), 0.0)
+        self.assertEqual(mesh_optimize.acmr([0, 1, 2]), 3.0)
+        # The second triangle is all cache hits
+        self.assertEqual(mesh_optimize.acmr([0, 1, 2, 2, 1, 0]), 1.5)
+        # Vertex 0 has been pushed out of a 3 entry cache by the time it's used again
+        self.assertEqual(mesh_optimize.acmr([0, 1, 2, 3, 4, 5, 0, 4, 5], cacheSize=3), 7 / 3.0)
+
+    def testTipsifyOrdersEveryTriangleOnce(self):
+        triangles = self.indices.reshape((-1, 3))
+        order, clusterStarts = mesh_optimize.tipsify(triangles, len(self.vertexData))
+        self.assertEqual(sorted(order), range(len(triangles)))
+        self.assertEqual(clusterStarts[0], 0)
+        self.assertTrue(all(a < b for a, b in zip(clusterStarts, clusterStarts[1:])))
+        self.assertTrue(clusterStarts[-1] < len(triangles))
+        self.assertTrue(mesh_optimize.acmr(triangles[order].reshape((-1,))) < mesh_optimize.acmr(self.indices))
+
+    def testOptimizeKeepsTheTrianglesAndLowersAcmr(self):
+        vertexData, indices = mesh_optimize.optimize(self.vertexData, self.indices)
+        numpy.testing.assert_array_equal(
+            trianglePositions(vertexData, indices), trianglePositions(self.vertexData, self.indices)
+        )
+        self.assertTrue(mesh_optimize.acmr(indices) < 0.7 * mesh_optimize.acmr(self.indices))
+        # Vertices are numbered in the order they're first used
+        _, first = numpy.unique(indices, return_index=True)
+        self.assertTrue((numpy.diff(first) > 0).all())
+        self.assertEqual(len(vertexData), len(numpy.unique(indices)))
+
+    def testWeldMergesIdenticalVertices(self):
+        vertexData = numpy.concatenate((self.vertexData, self.vertexData[:10]))
+        indices = numpy.concatenate((self.indices, len(self.vertexData) + numpy.arange(9, dtype=numpy.uint32)))
+        welded, weldedIndices = mesh_optimize.weld(vertexData, indices)
+        self.assertEqual(len(welded), len(self.vertexData))
+        numpy.testing.assert_array_equal(welded['position'][weldedIndices], vertexData['position'][indices])
+
+
+if __name__ == '__main__':
+    unittest.main()
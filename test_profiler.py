@@ -0,0 +1,134 @@
+'''
+Checks of the frame profiler, on a clock that only moves when told to:
+
+    python -m unittest test_profiler
+'''
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+import profiler
+
+
+class Clock(object):
+    '''
+    Stands in for the time module.
+    '''
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.savedTime = profiler.time
+        profiler.time = self.clock
+        self.profiler = profiler.Profiler(history=100)
+
+    def tearDown(self):
+        profiler.time = self.savedTime
+
+    def frame(self, drawSeconds, cullSeconds=0.0, gpuSeconds=0.0, **counters):
+        '''
+        Records a frame of a 'draw' scope with a 'cull' scope inside it,
+        and gpuSeconds added as 'gpu'.
+        '''
+        self.profiler.beginFrame()
+        with self.profiler.scope('draw'):
+            self.clock.advance(drawSeconds)
+            if cullSeconds:
+                with self.profiler.scope('cull'):
+                    self.clock.advance(cullSeconds)
+        for name, value in counters.iteritems():
+            self.profiler.counters[name] += value
+        if gpuSeconds:
+            self.profiler.times['gpu'] += gpuSeconds
+        self.clock.advance(0.001)
+        self.profiler.endFrame()
+
+    def testScopesAreNamedByTheirPath(self):
+        self.frame(0.002, 0.003, drawCalls=4)
+        self.frame(0.002, gpuSeconds=0.005)
+        first, second = self.profiler.frames
+        self.assertEqual([(path, depth) for path, depth, _, _ in first.events], [('draw/cull', 1), ('draw', 0)])
+        times = first.scopeTimes()
+        self.assertAlmostEqual(times['draw'], 0.005)
+        self.assertAlmostEqual(times['draw/cull'], 0.003)
+        self.assertAlmostEqual(times['frame'], 0.006)
+        self.assertEqual(first.counters, {'drawCalls': 4})
+        # Times added during the frame are reported along with the scopes
+        self.assertAlmostEqual(second.scopeTimes()['gpu'], 0.005)
+
+        # Frames without a scope or counter count as zero
+        times, counters = self.profiler.series()
+        numpy.testing.assert_allclose(times['draw/cull'], [0.003, 0.0])
+        numpy.testing.assert_allclose(counters['drawCalls'], [4, 0])
+
+    def testPercentilesOverTheFramesKept(self):
+        for i in xrange(150):
+            self.frame(0.001 * i, drawCalls=i)
+        self.assertEqual(self.profiler.numFrames, 150)
+        summary = self.profiler.summary()
+        self.assertEqual(summary['frames'], 100)
+        # Only the last 100 frames are kept
+        draw = 0.001 * numpy.arange(50, 150)
+        for p in profiler.PERCENTILES:
+            self.assertAlmostEqual(summary['scopes']['draw']['p%d' % p], numpy.percentile(draw, p))
+            self.assertAlmostEqual(summary['counters']['drawCalls']['p%d' % p], numpy.percentile(numpy.arange(50, 150), p))
+        self.assertAlmostEqual(summary['scopes']['frame']['mean'], draw.mean() + 0.001)
+        self.assertEqual(len(self.profiler.report().splitlines()), 6)
+
+    def testChromeTrace(self):
+        self.frame(0.002, 0.003, drawCalls=4)
+        self.frame(0.002, gpuSeconds=0.005)
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'trace.json')
+            self.profiler.exportChromeTrace(filename)
+            with open(filename) as f:
+                events = json.load(f)['traceEvents']
+        finally:
+            shutil.rmtree(directory)
+
+        spans = [(e['name'], e['ts'], e['dur']) for e in events if e['ph'] == 'X']
+        # Microseconds from the start of the first frame
+        self.assertEqual(spans, [
+            ('frame', 0.0, 6000.0), ('cull', 2000.0, 3000.0), ('draw', 0.0, 5000.0),
+            ('frame', 6000.0, 3000.0), ('draw', 6000.0, 2000.0),
+        ])
+        self.assertEqual(
+            [e['args']['path'] for e in events if e['ph'] == 'X' and e['name'] != 'frame'], ['draw/cull', 'draw', 'draw']
+        )
+        counters = [(e['name'], e['ts'], e['args']) for e in events if e['ph'] == 'C']
+        self.assertEqual(counters[0], ('drawCalls', 0.0, {'drawCalls': 4}))
+        self.assertEqual(counters[1][:2], ('gpu (ms)', 6000.0))
+        self.assertAlmostEqual(counters[1][2]['gpu'], 5.0)
+
+    def testDisabledDoesNothing(self):
+        saved = profiler.ENABLED, profiler.PROFILER
+        profiler.ENABLED, profiler.PROFILER = False, self.profiler
+        try:
+            profiler.beginFrame()
+            self.assertIs(profiler.scope('draw'), profiler.NULL_SCOPE)
+            profiler.count('drawCalls')
+            profiler.addTime('gpu', 1.0)
+            profiler.endFrame()
+        finally:
+            profiler.ENABLED, profiler.PROFILER = saved
+        self.assertEqual(len(self.profiler.frames), 0)
+        self.assertEqual(self.profiler.counters, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
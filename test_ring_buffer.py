@@ -0,0 +1,90 @@
+'''
+Checks that ring buffer regions are only written once the GPU is done
+with them, on a backend whose fence waits give scripted results:
+
+    python -m unittest test_ring_buffer
+'''
+
+import itertools
+import unittest
+import numpy
+import gl_backend
+import ring_buffer
+from gl_backend import GL
+from ring_buffer import RingBuffer, FenceWaitFailedException
+
+
+class FenceBackend(gl_backend.NullBackend):
+    '''
+    A NullBackend whose glClientWaitSync returns the named results in
+    turn, over and over, and which keeps the fences it has said are
+    signalled.
+    '''
+
+    def __init__(self, results):
+        super(FenceBackend, self).__init__()
+        self.results = itertools.cycle(results)
+        self.signalled = set()
+
+    def glClientWaitSync(self, fence, flags, timeout):
+        name = next(self.results)
+        if name in ('GL_ALREADY_SIGNALED', 'GL_CONDITION_SATISFIED'):
+            self.signalled.add(fence)
+        return getattr(self, name)
+
+
+class RingBufferTest(unittest.TestCase):
+
+    def use(self, *results):
+        self.backend = gl_backend.use(gl_backend.RecordingBackend(FenceBackend(results)))
+        return self.backend
+
+    def waits(self):
+        return [args for name, args in self.backend.calls if name == 'glClientWaitSync']
+
+    def testRetriesWithoutFlushingAfterTimeout(self):
+        self.use('GL_TIMEOUT_EXPIRED', 'GL_CONDITION_SATISFIED')
+        ring = RingBuffer(numpy.uint32, 4, numRegions=2)
+        for _ in xrange(2):
+            ring.beginFrame()
+            ring.endFrame()
+        fence = ring.fences[0]
+        self.assertEqual(self.waits(), [])
+
+        ring.beginFrame()
+        self.assertEqual(self.waits(), [
+            (fence, GL.GL_SYNC_FLUSH_COMMANDS_BIT, ring_buffer.FENCE_TIMEOUT),
+            (fence, 0, ring_buffer.FENCE_TIMEOUT),
+        ])
+        self.assertIn(('glDeleteSync', (fence,)), self.backend.calls)
+        self.assertIsNone(ring.fences[0])
+
+    def testFailedWaitRaises(self):
+        self.use('GL_WAIT_FAILED')
+        ring = RingBuffer(numpy.uint32, 4, numRegions=2)
+        for _ in xrange(2):
+            ring.beginFrame()
+            ring.endFrame()
+        self.assertRaises(FenceWaitFailedException, ring.beginFrame)
+
+    def testRegionsAreNotReusedBeforeTheirFencesSignal(self):
+        backend = self.use('GL_TIMEOUT_EXPIRED', 'GL_TIMEOUT_EXPIRED', 'GL_ALREADY_SIGNALED')
+        capacity = 4
+        ring = RingBuffer(numpy.uint32, capacity)
+        # The last fence put on each region
+        fences = {}
+        for frame in xrange(10):
+            ring.beginFrame()
+            start, records = ring.allocate(capacity)
+            region = start // capacity
+            if region in fences:
+                self.assertIn(fences[region], backend.signalled)
+            records[:] = frame
+            ring.flush()
+            ring.endFrame()
+            fences[region] = ring.fences[region]
+        self.assertEqual(len(fences), ring_buffer.NUM_REGIONS)
+
+
+if __name__ == '__main__':
+    unittest.main()
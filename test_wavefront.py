@@ -0,0 +1,86 @@
+'''
+Checks of the Wavefront OBJ parser:
+
+    python -m unittest test_wavefront
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+from wavefront import parseWavefront
+
+WAVEFRONT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'meshes', 'plisson.obj')
+
+
+def parseWavefrontLineByLine(filename, usingNormals=False):
+    '''
+    The original parser, one line at a time, returning the same arrays as
+    parseWavefront for triangle-only files.
+    '''
+    vertices, normals, indices, comboMap = [], [], [], {}
+    with open(filename, 'r') as f:
+        for line in f:
+            lineSplit = line.split()
+            if not lineSplit:
+                continue
+            lineType = lineSplit[0]
+            if lineType == 'vn' and usingNormals:
+                normals.append([float(v) for v in lineSplit[1:4]])
+            elif lineType == 'v':
+                vertices.append([float(v) for v in lineSplit[1:4]])
+            elif lineType == 'f':
+                assert len(lineSplit) == 4
+                face = [part.split('/') for part in lineSplit[1:]]
+                if usingNormals:
+                    for corner in face:
+                        indices.append(comboMap.setdefault((int(corner[0]) - 1, int(corner[2]) - 1), len(comboMap)))
+                else:
+                    indices.extend(int(corner[0]) - 1 for corner in face)
+
+    vertices = numpy.array(vertices, dtype=numpy.float32)
+    indices = numpy.array(indices, dtype=numpy.uint32)
+    if not usingNormals:
+        return vertices, None, indices
+
+    normals = numpy.array(normals, dtype=numpy.float32)
+    combos = sorted(comboMap, key=comboMap.get)
+    return (
+        vertices[[v for v, _ in combos]],
+        normals[[n for _, n in combos]],
+        indices
+    )
+
+
+class WavefrontTest(unittest.TestCase):
+
+    def testMatchesLineByLineParser(self):
+        for usingNormals in (False, True):
+            expected = parseWavefrontLineByLine(WAVEFRONT_FILE, usingNormals)
+            # Small chunks, so that the file is read in many of them
+            for chunkSizeHint in (4096, 4 * 1024 * 1024):
+                vertices, normals, indices = parseWavefront(WAVEFRONT_FILE, usingNormals, chunkSizeHint)
+                numpy.testing.assert_allclose(vertices, expected[0], rtol=1e-6)
+                if usingNormals:
+                    numpy.testing.assert_allclose(normals, expected[1], rtol=1e-6)
+                else:
+                    self.assertIsNone(normals)
+                numpy.testing.assert_array_equal(indices, expected[2])
+
+    def testPolygonsAreFanTriangulated(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'quad.obj')
+            with open(filename, 'w') as f:
+                f.write('v 0 0 0\nv 1 0 0\nv 1 1 0\nv 0 1 0\nv 2 2 0\nf 1 2 3 4\nf 2 5 3\n')
+            vertices, _, indices = parseWavefront(filename)
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(len(vertices), 5)
+        # Faces are grouped by their number of corners
+        self.assertEqual(sorted(map(tuple, indices.reshape((-1, 3)))), [(0, 1, 2), (0, 2, 3), (1, 4, 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
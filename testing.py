@@ -0,0 +1,72 @@
+'''
+Helpers shared by the test_* modules.
+'''
+
+import unittest
+import numpy
+import maths
+import culling
+import gl_backend
+from gl_state import STATE
+
+MATERIAL = dict(
+    ambient=maths.Vec3(0.0, 0.0, 0.0),
+    diffuse=maths.Vec3(1.5, 0.5, 0.5),
+    specular=maths.Vec4(0.0, 1.0, 1.0, 32.0),
+)
+
+
+def instanceRows(matrices, params, names):
+    '''
+    Returns one sorted row per instance of its matrix and param values
+    (NaN where unset), to compare sets of instances in any order.
+    '''
+    columns = [numpy.asarray(matrices, dtype=numpy.float64).reshape((len(matrices), -1))]
+    for name in names:
+        values, mask = params[name]
+        values = numpy.asarray(values, dtype=numpy.float64).copy()
+        values[~mask] = numpy.nan
+        columns.append(values)
+    rows = numpy.concatenate(columns, axis=1)
+    # NaNs sort last in every column alike
+    order = numpy.lexsort(numpy.nan_to_num(rows).T[::-1])
+    return rows[order]
+
+
+def byPosition(records):
+    '''
+    Sorts INSTANCE_DTYPE records by their translation, to compare sets of
+    instances drawn in any order.
+    '''
+    return records[numpy.lexsort(records['modelRows'][:, :, 3].T)]
+
+
+class RecordingTestCase(unittest.TestCase):
+    '''
+    Runs each test on a fresh RecordingBackend, as self.backend.
+    '''
+
+    def setUp(self):
+        self.backend = gl_backend.use(gl_backend.RecordingBackend(keepCalls=False))
+        STATE.invalidate()
+
+
+class CullingTestCase(unittest.TestCase):
+    '''
+    Has random boxes (self.centers, self.extents) and views of them, some
+    boxes inside, some outside and some crossing each view's frustum.
+    '''
+
+    def setUp(self):
+        random = numpy.random.RandomState(0)
+        self.centers = random.uniform(-50.0, 50.0, (5000, 3))
+        self.extents = random.uniform(0.1, 3.0, (5000, 3))
+        self.views = [
+            maths.lookAt(maths.Vec3(0.0, 0.0, 0.0), maths.Vec3(0.0, 0.0, -1.0), maths.Vec3(0.0, 1.0, 0.0)),
+            maths.lookAt(maths.Vec3(10.0, 5.0, 30.0), maths.normalise(maths.Vec3(-1.0, -0.2, -1.0)), maths.Vec3(0.0, 1.0, 0.0)),
+            maths.lookAt(maths.Vec3(-60.0, 0.0, 0.0), maths.Vec3(1.0, 0.0, 0.0), maths.Vec3(0.0, 1.0, 0.0)),
+        ]
+        self.projMatrix = maths.perspective(45.0, 1.6, 0.1, 60.0)
+
+    def planesFor(self, view):
+        return culling.frustumPlanes(numpy.dot(self.projMatrix, view))
@@ -0,0 +1,133 @@
+import numpy
+
+# Roughly how many bytes of text are read and converted at a time
+CHUNK_SIZE_HINT = 4 * 1024 * 1024
+
+
+class WavefrontParseError(Exception):
+    def __init__(self, filename, message):
+        super(WavefrontParseError, self).__init__('%s: %s' % (filename, message))
+
+
+def _parseVectors(filename, bodies, recordType):
+    '''
+    Converts the bodies of a run of 'v' or 'vn' records into an
+    (N,3) float32 array. Any extra components (e.g. 'w') are dropped.
+    '''
+    values = numpy.fromstring(' '.join(bodies), dtype=numpy.float32, sep=' ')
+    if values.size % len(bodies):
+        raise WavefrontParseError(filename, 'inconsistent "%s" record lengths' % recordType)
+    width = values.size // len(bodies)
+    if width < 3:
+        raise WavefrontParseError(filename, '"%s" records need at least 3 components' % recordType)
+    return values.reshape((len(bodies), width))[:, :3]
+
+
+def _parseFaces(filename, bodies, numCorners):
+    '''
+    Converts the bodies of 'f' records that all have numCorners corners
+    into an (F*(numCorners-2)*3, W) int32 array of triangle corners,
+    where W is the number of indices per corner (v, v/t or v/t/n). The
+    faces are fan-triangulated, so they must be convex.
+    '''
+    # 'v//n' has no texture index, so give it a zero to keep the columns aligned
+    text = ' '.join(bodies).replace('//', '/0/')
+    width = text.split(None, 1)[0].count('/') + 1
+    values = numpy.fromstring(text.replace('/', ' '), dtype=numpy.int32, sep=' ')
+    if values.size != len(bodies) * numCorners * width:
+        raise WavefrontParseError(filename, 'mixed face formats are not supported')
+    faces = values.reshape((len(bodies), numCorners, width))
+
+    fan = numpy.array([[0, i, i + 1] for i in range(1, numCorners - 1)], dtype=numpy.intp)
+    return faces[:, fan, :].reshape((-1, width))
+
+
+def _firstSeenUnique(keys):
+    '''
+    Like numpy.unique with return_index and return_inverse, but the unique
+    values are numbered in the order they first appear in keys.
+    '''
+    unique, first, inverse = numpy.unique(keys, return_index=True, return_inverse=True)
+    order = numpy.argsort(first, kind='mergesort')
+    rank = numpy.empty_like(order)
+    rank[order] = numpy.arange(len(order))
+    return unique[order], rank[inverse]
+
+
+def parseWavefront(filename, usingNormals=False, chunkSizeHint=CHUNK_SIZE_HINT):
+    '''
+    Reads the 'v', 'vn' and 'f' records of a Wavefront OBJ file in chunks
+    of about chunkSizeHint bytes, and returns (vertices, normals, indices)
+    where vertices and normals are (N,3) float32 arrays and indices is a
+    flat uint32 triangle list. Faces with more than three corners are
+    triangulated.
+
+    If usingNormals is set, each unique (vertex, normal) pair in the
+    faces becomes one output vertex, numbered in order of first use.
+    Otherwise normals is None and the vertices are returned as-is.
+    '''
+    positionChunks, normalChunks, cornerChunks = [], [], []
+
+    with open(filename, 'r') as f:
+        while True:
+            lines = f.readlines(chunkSizeHint)
+            if not lines:
+                break
+
+            positionBodies, normalBodies, faceBodies = [], [], {}
+            for line in lines:
+                if line.startswith('v '):
+                    positionBodies.append(line[2:])
+                elif line.startswith('vn ') and usingNormals:
+                    normalBodies.append(line[3:])
+                elif line.startswith('f '):
+                    body = line[2:]
+                    faceBodies.setdefault(len(body.split()), []).append(body)
+
+            if positionBodies:
+                positionChunks.append(_parseVectors(filename, positionBodies, 'v'))
+            if normalBodies:
+                normalChunks.append(_parseVectors(filename, normalBodies, 'vn'))
+            for numCorners, bodies in faceBodies.iteritems():
+                if numCorners < 3:
+                    raise WavefrontParseError(filename, 'face with %s corners' % numCorners)
+                cornerChunks.append(_parseFaces(filename, bodies, numCorners))
+
+    vertices = (
+        numpy.concatenate(positionChunks) if positionChunks
+        else numpy.zeros((0, 3), dtype=numpy.float32)
+    )
+
+    if not cornerChunks:
+        return vertices, (numpy.zeros((0, 3), dtype=numpy.float32) if usingNormals else None), numpy.zeros((0,), dtype=numpy.uint32)
+
+    if len(set(chunk.shape[1] for chunk in cornerChunks)) > 1:
+        raise WavefrontParseError(filename, 'mixed face formats are not supported')
+    corners = numpy.concatenate(cornerChunks)
+
+    # Indices in the file start at 1
+    vertexIndices = corners[:, 0] - 1
+    if len(vertexIndices) and (vertexIndices.min() < 0 or vertexIndices.max() >= len(vertices)):
+        raise WavefrontParseError(filename, 'vertex index out of range')
+
+    if not usingNormals:
+        return vertices, None, vertexIndices.astype(numpy.uint32)
+
+    if corners.shape[1] < 3:
+        raise WavefrontParseError(filename, 'faces have no normal indices')
+
+    normals = (
+        numpy.concatenate(normalChunks) if normalChunks
+        else numpy.zeros((0, 3), dtype=numpy.float32)
+    )
+    normalIndices = corners[:, 2] - 1
+    if normalIndices.min() < 0 or normalIndices.max() >= len(normals):
+        raise WavefrontParseError(filename, 'normal index out of range')
+
+    # Unique (vertex, normal) pairs, packed into one integer each
+    combos, indices = _firstSeenUnique(vertexIndices.astype(numpy.int64) * len(normals) + normalIndices)
+    return (
+        vertices[combos // len(normals)],
+        normals[combos % len(normals)],
+        indices.astype(numpy.uint32)
+    )